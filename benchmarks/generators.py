@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Synthetic, HEP-like data for the benchmarks. Only numpy and pandas are
+needed (no ROOT-files).
+
+- :py:func:`signal_background`: a B-mass peak (Crystal Ball
+  signal on an exponential background) plus correlated features, similar to
+  the toy in the *__main__* of :py:mod:`raredecay.analysis.statistics`.
+- :py:func:`mc_real`: Gaussian "MC" and shifted/widened "real" data with
+  sWeight-like weights, similar to the storages in the *__main__* of
+  :py:mod:`raredecay.analysis.physical_analysis`.
+"""
+from __future__ import division, absolute_import
+
+import math
+
+import numpy as np
+import pandas as pd
+
+MASS_RANGE = (4800., 6000.)
+
+
+def _features(random, n_events, n_features, correlation=0.3):
+    """Return normal distributed features, neighbours are correlated."""
+    cov = np.eye(n_features)
+    for i in range(n_features - 1):
+        cov[i, i + 1] = cov[i + 1, i] = correlation
+    return random.standard_normal((n_events, n_features)).dot(np.linalg.cholesky(cov).T)
+
+
+def _crystal_ball(random, n_events, mean=5280., sigma=37., alpha=1.5, n=3.,
+                  lower=MASS_RANGE[0]):
+    """Sample a Crystal Ball (Gaussian core with a power-law tail to the left).
+
+    The tail is truncated at *lower*.
+    """
+    # the tail (B - t)^-n for t < -alpha is a Pareto distribution in u = B - t
+    b_param = n / alpha - alpha
+    u_min, u_max = n / alpha, b_param - (lower - mean) / sigma
+    tail_cut = 1 - (u_min / u_max) ** (n - 1)
+    core = sigma * math.sqrt(math.pi / 2) * (1 + math.erf(alpha / math.sqrt(2)))
+    tail = sigma * n / alpha / (n - 1) * math.exp(-alpha ** 2 / 2) * tail_cut
+    n_tail = random.binomial(n_events, tail / (core + tail))
+
+    # core: Gaussian truncated at -alpha (acceptance >= 50%)
+    core_samples = []
+    n_core = n_events - n_tail
+    while n_core > 0:
+        samples = random.standard_normal(2 * n_core + 10)
+        samples = samples[samples > -alpha][:n_core]
+        core_samples.append(samples)
+        n_core -= len(samples)
+    u_tail = u_min * (1 - random.uniform(size=n_tail) * tail_cut) ** (-1 / (n - 1))
+    std_samples = np.concatenate(core_samples + [b_param - u_tail])
+    random.shuffle(std_samples)
+    return mean + sigma * std_samples
+
+
+def _exponential(random, n_events, scale=300., lower=MASS_RANGE[0], upper=MASS_RANGE[1]):
+    """Sample an exponential truncated to [lower, upper] (inverse cdf)."""
+    cdf_max = 1 - math.exp(-(upper - lower) / scale)
+    return lower - scale * np.log1p(-random.uniform(size=n_events) * cdf_max)
+
+
+def _prediction(random, features, separation=1.):
+    """Return a classifier-like prediction in [0, 1] from the features."""
+    score = features.mean(axis=1) * separation + random.normal(scale=0.5, size=len(features))
+    return 1 / (1 + np.exp(-score))
+
+
+def _columns(n_features):
+    return ['x' + str(i) for i in range(n_features)]
+
+
+def signal_background(n_events, n_features=10, signal_fraction=0.3, seed=None):
+    """Return signal (target 1) and background (target 0) events.
+
+    Parameters
+    ----------
+    n_events : int
+        The total number of events.
+    n_features : int >= 1
+        The number of (correlated, Gaussian) features *x0, x1,...*. The
+        signal is shifted by 0.5 in each of them.
+    signal_fraction : float in (0, 1)
+        The fraction of signal events.
+    seed : int or None
+        The seed of the random generator.
+
+    Return
+    ------
+    out : (pandas DataFrame, numpy array, numpy array)
+        The data (the features, the mass *B_M* and a prediction *pred*),
+        the targets and the weights.
+    """
+    random = np.random.RandomState(seed)
+    n_events = int(n_events)
+    n_sig = int(round(n_events * signal_fraction))
+
+    features = _features(random, n_events, n_features)
+    features[:n_sig] += 0.5
+    data = pd.DataFrame(features, columns=_columns(n_features))
+    data['B_M'] = np.concatenate((_crystal_ball(random, n_sig),
+                                  _exponential(random, n_events - n_sig)))
+    data['pred'] = _prediction(random, features)
+    targets = np.zeros(n_events, dtype=np.int8)
+    targets[:n_sig] = 1
+    return data, targets, np.ones(n_events)
+
+
+def mc_real(n_events, n_features=10, shift=0.2, scale=1.3, seed=None):
+    """Return a MC (target 0) and a real (target 1) sample to reweight.
+
+    The MC features are standard normal distributed, the real ones are
+    shifted by *shift* and scaled by *scale*. The real data has sWeight-like
+    weights.
+
+    Parameters
+    ----------
+    n_events : int
+        The number of events of each sample.
+    n_features : int >= 1
+        The number of features *x0, x1,...*.
+    shift : float
+        The shift of the real data.
+    scale : float
+        The width of the real data.
+    seed : int or None
+        The seed of the random generator.
+
+    Return
+    ------
+    out : ((pandas DataFrame, numpy array, numpy array), (...))
+        The data, targets and weights of the MC and the real sample, both
+        with a prediction *pred*.
+    """
+    random = np.random.RandomState(seed)
+    n_events = int(n_events)
+
+    samples = []
+    for target, loc, width in ((0, 0., 1.), (1, shift, scale)):
+        features = _features(random, n_events, n_features) * width + loc
+        data = pd.DataFrame(features, columns=_columns(n_features))
+        data['pred'] = _prediction(random, features)
+        weights = np.ones(n_events) if target == 0 else random.uniform(0.5, 1.5, size=n_events)
+        samples.append((data, np.full(n_events, target, dtype=np.int8), weights))
+    return tuple(samples)
+
+
+def to_storage(sample, data_name="data"):
+    """Return a :py:class:`~raredecay.tools.data_storage.HEPDataStorage` of a sample."""
+    from raredecay.tools.data_storage import HEPDataStorage
+
+    data, targets, weights = sample
+    return HEPDataStorage(data, target=targets, sample_weights=weights, data_name=data_name)
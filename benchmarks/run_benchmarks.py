@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the expensive parts of raredecay on synthetic data (see
+:py:mod:`generators`). No ROOT-files or network access are needed.
+
+Every benchmark creates its data first and then measures (wall time, cpu
+time and peak RSS increase, see :py:func:`raredecay.tools.dev_tool.profile_stage`)
+only the benchmarked call. The profiled stages inside the call are recorded as
+well. The results are written as JSON to compare them between releases.
+
+Example
+-------
+>>> python benchmarks/run_benchmarks.py --sizes 1e4 1e5 --output bench.json
+"""
+from __future__ import division, absolute_import
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from collections import OrderedDict
+
+import matplotlib
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import generators
+
+BENCHMARK_STAGE = "benchmark"
+
+# should not be imported by importing the analysis modules, see bench_startup
+HEAVY_MODULES = ['ROOT', 'root_numpy', 'rep.estimators', 'rep.metaml', 'hep_ml',
+                 'sklearn.ensemble', 'seaborn', 'matplotlib.pyplot']
+STARTUP_CODE = """
+import sys
+import raredecay.analysis.ml_analysis
+import raredecay.analysis.statistics
+import raredecay.tools.data_storage
+print ' '.join(sorted(sys.modules))
+"""
+
+
+def bench_startup(n_events, n_features, cfg):
+    """Import the analysis modules in a new interpreter (n_events is ignored)."""
+    from raredecay.tools import dev_tool
+
+    with dev_tool.profile_stage(BENCHMARK_STAGE):
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_CODE])
+    heavy = [module for module in HEAVY_MODULES if module in output.split()]
+    if heavy:
+        raise RuntimeError("Imported at startup: " + ", ".join(heavy))
+
+
+def bench_construction(n_events, n_features, cfg):
+    from raredecay.tools import dev_tool
+    from raredecay.tools.data_storage import HEPDataStorage
+
+    data, targets, weights = generators.signal_background(n_events, n_features, seed=cfg.seed)
+    with dev_tool.profile_stage(BENCHMARK_STAGE):
+        HEPDataStorage(data, target=targets, sample_weights=weights, data_name="signal+bkg")
+
+
+def bench_folds(n_events, n_features, cfg):
+    from raredecay.tools import dev_tool
+
+    storage = generators.to_storage(generators.signal_background(n_events, n_features,
+                                                                 seed=cfg.seed))
+    with dev_tool.profile_stage(BENCHMARK_STAGE):
+        storage.make_folds(cfg.n_folds, stratified=True)
+        for fold in range(cfg.n_folds):
+            storage.get_fold(fold)
+
+
+def bench_make_dataset(n_events, n_features, cfg):
+    from raredecay.tools import dev_tool
+
+    mc, real = _mc_real(n_events, n_features, cfg)
+    with dev_tool.profile_stage(BENCHMARK_STAGE):
+        mc.make_dataset(real, weights_ratio=1, shuffle=True)
+
+
+def bench_plot(n_events, n_features, cfg):
+    import matplotlib.pyplot as plt
+    from raredecay import meta_config
+    from raredecay.tools import dev_tool
+
+    mc, real = _mc_real(n_events, n_features, cfg)
+    no_plots, plot_verbosity = meta_config.NO_PLOTS, meta_config.plot_verbosity
+    meta_config.NO_PLOTS, meta_config.plot_verbosity = False, 5
+    try:
+        with dev_tool.profile_stage(BENCHMARK_STAGE):
+            mc.plot(figure="benchmark")
+            real.plot(figure="benchmark")
+    finally:
+        meta_config.NO_PLOTS, meta_config.plot_verbosity = no_plots, plot_verbosity
+        plt.close('all')
+
+
+def bench_classify(n_events, n_features, cfg):
+    from raredecay.tools import dev_tool
+    from raredecay.analysis import ml_analysis
+
+    mc, real = _mc_real(n_events, n_features, cfg)
+    features = generators._columns(n_features)
+    with dev_tool.profile_stage(BENCHMARK_STAGE):
+        ml_analysis.classify(mc, real, features=features, validation=cfg.n_folds, clf=cfg.clf,
+                             importance=0, plot_importance=0)
+
+
+def bench_reweight_Kfold(n_events, n_features, cfg):
+    from raredecay.tools import dev_tool
+    from raredecay.analysis import ml_analysis
+
+    mc, real = _mc_real(n_events, n_features, cfg)
+    features = generators._columns(n_features)
+    with dev_tool.profile_stage(BENCHMARK_STAGE):
+        ml_analysis.reweight_Kfold(mc, real, columns=features, n_folds=cfg.n_folds,
+                                   reweighter='gb', add_weights_to_data=False)
+
+
+def bench_train_similar(n_events, n_features, cfg):
+    from raredecay.tools import dev_tool, metrics
+
+    mc, real = _mc_real(n_events, n_features, cfg)
+    features = generators._columns(n_features)
+    with dev_tool.profile_stage(BENCHMARK_STAGE):
+        metrics.train_similar(mc, real, features=features, n_checks=1, n_folds=cfg.n_folds,
+                              clf=cfg.clf, test_max=False)
+
+
+def bench_best_metric_cut(n_events, n_features, cfg):
+    from raredecay.tools import dev_tool
+    from raredecay.analysis import ml_analysis
+
+    mc, real = _mc_real(n_events, n_features, cfg)
+    with dev_tool.profile_stage(BENCHMARK_STAGE):
+        ml_analysis.best_metric_cut(mc, real, prediction_branch='pred', plot_importance=0)
+
+
+def _mc_real(n_events, n_features, cfg):
+    mc, real = generators.mc_real(n_events, n_features, seed=cfg.seed)
+    return generators.to_storage(mc, "MC"), generators.to_storage(real, "real")
+
+
+# name -> (benchmark, maximum number of events run by default or None if the
+# benchmark does not depend on the number of events)
+BENCHMARKS = OrderedDict([
+    ('startup', (bench_startup, None)),
+    ('construction', (bench_construction, 10 ** 7)),
+    ('folds', (bench_folds, 10 ** 7)),
+    ('make_dataset', (bench_make_dataset, 10 ** 7)),
+    ('plot', (bench_plot, 10 ** 7)),
+    ('classify', (bench_classify, 10 ** 6)),
+    ('reweight_Kfold', (bench_reweight_Kfold, 10 ** 6)),
+    ('train_similar', (bench_train_similar, 10 ** 6)),
+    ('best_metric_cut', (bench_best_metric_cut, 10 ** 7)),
+])
+
+
+def run_benchmark(name, n_events, n_features, cfg):
+    """Run a benchmark and return its measurements as a dict."""
+    from raredecay.tools import dev_tool
+
+    result = OrderedDict([('benchmark', name), ('n_events', n_events),
+                          ('n_features', n_features)])
+    dev_tool.reset_profile()
+    try:
+        BENCHMARKS[name][0](n_events, n_features, cfg)
+    except Exception as error:
+        result['error'] = repr(error)
+        return result
+
+    profile = dev_tool.get_profile()
+    total = profile.loc[BENCHMARK_STAGE]
+    result['wall_time'] = float(total['total [s]'])
+    result['cpu_time'] = float(total['cpu [s]'])
+    result['peak_rss_increase_mb'] = float(total['peak RSS increase [MB]'])
+    result['stages'] = OrderedDict(
+        (stage, OrderedDict((column, float(value)) for column, value in row.iteritems()))
+        for stage, row in profile.drop(BENCHMARK_STAGE).iterrows())
+    return result
+
+
+def _environment():
+    import numpy as np
+    import pandas as pd
+    import raredecay
+    from raredecay import meta_config
+
+    return OrderedDict([('raredecay', raredecay.__version__), ('python', platform.python_version()),
+                        ('numpy', np.__version__), ('pandas', pd.__version__),
+                        ('platform', platform.platform()), ('n_cpu', meta_config.n_cpu_max),
+                        ('date', time.strftime("%Y-%m-%d %H:%M:%S"))])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of raredecay on synthetic data")
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS), help="the benchmarks to run (default: all)")
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e4, 1e5, 1e6, 1e7],
+                        help="the numbers of events")
+    parser.add_argument('--all-sizes', action='store_true',
+                        help="also run the slow benchmarks (classifiers) above 1e6 events")
+    parser.add_argument('--n-features', type=int, default=10)
+    parser.add_argument('--n-folds', type=int, default=3)
+    parser.add_argument('--clf', default='xgb', help="the classifier for classify etc.")
+    parser.add_argument('--n-cpu', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="the JSON-file to write the results to")
+    cfg = parser.parse_args(argv)
+
+    from raredecay import settings
+    settings.initialize(run_name="benchmarks", verbosity=0, plot_verbosity=0,
+                        no_interactive_plots=True, logger_console_level='error',
+                        n_cpu=cfg.n_cpu, no_plots=True)
+
+    results = OrderedDict([('environment', _environment()),
+                           ('config', OrderedDict(sorted(vars(cfg).items()))),
+                           ('results', [])])
+    for name in cfg.benchmarks:
+        max_events = BENCHMARKS[name][1]
+        sizes = [0] if max_events is None else sorted(int(size) for size in cfg.sizes)
+        for n_events in sizes:
+            if max_events is not None and n_events > max_events and not cfg.all_sizes:
+                continue
+            result = run_benchmark(name, n_events, cfg.n_features, cfg)
+            results['results'].append(result)
+            print "{:<16} {:>10} events: {}".format(
+                name, n_events, "{:.3f} s".format(result['wall_time'])
+                if 'error' not in result else result['error'])
+            # write after every benchmark, so a crash keeps the results so far
+            with open(cfg.output, 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -17,43 +17,23 @@ The functions serve as basic tools, which do already a lot of the work.
 from __future__ import division, absolute_import
 
 
+import sys
 import copy
 import timeit
+import functools
+import collections
+import multiprocessing
 from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-# hep_ml imports
-import hep_ml.reweight
-
-# scikit-learn imports
-from sklearn.base import BaseEstimator
-from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
-from sklearn.ensemble import AdaBoostClassifier  # , VotingClassifier
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.neighbors import KNeighborsClassifier
-
-from sklearn.metrics import accuracy_score, classification_report  # recall_score,
-
-# import Reproducible Experimental Platform
-from rep.data import LabeledDataStorage
-
-from rep.estimators import SklearnClassifier, XGBoostClassifier, TMVAClassifier
-#from rep.estimators.theanets import TheanetsClassifier
-from rep.estimators.interface import Classifier
-
-from rep.metaml.folding import FoldingClassifier
-from rep.metaml import GridOptimalSearchCV, FoldingScorer, RandomParameterOptimizer
-from rep.metaml import SubgridParameterOptimizer
-from rep.metaml.gridsearch import RegressionParameterOptimizer  # , AnnealingParameterOptimizer
-
-from rep.report import metrics
-from rep.report.classification import ClassificationReport
+# The classifier backends (scikit-learn, REP, hep_ml), the reports and
+# matplotlib are heavy to import: they are imported where they are used.
 
 # raredecay imports
 from raredecay.tools import dev_tool, data_tools, data_storage
+from raredecay.tools.cpu_budget import cpu_budget, split_cpus
 from raredecay.globals_ import out
 # from raredecay import globals_
 
@@ -71,31 +51,56 @@ def _make_data(original_data, target_data=None, features=None, target_from_data=
      Differs to only *make_dataset* from the HEPDataStorage by providing the
      possibility of using other weights.
     """
-    # make temporary weights if specific weights are given as parameters
-    temp_ori_weights = None
-    temp_tar_weights = None
-    if not dev_tool.is_in_primitive(weights_original, None):
-        temp_ori_weights = original_data.get_weights()
-        original_data.set_weights(weights_original)
-    if not dev_tool.is_in_primitive(weights_target, None):
-        temp_tar_weights = target_data.get_weights()
-        target_data.set_weights(weights_target)
-
-    # create the data, target and weights
+    # the specific weights are only used for the dataset, the storages are not changed
     data_out = original_data.make_dataset(target_data, columns=features,
                                           targets_from_data=target_from_data,
-                                          weights_ratio=weights_ratio)
-
-    # reassign weights if specific weights have been used
-    if not dev_tool.is_in_primitive(temp_ori_weights, None):
-        original_data.set_weights(temp_ori_weights)
-    if not dev_tool.is_in_primitive(temp_tar_weights, None):
-        original_data.set_weights(temp_tar_weights)
+                                          weights_ratio=weights_ratio,
+                                          sample_weights=weights_original,
+                                          sample_weights_2=weights_target)
 
     return data_out
 
 
-def make_clf(clf, n_cpu=None, dict_only=False):
+def _make_predictions(clf, lds_test, validation, features=None):
+    """Return the predictions of the clf on the validation data as a dict.
+
+    If the validation is a HEPDataStorage, the data is predicted chunk by
+    chunk (see :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.iter_chunks()`),
+    otherwise the LabeledDataStorage is used.
+    """
+    with dev_tool.profile_stage("classify: predict"):
+        return _predict(clf, lds_test, validation, features)
+
+
+def _predict(clf, lds_test, validation, features):
+    """See :py:func:`~raredecay.analysis.ml_analysis._make_predictions`."""
+    if not isinstance(validation, data_storage.HEPDataStorage):
+        return {'y_proba': clf.predict_proba(lds_test.get_data()),
+                'y_pred': clf.predict(lds_test.get_data()),
+                'y_true': lds_test.get_targets(),
+                'weights': lds_test.get_weights(allow_nones=True)}
+
+    y_proba, y_pred, y_true, weights = [], [], [], []
+    for data, targets, chunk_weights in validation.iter_chunks(columns=features):
+        y_proba.append(clf.predict_proba(data))
+        y_pred.append(clf.predict(data))
+        y_true.append(targets)
+        weights.append(chunk_weights)
+    return {'y_proba': np.concatenate(y_proba), 'y_pred': np.concatenate(y_pred),
+            'y_true': np.concatenate(y_true), 'weights': np.concatenate(weights)}
+
+
+def _is_instance(obj, module_name, class_name):
+    """Like isinstance, but without importing the (heavy) module of the class.
+
+    If the module was not imported yet, obj cannot be an instance of the class.
+    """
+    module = sys.modules.get(module_name)
+    return module is not None and isinstance(obj, getattr(module, class_name))
+
+
+@dev_tool.profiled("make_clf")
+def make_clf(clf, n_cpu=None, dict_only=False, n_tasks=None):
     """Return a classifier-dict. Takes a str, config-dict or clf-dict or clf.
 
     This function is used to bring classifiers into the "same" format. It
@@ -130,6 +135,8 @@ def make_clf(clf, n_cpu=None, dict_only=False):
         The number of cpus to use for this classifier. If the classifier is not
         parallelizable, an according *parallel_profile* (also see in REP-docs)
         will be created; 'threads-n' with n the number of cpus specified before.
+        If None, the cpus leased by the calling function (or the free ones)
+        of the :py:data:`~raredecay.tools.cpu_budget.cpu_budget` are used.
 
         .. warning::
             This overwrites the global n-cpu settings for this specific classifier
@@ -137,6 +144,12 @@ def make_clf(clf, n_cpu=None, dict_only=False):
         If True, only a dictionary will be returned containing the name, config,
         clf_type and parallel_profile, n_cpu, but no classifier instance will
         be created.
+    n_tasks : int or None
+        The number of tasks (e.g. folds or hyper-parameter points) the
+        classifier will be trained on in parallel with the *parallel_profile*.
+        If given, the cpus are split between the tasks and the threads of
+        the classifier (see :py:func:`~raredecay.tools.cpu_budget.split_cpus`),
+        otherwise a parallelizable classifier gets all of them.
 
 
     Returns
@@ -155,6 +168,13 @@ def make_clf(clf, n_cpu=None, dict_only=False):
           be 'threads-n' with n = n_cpus.
         - **n_cpus**: The number of cpus used in the classifier.
     """
+    from sklearn.base import BaseEstimator
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    from sklearn.ensemble import AdaBoostClassifier
+    from sklearn.neighbors import KNeighborsClassifier
+    from rep.estimators import SklearnClassifier
+    from rep.estimators.interface import Classifier
+
     #: Currently implemented classifiers:
     __IMPLEMENTED_CLFS = ['xgb', 'gb', 'rdf', 'nn', 'ada', 'tmva', 'knn']
     output = {}
@@ -179,6 +199,7 @@ def make_clf(clf, n_cpu=None, dict_only=False):
     suppress_cpu_warning = False
     if n_cpu is None:
         suppress_cpu_warning = True
+        n_cpu = cpu_budget.available()
     n_cpu = meta_config.get_n_cpu(n_cpu)
 
     # if input is dict containing a clf, make sure it's a Sklearn one
@@ -194,13 +215,13 @@ def make_clf(clf, n_cpu=None, dict_only=False):
         output['clf'] = classifier
 
         # Test which classifier it is and get parallel_profile
-        if isinstance(classifier, XGBoostClassifier):
+        if _is_instance(classifier, 'rep.estimators.xgboost', 'XGBoostClassifier'):
             n_cpu_clf = classifier.nthreads
             clf_type = 'xgb'
-        elif isinstance(classifier, TheanetsClassifier):
+        elif _is_instance(classifier, 'rep.estimators.theanets', 'TheanetsClassifier'):
             n_cpu_clf = 1
             clf_type = 'nn'
-        elif isinstance(classifier, TMVAClassifier):
+        elif _is_instance(classifier, 'rep.estimators.tmva', 'TMVAClassifier'):
             n_cpu_clf = 1
             clf_type = 'tmva'
         elif isinstance(classifier, SklearnClassifier):
@@ -223,13 +244,9 @@ def make_clf(clf, n_cpu=None, dict_only=False):
         if n_cpu_clf > n_cpu and not suppress_cpu_warning:
             logger.warning("n_cpu specified at make_clf() for clf < n_cpu of clf \
                             given! is that what you want?")
-        n_cpu = max(int(n_cpu / n_cpu_clf), 1)
-        if n_cpu > 1:
-            output['n_cpu'] = n_cpu_clf
-            output['parallel_profile'] = 'threads-' + str(n_cpu)
-        else:
-            output['n_cpu'] = n_cpu_clf
-            output['parallel_profile'] = None
+        n_workers, _t = split_cpus(n_cpu, n_tasks=n_tasks, n_threads=n_cpu_clf)
+        output['n_cpu'] = n_cpu_clf
+        output['parallel_profile'] = 'threads-' + str(n_workers) if n_workers > 1 else None
         clf_name = meta_config.DEFAULT_CLF_NAME.get(clf_type, "classifier")
         output['name'] = clf.get('name', clf_name)
 
@@ -253,21 +270,35 @@ def make_clf(clf, n_cpu=None, dict_only=False):
 
         clf = dict(default_clf, **clf)
 
+        # split the cpus between the parallel tasks and the classifier threads
+        n_cpu_total = n_cpu
+        if clf['clf_type'] in ('tmva', 'gb', 'ada') or (clf['clf_type'] == 'nn' and
+                                                        meta_config.use_gpu):
+            serial_clf = True
+            n_workers, n_cpu = split_cpus(n_cpu_total, n_tasks=n_tasks, n_threads=1)
+        elif clf['clf_type'] == 'nn':  # the threads of theanets cannot be limited
+            n_workers = 1
+        else:
+            n_workers, n_cpu = split_cpus(n_cpu_total, n_tasks=n_tasks)
+
         if clf['clf_type'] == 'xgb':
             # update config dict with parallel-variables and random state
+            from rep.estimators import XGBoostClassifier
+
             clf['config'].update(dict(nthreads=n_cpu, random_state=meta_config.randint()))
             clf_tmp = XGBoostClassifier(**clf.get('config'))
         elif clf['clf_type'] == 'tmva':
-            serial_clf = True
+            from rep.estimators import TMVAClassifier
+
             clf_tmp = TMVAClassifier(**clf.get('config'))
         elif clf['clf_type'] == 'gb':
-            serial_clf = True
             clf_tmp = SklearnClassifier(GradientBoostingClassifier(**clf.get('config')))
         elif clf['clf_type'] == 'rdf':
             clf['config'].update(dict(n_jobs=n_cpu, random_state=meta_config.randint()))
             clf_tmp = SklearnClassifier(RandomForestClassifier(**clf.get('config')))
         elif clf['clf_type'] == 'ada':
-            serial_clf = True
+            from sklearn.tree import DecisionTreeClassifier
+
             clf['config'].update(dict(random_state=meta_config.randint()))
             clf_tmp = SklearnClassifier(AdaBoostClassifier(base_estimator=DecisionTreeClassifier(
                 random_state=meta_config.randint()), **clf.get('config')))
@@ -278,7 +309,8 @@ def make_clf(clf, n_cpu=None, dict_only=False):
             clf['config'].update(dict(n_jobs=n_cpu, random_state=meta_config.randint()))
             clf_tmp = SklearnClassifier(RandomForestClassifier(**clf.get('config')))
         elif clf['clf_type'] == 'nn':
-            serial_clf = meta_config.use_gpu
+            from rep.estimators.theanets import TheanetsClassifier
+
             clf['config'].update(dict(random_state=meta_config.randint()))
             clf_tmp = TheanetsClassifier(**clf.get('config'))
 
@@ -291,20 +323,138 @@ def make_clf(clf, n_cpu=None, dict_only=False):
             output['clf_type'] = clf['clf_type']
             output['config'] = clf['config']
         # add parallel information
-        if serial_clf and n_cpu > 1:
-            output['n_cpu'] = 1
-            output['parallel_profile'] = 'threads-' + str(n_cpu)
-        else:
-            output['n_cpu'] = n_cpu
-            output['parallel_profile'] = None
+        output['n_cpu'] = n_cpu
+        output['parallel_profile'] = 'threads-' + str(n_workers) if n_workers > 1 else None
+        logger.info("make_clf: " + str(output['name']) + " gets " + str(n_cpu_total) +
+                    " cpus: " + str(n_workers) + " parallel task(s) with " + str(n_cpu) +
+                    " thread(s) each" + (" (serial classifier)" if serial_clf else ""))
 
     return output
 
 
+def _score_features(clf, data, label, weights, features):
+    """Fit the (copied) FoldingClassifier on the features and return the ROC AUC."""
+    from rep.report import metrics
+
+    clf.fit(data[features], label, weights)
+    report = clf.test_on(data[features], label, weights)
+    return report.compute_metric(metrics.RocAuc()).values()[0]
+
+
+def _auc_std(auc, label, weights):
+    """Return the standard error of ROC AUCs (Hanley & McNeil 1982).
+
+    The numbers of positive and negative events are the effective ones,
+    (sum w)^2 / sum w^2, of the (absolute) weights.
+    """
+    auc = np.asarray(auc, dtype=np.float64)
+    label = np.asarray(label)
+    weights = np.abs(np.asarray(weights, dtype=np.float64))
+    n_pos, n_neg = [weights[label == target].sum() ** 2 /
+                    max(np.dot(weights[label == target], weights[label == target]), 1e-300)
+                    for target in (1, 0)]
+    q_pos = auc / (2 - auc)
+    q_neg = 2 * auc ** 2 / (1 + auc)
+    variance = (auc * (1 - auc) + (n_pos - 1) * (q_pos - auc ** 2) +
+                (n_neg - 1) * (q_neg - auc ** 2)) / max(n_pos * n_neg, 1e-300)
+    return np.sqrt(np.maximum(variance, 0))
+
+
+def _screen_candidates(scores, label, weights, n_std=2.):
+    """Return the candidates of a screening stage which are worth a better evaluation.
+
+    A candidate (the feature to remove) is dropped if its ROC AUC is lower
+    than the best one by more than *n_std* standard errors of the
+    difference, see :py:func:`_auc_std`. At most half of the candidates
+    (the best ones, successive halving) are kept, the best one always.
+
+    Parameters
+    ----------
+    scores : list((str, float), (str, float),...)
+        The candidates and their ROC AUC on the screening sample.
+    label : 1-D array
+        The targets {0, 1} of the screening sample.
+    weights : 1-D array
+        The weights of the screening sample.
+    n_std : float >= 0
+        The confidence bound in standard errors.
+
+    Return
+    ------
+    out : list(str, str,...)
+        The candidates kept, in the same order.
+    """
+    aucs = np.array([auc for _f, auc in scores], dtype=np.float64)
+    std = _auc_std(aucs, label, weights)
+    best = np.argmax(aucs)
+    promising = aucs >= aucs[best] - n_std * np.sqrt(std ** 2 + std[best] ** 2)
+    n_keep = max(int(np.ceil(len(aucs) / 2)), 1)
+    best_half = np.argsort(-aucs, kind='mergesort')[:n_keep]
+    keep = set(best_half).intersection(np.flatnonzero(promising))
+    return [feature for i, (feature, _a) in enumerate(scores) if i in keep]
+
+
+def _weighted_correlation(data, weights, chunk_size=None):
+    """Return the weighted correlation matrix of the columns of a DataFrame.
+
+    Computed in two passes (means, then covariances) over blocks of at most
+    *chunk_size* rows (default :py:const:`~raredecay.meta_config.CHUNK_SIZE`),
+    so only a block is copied at a time. Constant columns have a correlation
+    of 0.
+    """
+    chunk_size = meta_config.CHUNK_SIZE if chunk_size is None else int(chunk_size)
+    values = np.asarray(data, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    weights = weights / weights.sum()
+    mean = weights.dot(values)
+    covariance = np.zeros((values.shape[1], values.shape[1]))
+    for start in range(0, len(values), chunk_size):
+        centered = values[start:start + chunk_size] - mean
+        covariance += np.dot(centered.T * weights[start:start + chunk_size], centered)
+    std = np.sqrt(np.maximum(np.diag(covariance), 0))
+    # constant columns only have a (tiny) variance from the rounding of the mean
+    std[std <= 1e-12 * np.maximum(np.abs(mean), 1)] = np.inf
+    correlation = covariance / np.outer(std, std)
+    return pd.DataFrame(correlation, index=data.columns, columns=data.columns)
+
+
+def _correlation_groups(correlation, min_correlation):
+    """Return the groups of highly correlated columns (complete linkage).
+
+    Every column of a group has an absolute correlation of at least
+    *min_correlation* to every other one.
+
+    Return
+    ------
+    out : list(list(str, str,...), ...)
+        The groups with more than one column, in the order of the columns.
+    """
+    from scipy.cluster.hierarchy import linkage, fcluster
+    from scipy.spatial.distance import squareform
+
+    columns = list(correlation.columns)
+    distance = 1 - np.abs(np.nan_to_num(correlation.values))
+    np.fill_diagonal(distance, 0)
+    distance = np.maximum((distance + distance.T) / 2, 0)
+    cluster_ids = fcluster(linkage(squareform(distance, checks=False), method='complete'),
+                           t=1 - min_correlation, criterion='distance')
+    groups = OrderedDict()
+    for column, cluster_id in zip(columns, cluster_ids):
+        groups.setdefault(cluster_id, []).append(column)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _unit_name(unit):
+    """Return the name of a feature or group of features (a tuple) to eliminate."""
+    return unit[0] if len(unit) == 1 else " + ".join(unit)
+
+
+@cpu_budget.leasing()
 def backward_feature_elimination(original_data, target_data=None, features=None,
                                  clf='xgb', n_folds=10, max_feature_elimination=None,
                                  max_difference_to_best=0.08, keep_features=None,
-                                 take_target_from_data=False):
+                                 take_target_from_data=False, screening=None,
+                                 group_correlation=None):
     """Train and score on each feature subset, eliminating features backwards.
 
     To know, which features make a big impact on the training of the clf and
@@ -316,6 +466,28 @@ def backward_feature_elimination(original_data, target_data=None, features=None,
     The feature where the auc drops the least is then removed and the next round
     starts from the beginning but with one feature less.
 
+    The candidates of a round are independent and therefore trained in
+    parallel threads: the leased cpus of the
+    :py:data:`~raredecay.tools.cpu_budget.cpu_budget` are split between the
+    candidates and the folds/threads of each classifier. The results are
+    used in the order of the features, as if trained one after the other.
+    With a time limit, the elimination stops if the candidates in flight
+    would not finish in time (estimated from the completed ones).
+
+    Optionally, the candidates are *screened* (successive halving) before
+    the full evaluation: they are trained on a (stratified) fraction
+    *screening* of the events only. Removals which are clearly harmful (the
+    roc auc is lower than the best one by more than two standard errors)
+    and the worse half are dropped, the others are trained on twice as many
+    events and so on. Only the remaining candidates get the full evaluation.
+
+    With many (correlated) features, they can be grouped first: the weighted
+    correlation matrix is computed once and features correlated by at least
+    *group_correlation* (e.g. the various *_IPCHI2* variants) are clustered.
+    The groups are eliminated as a whole (each one is a candidate) until
+    the difference to the best roc auc is too large, then the remaining
+    features are eliminated one by one.
+
     The function ends either if:
 
     - no features are left
@@ -357,6 +529,13 @@ def backward_feature_elimination(original_data, target_data=None, features=None,
         quite some time.
     take_target_from_data : boolean
         Old, will be removed. Use if target-data == None.
+    screening : float in (0, 1) or None
+        If given, the fraction of the events the candidates are screened on
+        first (see above). Useful with many features and events, e.g. 0.1.
+    group_correlation : float in (0, 1] or None
+        If given, the features are grouped by their absolute correlation
+        (every feature of a group is correlated by at least this to every
+        other one) and the groups are eliminated first (see above), e.g. 0.9.
 
     Returns
     -------
@@ -364,10 +543,15 @@ def backward_feature_elimination(original_data, target_data=None, features=None,
         Return a dictionary containing the evaluation:
 
         - **'roc_auc'** : an ordered-dict with the feature that was removed and
-          the roc auc evaluated without that feature.
+          the roc auc evaluated without that feature. A group of features
+          removed together is named "feature1 + feature2 + ...".
         - **'scores'** : All the roc auc with every feature removed once.
-          Basically a pandas DataFrame containing all results.
+          Basically a pandas DataFrame containing all results. Candidates
+          dropped by the screening have no score (None) in this round.
     """
+    from rep.metaml.folding import FoldingClassifier
+    from rep.report import metrics
+
     # initialize variables and setting defaults
     direction = 'backward'
     keep_features = [] if keep_features is None else data_tools.to_list(keep_features)
@@ -400,7 +584,9 @@ def backward_feature_elimination(original_data, target_data=None, features=None,
                                       target_from_data=take_target_from_data)
 
     # initialize clf and parallel_profile
-    clf_dict = make_clf(clf=clf, n_cpu=meta_config.n_cpu_max)
+    clf_config = clf
+    n_cpu = cpu_budget.available()
+    clf_dict = make_clf(clf=clf, n_cpu=n_cpu, n_tasks=n_folds)
     clf = clf_dict['clf']
     clf_name = clf_dict['name']
     parallel_profile = clf_dict['parallel_profile']
@@ -421,6 +607,23 @@ def backward_feature_elimination(original_data, target_data=None, features=None,
                                      stratified=meta_config.use_stratified_folding,
                                      parallel_profile=parallel_profile)
 
+    # split the cpus between the candidates of a round (threads, the classifiers release
+    # the GIL) and the classifiers. TMVA and theanets can not run in parallel threads.
+    n_workers, n_cpu_candidate = split_cpus(n_cpu, n_tasks=len(selected_features))
+    if (not meta_config.MULTITHREAD or
+            _is_instance(clf, 'rep.estimators.theanets', 'TheanetsClassifier') or
+            _is_instance(clf, 'rep.estimators.tmva', 'TMVAClassifier')):
+        n_workers = 1
+    if n_workers > 1:
+        candidate_dict = make_clf(clf=clf_config, n_cpu=n_cpu_candidate, n_tasks=n_folds)
+        candidate_clf = FoldingClassifier(candidate_dict['clf'], n_folds=n_folds,
+                                          stratified=meta_config.use_stratified_folding,
+                                          parallel_profile=candidate_dict['parallel_profile'])
+        logger.info("backward_feature_elimination: " + str(n_workers) +
+                    " candidates in parallel with " + str(n_cpu_candidate) + " cpus each")
+    else:
+        candidate_clf = original_clf
+
     # "loop-initialization", get score for all features
     roc_auc = OrderedDict({})
     collected_scores = {feature: [] for feature in selected_features}
@@ -430,19 +633,26 @@ def backward_feature_elimination(original_data, target_data=None, features=None,
         report = clf.test_on(data[features], label, weights)
         max_auc = report.compute_metric(metrics.RocAuc()).values()[0]
         roc_auc = OrderedDict({'all features': round(max_auc, 4)})
-        out.save_fig(figure="feature importance " + str(clf_name), importance=2, **save_fig_cfg)
-        # HACK: temp_plotter1 is used to set the plot.new_plot to False,
-        # which is set to True (unfortunately) in the init of GridPlot
-        temp_plotter1 = report.feature_importance_shuffling()
-        temp_plotter1.new_plot = False
-        temp_plotter1.plot(title="Feature importance shuffling of " + str(clf_name))
-        # HACK END
-        out.save_fig(figure="feature correlation " + str(clf_name), importance=2, **save_fig_cfg)
-        report.features_correlation_matrix().plot()
-        out.save_fig(figure="ROC curve " + str(clf_name), importance=2, **save_fig_cfg)
-        report.roc(physics_notion=True).plot()
-        out.save_fig(figure="Learning curve " + str(clf_name), importance=3, **save_fig_cfg)
-        report.learning_curve(metrics.RocAuc(), steps=2, metric_label="ROC AUC").plot()
+        # every report is only computed if its figure is needed
+        if out.plots_needed(importance=2):
+            out.save_fig(figure="feature importance " + str(clf_name), importance=2,
+                         **save_fig_cfg)
+            # HACK: temp_plotter1 is used to set the plot.new_plot to False,
+            # which is set to True (unfortunately) in the init of GridPlot
+            temp_plotter1 = report.feature_importance_shuffling()
+            temp_plotter1.new_plot = False
+            temp_plotter1.plot(title="Feature importance shuffling of " + str(clf_name))
+            # HACK END
+        if out.plots_needed(importance=2):
+            out.save_fig(figure="feature correlation " + str(clf_name), importance=2,
+                         **save_fig_cfg)
+            report.features_correlation_matrix().plot()
+        if out.plots_needed(importance=2):
+            out.save_fig(figure="ROC curve " + str(clf_name), importance=2, **save_fig_cfg)
+            report.roc(physics_notion=True).plot()
+        if out.plots_needed(importance=3):
+            out.save_fig(figure="Learning curve " + str(clf_name), importance=3, **save_fig_cfg)
+            report.learning_curve(metrics.RocAuc(), steps=2, metric_label="ROC AUC").plot()
 
         collected_scores['features_tot'] = []
 
@@ -451,44 +661,148 @@ def backward_feature_elimination(original_data, target_data=None, features=None,
     else:
         n_to_eliminate = min([len(selected_features) - 1, max_feature_elimination])
 
-    iterations = 0  # for the timing
-    # do-while python-style (with if-break inside)
-    while n_to_eliminate > 0:
-
-        # initialize variable
-        difference = 1  # a surely big initialisation
-        n_to_eliminate -= 1
-        n_features_left = len(selected_features)
-        collected_scores['features_tot'].append(n_features_left)
-
-        # iterate through the features and remove the ith each time
-        for i, feature in enumerate(selected_features):
-            iterations += 1
-            clf = copy.deepcopy(original_clf)  # otherwise feature attribute trouble
-            temp_features = copy.deepcopy(selected_features)
-            del temp_features[i]  # remove ith feature for testing
-            clf.fit(data[temp_features + keep_features], label, weights)
-            report = clf.test_on(data[temp_features + keep_features], label, weights)
-            temp_auc = report.compute_metric(metrics.RocAuc()).values()[0]
-            collected_scores[feature].append(round(temp_auc, 4))
-            # set time condition, extrapolate assuming same time for each iteration
-            eet_next = (timeit.default_timer() - start_time) * (iterations + 1) / iterations
-            if available_time < eet_next and start_time > 0:
-                n_to_eliminate = 0
+    # group the highly correlated features, the groups are eliminated first
+    groups = []
+    if group_correlation:
+        assert 0 < group_correlation <= 1, "group_correlation has to be in (0, 1]"
+        correlation = _weighted_correlation(data, weights)  # no copy of the data
+        correlation = correlation.loc[selected_features, selected_features]
+        groups = [tuple(group) for group in _correlation_groups(correlation, group_correlation)]
+        collected_scores.update({_unit_name(group): [] for group in groups})
+        out.add_output(["Groups of features with a correlation of at least",
+                        group_correlation, ", eliminated as a whole first:\n"] +
+                       [_unit_name(group) + "\n" for group in groups],
+                       subtitle="Correlated features")
+
+    # successive halving: the (nested) samples of the screening stages
+    screening_stages = []
+    if screening:
+        assert 0 < screening < 1, "screening has to be a fraction of the events in (0, 1)"
+        label_array = np.asarray(label)
+        random = np.random.RandomState(meta_config.randint())
+        class_rows = [random.permutation(np.flatnonzero(label_array == target))
+                      for target in np.unique(label_array)]
+        fraction = screening
+        while fraction < 1:
+            rows = np.sort(np.concatenate([
+                target_rows[:max(int(np.ceil(fraction * len(target_rows))), n_folds)]
+                for target_rows in class_rows]))
+            screening_stages.append((fraction, rows))
+            fraction *= 2
+
+    timing = {'iterations': 0., 'out_of_time': False}  # completed work, in full trainings
+
+    def score_candidates(candidates, rows=None, fraction=1.):
+        """Return the roc auc of every candidate (tuple of features removed) in order."""
+        if rows is None:
+            stage_data = (data, label, weights)
+        else:
+            stage_data = (data.iloc[rows], np.asarray(label)[rows], np.asarray(weights)[rows])
+        candidates = iter(candidates)
+        pending = collections.deque()  # at most n_workers in flight
+        scores = []
+        while True:
+            while not timing['out_of_time'] and len(pending) < n_workers:
+                try:
+                    unit = next(candidates)
+                except StopIteration:
+                    break
+                clf = copy.deepcopy(candidate_clf)  # otherwise feature attribute trouble
+                clf.random_state = meta_config.randint()  # not the global one (threads)
+                temp_features = [feat for feat in selected_features if feat not in unit]
+                args = (clf,) + stage_data + (temp_features + keep_features,)
+                if pool is None:
+                    score = functools.partial(_score_features, *args)
+                else:
+                    score = pool.apply_async(_score_features, args).get
+                pending.append((unit, score))
+            if not pending:
                 break
-            if max_auc - temp_auc < difference:
-                difference = max_auc - temp_auc
-                temp_dict = {feature: round(temp_auc, 4)}
 
-        if difference >= max_difference_to_best:
-            break
-        else:
-            roc_auc.update(temp_dict)
-            selected_features.remove(temp_dict.keys()[0])
-            max_auc = temp_dict.values()[0]
-            # set time condition
-            if available_time < timeit.default_timer() - start_time and start_time > 0:
+            unit, score = pending.popleft()
+            scores.append((unit, score()))
+            # set time condition, extrapolate assuming the same time for each completed
+            # candidate (per event): stop if the next n_workers would not finish in time
+            timing['iterations'] += fraction
+            eet_next = ((timeit.default_timer() - start_time) *
+                        (timing['iterations'] + n_workers * fraction) / timing['iterations'])
+            if available_time < eet_next and start_time > 0:
+                timing['out_of_time'] = True  # the candidates in flight are still used
+        return scores
+
+    pool = None
+    if n_workers > 1:
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(n_workers)
+    stopped_by_difference = False
+    try:
+        # do-while python-style (with if-break inside)
+        while n_to_eliminate > 0:
+
+            # initialize variable
+            difference = 1  # a surely big initialisation
+            n_features_left = len(selected_features)
+            collected_scores['features_tot'].append(n_features_left)
+
+            # the candidates: the groups which can be removed as a whole, else the features
+            groups = [group for group in groups if set(group).issubset(selected_features) and
+                      len(group) <= min(n_to_eliminate, n_features_left - 1)]
+            units = groups if groups else [(feature,) for feature in selected_features]
+
+            # screen the candidates on growing samples, then evaluate the remaining ones
+            candidates = list(units)
+            for fraction, rows in screening_stages:
+                if len(candidates) <= 1 or timing['out_of_time']:
+                    break
+                stage_scores = score_candidates(candidates, rows=rows, fraction=fraction)
+                candidates = _screen_candidates(stage_scores, np.asarray(label)[rows],
+                                                np.asarray(weights)[rows])
+                logger.info("Screening on " + str(len(rows)) + " events: kept " +
+                            str(len(candidates)) + " of " + str(len(stage_scores)) +
+                            " candidates")
+            round_scores = OrderedDict()
+            if not timing['out_of_time']:
+                round_scores.update(score_candidates(candidates))
+            if timing['out_of_time']:
                 n_to_eliminate = 0
+            # the features not in a group (yet) have no score in a round of the groups
+            for unit in units + ([(feature,) for feature in selected_features] if groups else []):
+                temp_auc = round_scores.get(unit)
+                collected_scores[_unit_name(unit)].append(None if temp_auc is None else
+                                                          round(temp_auc, 4))
+            for unit, temp_auc in round_scores.iteritems():
+                if max_auc - temp_auc < difference:
+                    difference = max_auc - temp_auc
+                    temp_dict = {_unit_name(unit): round(temp_auc, 4)}
+                    temp_unit = unit
+
+            if not round_scores:  # out of time while screening
+                break
+            elif difference >= max_difference_to_best and groups:
+                groups = []  # continue with the single features
+                continue
+            elif difference >= max_difference_to_best:
+                stopped_by_difference = True
+                break
+            else:
+                roc_auc.update(temp_dict)
+                for feature in temp_unit:
+                    selected_features.remove(feature)
+                n_to_eliminate -= len(temp_unit)
+                max_auc = temp_dict.values()[0]
+                # set time condition
+                if available_time < timeit.default_timer() - start_time and start_time > 0:
+                    n_to_eliminate = 0
+        if pool is not None:
+            pool.close()
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
 
     output['roc_auc'] = roc_auc
 
@@ -505,7 +819,7 @@ def backward_feature_elimination(original_data, target_data=None, features=None,
                    importance=3)
     output['scores'] = collected_scores
 
-    if len(selected_features) > 1 and difference >= max_difference_to_best:
+    if len(selected_features) > 1 and stopped_by_difference:
         out.add_output(["Removed features and roc auc: ", roc_auc,
                         "\nStopped because difference in roc auc to best was ",
                         "higher then max_difference_to_best",
@@ -588,10 +902,15 @@ def optimize_hyper_parameters(original_data, target_data=None, clf=None, feature
     take_target_from_data : Boolean
         |take_target_from_data_docstring|
     """
+    from rep.metaml import GridOptimalSearchCV, FoldingScorer, RandomParameterOptimizer
+    from rep.metaml import SubgridParameterOptimizer
+    from rep.metaml.gridsearch import RegressionParameterOptimizer
+    from rep.report import metrics
+
     # initialize variables and setting defaults
 #    output = {}
 #    save_fig_cfg = dict(meta_config.DEFAULT_SAVE_FIG, **cfg.save_fig_cfg)
-    clf_dict = make_clf(clf, n_cpu=meta_config.n_cpu_max, dict_only=True)
+    clf_dict = make_clf(clf, n_cpu=cpu_budget.available(), dict_only=True)
     config_clf = clf_dict['config']
     config_clf_cp = copy.deepcopy(config_clf)
 
@@ -669,19 +988,6 @@ def optimize_hyper_parameters(original_data, target_data=None, clf=None, feature
     data, label, weights = _make_data(original_data, target_data, features=features,
                                       target_from_data=take_target_from_data)
 
-    # initialize classifier
-    clf_dict['config'] = config_clf
-    clf_dict = make_clf(clf=clf_dict, n_cpu=meta_config.n_cpu_max)
-    clf = clf_dict['clf']
-    clf_name = clf_dict['name']
-    parallel_profile = clf_dict['parallel_profile']
-
-    # rederict print output (for the hyperparameter-optimizer from rep)
-    if not kwargs.get('time_test', False):
-        out.add_output("Starting hyper-optimization. This might take a while, no " +
-                       "output will be displayed during the process", importance=3)
-    out.IO_to_string()
-
     if generator_type == 'regression':
         generator = RegressionParameterOptimizer(grid_param, n_evaluations=n_eval)
     elif generator_type == 'subgrid':
@@ -691,12 +997,29 @@ def optimize_hyper_parameters(original_data, target_data=None, clf=None, feature
     else:
         raise ValueError(str(generator) + " not a valid, implemented generator")
     scorer = FoldingScorer(metrics.RocAuc(), folds=n_folds, fold_checks=n_checks)
-    grid_finder = GridOptimalSearchCV(clf, generator, scorer, parallel_profile=parallel_profile)
 
-    # Search for hyperparameters
-    logger.info("starting " + clf_name + " hyper optimization")
-    grid_finder.fit(data, label, weights)
-    logger.info(clf_name + " hyper optimization finished")
+    # lease the cpus only now, the time-test above is a (nested) run itself
+    with cpu_budget.lease(name="optimize_hyper_parameters") as n_cpu:
+        # initialize classifier, the parameter points are evaluated in parallel
+        clf_dict['config'] = config_clf
+        clf_dict = make_clf(clf=clf_dict, n_cpu=n_cpu, n_tasks=n_eval)
+        clf = clf_dict['clf']
+        clf_name = clf_dict['name']
+        parallel_profile = clf_dict['parallel_profile']
+
+        # rederict print output (for the hyperparameter-optimizer from rep)
+        if not kwargs.get('time_test', False):
+            out.add_output("Starting hyper-optimization. This might take a while, no " +
+                           "output will be displayed during the process", importance=3)
+        out.IO_to_string()
+
+        grid_finder = GridOptimalSearchCV(clf, generator, scorer,
+                                          parallel_profile=parallel_profile)
+
+        # Search for hyperparameters
+        logger.info("starting " + clf_name + " hyper optimization")
+        grid_finder.fit(data, label, weights)
+        logger.info(clf_name + " hyper optimization finished")
     grid_finder.params_generator.print_results()
 
     if not kwargs.get('time_test', False):
@@ -706,6 +1029,7 @@ def optimize_hyper_parameters(original_data, target_data=None, clf=None, feature
         out.IO_to_sys(importance=0)
 
 
+@cpu_budget.leasing()
 def classify(original_data=None, target_data=None, features=None, validation=10,
              clf='xgb', extended_report=False, get_predictions=False,
              plot_title=None, curve_name=None, weights_ratio=0,
@@ -800,6 +1124,13 @@ def classify(original_data=None, target_data=None, features=None, validation=10,
         - 'y_true' : the true labels of the data (if available)
         - 'weights' : the weights of the corresponding predicitons
     """
+    import matplotlib.pyplot as plt
+    from sklearn.metrics import accuracy_score, classification_report
+    from rep.data import LabeledDataStorage
+    from rep.metaml.folding import FoldingClassifier
+    from rep.report import metrics
+    from rep.report.classification import ClassificationReport
+
     logger.info("Starting classify with " + str(clf))
     VALID_KWARGS = ['original_test_weights', 'target_test_weights']
 
@@ -821,7 +1152,8 @@ def classify(original_data=None, target_data=None, features=None, validation=10,
         if target_data is not None:
             data_name += " and " + target_data.name
 
-    clf_dict = make_clf(clf, n_cpu=-1)
+    n_folds = int(validation) if isinstance(validation, (float, int, long)) else None
+    clf_dict = make_clf(clf, n_cpu=cpu_budget.available(), n_tasks=n_folds)
     clf = clf_dict['clf']
     clf_name = clf_dict.pop('name')
     parallel_profile = clf_dict.get('parallel_profile')
@@ -863,12 +1195,14 @@ def classify(original_data=None, target_data=None, features=None, validation=10,
 
     # train the classifier
     if original_data is not None:
-        clf.fit(data, label, weights)
+        with dev_tool.profile_stage("classify: fit"):
+            clf.fit(data, label, weights)
         # if error "1 not in list" or similar occurs: no valid targets (None?)
 
     # test the classifier
     if validation not in (None, False):
-        report = ClassificationReport({clf_name: clf}, lds_test)
+        with dev_tool.profile_stage("classify: predict"):
+            report = ClassificationReport({clf_name: clf}, lds_test)
         test_classes = list(set(lds_test.get_targets()))
         n_classes = len(test_classes)
         if n_classes == 2:
@@ -879,14 +1213,7 @@ def classify(original_data=None, target_data=None, features=None, validation=10,
             plot_name = clf_name + ", AUC = " + str(clf_score)
             binary_test = True
             if get_predictions:
-                # TODO: DRY, now WET
-                y_true = lds_test.get_targets()
-                y_pred = clf.predict(lds_test.get_data())
-                y_pred_proba = clf.predict_proba(lds_test.get_data())
-                predictions['y_proba'] = y_pred_proba
-                predictions['y_pred'] = y_pred
-                predictions['y_true'] = y_true
-                predictions['weights'] = lds_test.get_weights(allow_nones=True)
+                predictions = _make_predictions(clf, lds_test, validation, features)
                 predictions['report'] = report
 
         elif n_classes == 1:
@@ -895,11 +1222,7 @@ def classify(original_data=None, target_data=None, features=None, validation=10,
             y_pred = clf.predict(lds_test.get_data())
 
             if get_predictions:
-                y_pred_proba = clf.predict_proba(lds_test.get_data())
-                predictions['y_proba'] = y_pred_proba
-                predictions['y_pred'] = y_pred
-                predictions['y_true'] = y_true
-                predictions['weights'] = lds_test.get_weights(allow_nones=True)
+                predictions = _make_predictions(clf, lds_test, validation, features)
                 predictions['report'] = report
             w_test = lds_test.get_weights()
             clf_score = clf.score(lds_test.get_data(), y_true, w_test)
@@ -918,6 +1241,7 @@ def classify(original_data=None, target_data=None, features=None, validation=10,
             raise ValueError("Multi-label classification not supported")
 
     # plots
+    make_plot = make_plot and out.plots_needed(importance=plot_importance)
 
     if make_plot:  # if no validation is given, don't make plots
         if curve_name is not None:
@@ -970,6 +1294,31 @@ def classify(original_data=None, target_data=None, features=None, validation=10,
         return clf, clf_score
 
 
+def _reweight_columns(mc_data, real_data, columns=None):
+    """Return the columns to reweight: the given ones or else the common ones (ordered)."""
+    if columns is None:
+        # use the intesection of both colomns, in the order of the mc columns
+        real_columns = set(real_data.columns)
+        columns = [col for col in mc_data.columns if col in real_columns]
+        if columns != list(mc_data.columns) or columns != list(real_data.columns):
+            logger.warning("No columns specified for reweighting, took intersection" +
+                           " of both dataset, as it's columns are not equal." +
+                           "\nTherefore some columns were not used!")
+            meta_config.warning_occured()
+    return columns
+
+
+def _add_reweighter_output(reweighter, meta_cfg, mc_data, real_data, columns):
+    """Log and add to the output the training of a reweighter."""
+    msg = ["Reweighter:", reweighter, "with config:", meta_cfg]
+    logger.info(msg)
+
+    out.add_output(msg + ["\nData used:\n", mc_data.name, " and ",
+                          real_data.name, "\ncolumns used for the reweighter training:\n",
+                          columns], section="Training the reweighter", obj_separator=" ")
+
+
+@dev_tool.profiled("reweight_train")
 def reweight_train(mc_data, real_data, columns=None,
                    reweighter='gb', reweight_saveas=None, meta_cfg=None,
                    weights_mc=None, weights_real=None):
@@ -1024,6 +1373,8 @@ def reweight_train(mc_data, real_data, columns=None,
         Reweighter is trained to the data. Can, for example,
         be used with :func:`~hep_ml.reweight.GBReweighter.predict_weights`
     """
+    import hep_ml.reweight
+
     __REWEIGHT_MODE = {'gb': 'GB', 'bins': 'Bins', 'bin': 'Bins'}
 
     # check for valid user input
@@ -1037,23 +1388,8 @@ def reweight_train(mc_data, real_data, columns=None,
     reweighter += 'Reweighter'
 
     # logging and writing output
-    msg = ["Reweighter:", reweighter, "with config:", meta_cfg]
-    logger.info(msg)
-
-    out.add_output(msg + ["\nData used:\n", mc_data.name, " and ",
-                          real_data.name, "\ncolumns used for the reweighter training:\n",
-                          columns], section="Training the reweighter", obj_separator=" ")
-
-    if columns is None:
-        # use the intesection of both colomns
-        common_cols = set(mc_data.columns)
-        common_cols.intersection_update(real_data.columns)
-        columns = list(common_cols)
-        if columns != mc_data.columns or columns != real_data.columns:
-            logger.warning("No columns specified for reweighting, took intersection" +
-                           " of both dataset, as it's columns are not equal." +
-                           "\nTherefore some columns were not used!")
-            meta_config.warning_occured()
+    _add_reweighter_output(reweighter, meta_cfg, mc_data, real_data, columns)
+    columns = _reweight_columns(mc_data, real_data, columns)
 
     # create data
     mc_data, _t, mc_weights = _make_data(mc_data, features=columns,
@@ -1075,6 +1411,7 @@ def reweight_train(mc_data, real_data, columns=None,
     return data_tools.adv_return(reweighter, save_name=reweight_saveas)
 
 
+@dev_tool.profiled("reweight_weights")
 def reweight_weights(reweight_data, reweighter_trained, columns=None,
                      normalize=True, add_weights_to_data=True):
     """Apply reweighter to the data and (add +) return the weights.
@@ -1112,9 +1449,10 @@ def reweight_weights(reweight_data, reweighter_trained, columns=None,
     reweighter_trained = data_tools.try_unpickle(reweighter_trained)
     if columns is None:
         columns = reweighter_trained.columns
-#    new_weights = reweighter_trained.predict_weights(reweight_data.pandasDF(),
-    new_weights = reweighter_trained.predict_weights(reweight_data.pandasDF(columns=columns),
-                                                     original_weight=reweight_data.get_weights())
+    # predict chunk by chunk, the whole data does not have to fit into memory
+    new_weights = [reweighter_trained.predict_weights(data, original_weight=weights)
+                   for data, _t, weights in reweight_data.iter_chunks(columns=columns)]
+    new_weights = np.concatenate(new_weights) if new_weights else np.array([])
 
     # write to output
     out.add_output(["Using the reweighter:\n", reweighter_trained, "\n to reweight ",
@@ -1128,6 +1466,89 @@ def reweight_weights(reweight_data, reweighter_trained, columns=None,
     return new_weights
 
 
+# the data-storages attached in a worker process of reweight_Kfold, by path
+_reweight_storages = {}
+
+
+def _attach_storage(shared):
+    """Return the data-storage of published data, created once per worker process."""
+    if shared.path not in _reweight_storages:
+        _reweight_storages[shared.path] = shared.to_storage()
+    return _reweight_storages[shared.path]
+
+
+def _reweight_fold(task):
+    """Train a reweighter on the train rows of a fold and predict the test rows.
+
+    Runs in a worker process of
+    :py:func:`~raredecay.analysis.ml_analysis.reweight_Kfold`: the data is
+    attached from shared memory (see :py:mod:`~raredecay.tools.shared_data`),
+    only the rows of the fold are sent.
+    Does the same as :py:func:`~raredecay.analysis.ml_analysis.reweight_train`
+    and :py:func:`~raredecay.analysis.ml_analysis.reweight_weights` but
+    without any output.
+
+    Return
+    ------
+    out : 1-D numpy array
+        The (not normalized) new weights of the test rows.
+    """
+    import hep_ml.reweight
+
+    (seed, reweighter, meta_cfg, columns, (mc_shared, real_shared),
+     (train_mc_rows, train_real_rows, test_mc_rows)) = task
+    mc_data, real_data = _attach_storage(mc_shared), _attach_storage(real_shared)
+    np.random.seed(seed)  # the reweighters (trees) use the global random state
+
+    train_mc = data_storage.HEPDataStorageView(mc_data, rows=train_mc_rows)
+    train_real = data_storage.HEPDataStorageView(real_data, rows=train_real_rows)
+    mc, _t, mc_weights = _make_data(train_mc, features=columns)
+    real, _t, real_weights = _make_data(train_real, features=columns)
+    reweighter = getattr(hep_ml.reweight, reweighter)(**({} if meta_cfg is None else meta_cfg))
+    reweighter.fit(original=mc, target=real, original_weight=mc_weights,
+                   target_weight=real_weights)
+    del mc, real, mc_weights, real_weights
+
+    test_mc = data_storage.HEPDataStorageView(mc_data, rows=test_mc_rows)
+    new_weights = [reweighter.predict_weights(data, original_weight=weights)
+                   for data, _t2, weights in test_mc.iter_chunks(columns=columns)]
+    return np.concatenate(new_weights) if new_weights else np.array([])
+
+
+def _reweight_folds_parallel(folds, mc_data, real_data, n_workers, reweighter, meta_cfg,
+                             columns):
+    """Yield the folds of reweight_Kfold with the new weights, trained in a process pool.
+
+    The columns of the storages are published once to shared memory, the
+    workers attach them without a copy.
+    The results are yielded in the order of *folds*. Every task gets its own
+    seed (drawn in order), so the weights are reproducible with
+    :py:func:`~raredecay.meta_config.set_seed`. At most two tasks per worker
+    are submitted ahead.
+    """
+    with mc_data.publish(columns=columns) as mc_shared, \
+            real_data.publish(columns=columns) as real_shared:
+        pool = multiprocessing.Pool(n_workers)
+        pending = collections.deque()
+        try:
+            for fold_data in folds:
+                task = (meta_config.randint(), reweighter, meta_cfg, columns,
+                        (mc_shared, real_shared), fold_data[-1])
+                pending.append((fold_data, pool.apply_async(_reweight_fold, (task,))))
+                if len(pending) >= 2 * n_workers:
+                    fold_data, result = pending.popleft()
+                    yield fold_data, result.get()
+            while pending:
+                fold_data, result = pending.popleft()
+                yield fold_data, result.get()
+            pool.close()
+        except BaseException:  # also if the generator is not exhausted (GeneratorExit)
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+
 def reweight_Kfold(mc_data, real_data, columns=None, n_folds=10,
                    reweighter='gb', meta_cfg=None, n_reweights=1,
                    score_columns=None, score_clf='xgb',
@@ -1159,6 +1580,15 @@ def reweight_Kfold(mc_data, real_data, columns=None, n_folds=10,
     - do this n_folds times
     - getting unbiased weights
 
+    The reweighters of the folds (and of the *n_reweights* runs) are
+    independent and therefore trained in parallel in worker processes (as
+    many as cpus are leased from the
+    :py:data:`~raredecay.tools.cpu_budget.cpu_budget`), which share the data
+    (see :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.publish`).
+    Every fold gets its own seed, so the weights are reproducible with
+    :py:func:`~raredecay.meta_config.set_seed`. The plots and the scoring are
+    done in this process.
+
     The parameters are more or less the same as for the
     :py:func:`~raredecay.analysis.ml_analysis.reweight_train` and
     :py:func:`~raredecay.analysis.ml_analysis.reweight_weights`
@@ -1232,6 +1662,8 @@ def reweight_Kfold(mc_data, real_data, columns=None, n_folds=10,
         Return the new weights.
 
     """
+    import matplotlib.pyplot as plt
+
     output = {}
     out.add_output(["Doing reweighting_Kfold with ", n_folds, " folds"],
                    title="Reweighting Kfold", obj_separator="")
@@ -1251,51 +1683,86 @@ def reweight_Kfold(mc_data, real_data, columns=None, n_folds=10,
     if not add_weights_to_data:
         old_mc_tot_weights = mc_data.get_weights()
 
-    for run in range(n_reweights):
-        new_weights_all = []
-        new_weights_index = []
-
-        # split data to folds and loop over them
-        mc_data.make_folds(n_folds=n_folds)
-        real_data.make_folds(n_folds=n_folds)
-        logger.info("Data created, starting folding of run " + str(run) +
-                    " of total " + str(n_reweights))
-
-        for fold in range(n_folds):
+    def iter_folds():
+        for run in range(n_reweights):
+            # split data to folds and loop over them
+            mc_data.make_folds(n_folds=n_folds)
+            real_data.make_folds(n_folds=n_folds)
+            logger.info("Data created, starting folding of run " + str(run) +
+                        " of total " + str(n_reweights))
+            mc_fold_ids, real_fold_ids = mc_data.get_fold_ids(), real_data.get_fold_ids()
+
+            for fold in range(n_folds):
+                # create train/test data
+                if n_folds > 1:
+                    train_real, test_real = real_data.get_fold(fold)
+                    train_mc, test_mc = mc_data.get_fold(fold)
+                else:
+                    train_real = test_real = real_data.get_fold(fold)
+                    train_mc = test_mc = mc_data
+                # the rows, to create the same folds in a worker process
+                rows = (np.flatnonzero(mc_fold_ids != fold), np.flatnonzero(real_fold_ids != fold),
+                        np.flatnonzero(mc_fold_ids == fold))
+                yield run, fold, train_real, test_real, train_mc, test_mc, rows
+
+    # train the reweighters of the folds (and runs) in parallel in worker processes
+    reweighter_name = {'gb': 'GB', 'bins': 'Bins', 'bin': 'Bins'}.get(reweighter)
+    n_tasks = n_folds * n_reweights
+    with cpu_budget.lease(name="reweight_Kfold") as n_cpu:
+        n_workers = min(n_cpu, n_tasks) if meta_config.MULTIPROCESSING else 1
+        if reweighter_name is not None and n_workers > 1:
+            columns = _reweight_columns(mc_data, real_data, columns)
+            reweighter_name += 'Reweighter'
+            folds = _reweight_folds_parallel(iter_folds(), mc_data, real_data,
+                                             n_workers=n_workers, reweighter=reweighter_name,
+                                             meta_cfg=meta_cfg, columns=columns)
+        else:
+            n_workers = 1
+            folds = ((fold_data, None) for fold_data in iter_folds())
+        # the scoring (in this process) only gets the cpus not used by the workers
+        n_cpu_score = n_cpu if n_workers == 1 else max(n_cpu - n_workers, 1)
 
-            # create train/test data
-            if n_folds > 1:
-                train_real, test_real = real_data.get_fold(fold)
-                train_mc, test_mc = mc_data.get_fold(fold)
-            else:
-                train_real = test_real = real_data.get_fold(fold)
-                train_mc = test_mc = mc_data
+        for fold_data, new_weights in folds:
+            run, fold, train_real, test_real, train_mc, test_mc, _rows = fold_data
+            if fold == 0:
+                new_weights_all = []
+                new_weights_index = []
 
             if mcreweighted_as_real_score:
                 old_mc_weights = test_mc.get_weights()
 
             # plot the first fold as example (the first one surely exists)
             plot_importance1 = 3 if fold == 0 else 1
-            if n_folds > 1 and plot_importance1 > 1 and run == 0:
+            if (n_folds > 1 and plot_importance1 > 1 and run == 0 and
+                    out.plots_needed(importance=plot_importance1)):
                 train_real.plot(figure="Reweighter trainer, example, fold " + str(fold),
                                 importance=plot_importance1)
                 train_mc.plot(figure="Reweighter trainer, example, fold " + str(fold),
                               importance=plot_importance1)
 
-            # train reweighter on training data
-            reweighter_trained = reweight_train(mc_data=train_mc,
-                                                real_data=train_real,
-                                                columns=columns, reweighter=reweighter,
-                                                meta_cfg=meta_cfg)
-            logger.info("reweighting fold " + str(fold) + "finished of run" + str(run))
-
-            new_weights = reweight_weights(reweight_data=test_mc, columns=columns,
-                                           reweighter_trained=reweighter_trained,
-                                           add_weights_to_data=True)  # fold only, not full data
+            if new_weights is None:
+                # train reweighter on training data
+                reweighter_trained = reweight_train(mc_data=train_mc,
+                                                    real_data=train_real,
+                                                    columns=columns, reweighter=reweighter,
+                                                    meta_cfg=meta_cfg)
+                logger.info("reweighting fold " + str(fold) + "finished of run" + str(run))
+
+                new_weights = reweight_weights(reweight_data=test_mc, columns=columns,
+                                               reweighter_trained=reweighter_trained,
+                                               add_weights_to_data=True)  # fold only
+            else:
+                # trained in a worker process, normalize and add like reweight_weights
+                _add_reweighter_output(reweighter_name, meta_cfg, train_mc, train_real, columns)
+                new_weights *= new_weights.size / new_weights.sum()
+                new_weights = pd.Series(new_weights, index=test_mc.index)
+                test_mc.set_weights(new_weights)  # fold only, not full data
+                logger.info("reweighting fold " + str(fold) + "finished of run" + str(run))
             # plot one for example of the new weights
             logger.debug("Maximum of weights " + str(max(new_weights)) +
                          " of fold " + str(fold) + " of run " + str(run))
-            if (n_folds > 1 and plot_importance1 > 1) or max(new_weights) > 50:
+            plot_weights = (n_folds > 1 and plot_importance1 > 1) or max(new_weights) > 50
+            if plot_weights and out.plots_needed(importance=plot_importance1):
                 out.save_fig("new weights of fold " + str(fold), importance=plot_importance1)
                 plt.hist(new_weights, bins=40, log=True)
 
@@ -1304,54 +1771,57 @@ def reweight_Kfold(mc_data, real_data, columns=None, n_folds=10,
                 test_mc.set_targets(1)
                 train_mc.set_targets(0)
                 train_real.set_targets(1)
-                # train clf on real and mc and see where it classifies the reweighted mc
-                clf, tmp_score = classify(train_mc, train_real, validation=test_mc,
-                                          curve_name="mc reweighted as real",
-                                          features=score_columns,
-                                          plot_title="fold {} reweighted validation".format(fold),
-                                          weights_ratio=1, clf=score_clf,
-                                          importance=1, plot_importance=1)
-                scores[fold] += tmp_score
-
-    # Get the max and min for "calibration" of the possible score for the reweighted data by
-    # passing in mc and label it as real (worst/min score) and real labeled as real (best/max)
-                test_mc.set_weights(old_mc_weights)
-                _t, tmp_score_min = classify(clf=clf, validation=test_mc,
-                                             features=score_columns,
-                                             curve_name="mc as real",
-                                             # weights_ratio=1,
-                                             importance=1, plot_importance=1)
-                score_min[fold] += tmp_score_min
-                test_real.set_targets(1)
-                _t, tmp_score_max = classify(clf=clf, validation=test_real,
-                                             features=score_columns,
-                                             curve_name="real as real",
-                                             # weights_ratio=1,
-                                             importance=1, plot_importance=1)
-                score_max[fold] += tmp_score_max
-                del _t
+                with cpu_budget.lease(n_cpu=n_cpu_score, name="reweight_Kfold score"):
+                    # train clf on real and mc and see where it classifies the reweighted mc
+                    plot_title = "fold {} reweighted validation".format(fold)
+                    clf, tmp_score = classify(train_mc, train_real, validation=test_mc,
+                                              curve_name="mc reweighted as real",
+                                              features=score_columns, plot_title=plot_title,
+                                              weights_ratio=1, clf=score_clf,
+                                              importance=1, plot_importance=1)
+                    scores[fold] += tmp_score
+
+        # Get the max and min for "calibration" of the possible score for the reweighted data by
+        # passing in mc and label it as real (worst/min score) and real labeled as real (best/max)
+                    test_mc.set_weights(old_mc_weights)
+                    _t, tmp_score_min = classify(clf=clf, validation=test_mc,
+                                                 features=score_columns,
+                                                 curve_name="mc as real",
+                                                 # weights_ratio=1,
+                                                 importance=1, plot_importance=1)
+                    score_min[fold] += tmp_score_min
+                    test_real.set_targets(1)
+                    _t, tmp_score_max = classify(clf=clf, validation=test_real,
+                                                 features=score_columns,
+                                                 curve_name="real as real",
+                                                 # weights_ratio=1,
+                                                 importance=1, plot_importance=1)
+                    score_max[fold] += tmp_score_max
+                    del _t
 
             # collect all the new weights to get a really cross-validated reweighted dataset
             new_weights_all.append(new_weights)
             new_weights_index.append(test_mc.get_index())
 
             logger.info("fold " + str(fold) + "finished")
-            # end of for-loop
+            if fold < n_folds - 1:
+                continue
 
-        # concatenate weights and index
-        if n_folds == 1:
-            new_weights_all = np.array(new_weights_all)
-            new_weights_index = np.array(new_weights_index)
-        else:
-            new_weights_all = np.concatenate(new_weights_all)
-            new_weights_index = np.concatenate(new_weights_index)
-        new_weights_tot += pd.Series(new_weights_all, index=new_weights_index)
-        logger.debug("Maximum of accumulated weights: " + str(max(new_weights_tot)))
+            # all folds of the run are done: concatenate weights and index
+            if n_folds == 1:
+                new_weights_all = np.array(new_weights_all)
+                new_weights_index = np.array(new_weights_index)
+            else:
+                new_weights_all = np.concatenate(new_weights_all)
+                new_weights_index = np.concatenate(new_weights_index)
+            new_weights_tot += pd.Series(new_weights_all, index=new_weights_index)
+            logger.debug("Maximum of accumulated weights: " + str(max(new_weights_tot)))
 
-        out.save_fig(figure="New weights of run " + str(run), importance=3)
-        hack_array = np.array(new_weights_all)
-        plt.hist(hack_array, bins=30, log=True)
-        plt.title("New weights of reweighting at end of run " + str(run))
+            if out.plots_needed(importance=3):
+                out.save_fig(figure="New weights of run " + str(run), importance=3)
+                hack_array = np.array(new_weights_all)
+                plt.hist(hack_array, bins=30, log=True)
+                plt.title("New weights of reweighting at end of run " + str(run))
 
     # after for loop for weights creation
     new_weights_tot /= n_reweights
@@ -1361,9 +1831,10 @@ def reweight_Kfold(mc_data, real_data, columns=None, n_folds=10,
     else:
         mc_data.set_weights(old_mc_tot_weights)
 
-    out.save_fig(figure="New weights of total mc", importance=4)
-    plt.hist(new_weights_tot, bins=30, log=True)
-    plt.title("New weights of reweighting with Kfold")
+    if out.plots_needed(importance=4):
+        out.save_fig(figure="New weights of total mc", importance=4)
+        plt.hist(new_weights_tot, bins=30, log=True)
+        plt.title("New weights of reweighting with Kfold")
 
     # create score
     if mcreweighted_as_real_score:
@@ -1435,9 +1906,12 @@ def best_metric_cut(mc_data, real_data, prediction_branch, metric='precision',
     best_cut, best_metric = metric_optimal.compute(y_true=target,
                                                    proba=data,
                                                    sample_weight=weights)
-    out.figure(str(metric_name) + " vs cut", importance=plot_importance)
-    title = "{0} vs cut of {1} and {2}".format(str(metric_name), real_data.name, mc_data.name)
-    metric_optimal.plot_vs_cut(y_true=target, proba=data, sample_weight=weights).plot(title=title)
+    if out.plots_needed(importance=plot_importance):
+        out.figure(str(metric_name) + " vs cut", importance=plot_importance)
+        title = "{0} vs cut of {1} and {2}".format(str(metric_name), real_data.name,
+                                                   mc_data.name)
+        metric_optimal.plot_vs_cut(y_true=target, proba=data,
+                                   sample_weight=weights).plot(title=title)
 
     best_metric = np.nan_to_num(best_metric)
     best_index = np.argmax(best_metric)
@@ -13,9 +13,6 @@ from __future__ import division, absolute_import
 
 import copy
 
-import seaborn as sns
-import matplotlib.pyplot as plt
-
 
 def test():
     """just a test-function."""
@@ -435,17 +432,14 @@ def final_training(real_data, mc_data, bkg_sel, clf='xgb', n_folds=10, columns=N
                              mc_data.data['selection'] + " applied")
 
     bkg_sel = [bkg_sel] if not isinstance(bkg_sel, list) else bkg_sel
+    bkg_cut = bkg_sel[0] + " == 1"
 
     pred_real = []
     pred_mc = []
 
     predict = not performance_only
     if performance_only:
-        bkg_df = real_data.pandasDF()
-        bkg_df = bkg_df.ix[np.array(bkg_df[bkg_sel].T)[0] == 1]
-        bkg_data = real_data.copy_storage()
-        bkg_data.set_data(bkg_df)
-        del bkg_df
+        bkg_data = real_data.select(bkg_cut)
         _clf, kfold_score, pred_tmp = classify(bkg_data, mc_data, validation=n_folds, clf=clf,
                                                get_predictions=True, extended_report=True,
                                                features=columns, weights_ratio=1)
@@ -462,10 +456,11 @@ def final_training(real_data, mc_data, bkg_sel, clf='xgb', n_folds=10, columns=N
             raise ValueError("Invalid metric: " + str(metric_vs_cut))
 
         if metric_vs_cut:
-            out.figure(title)
-            report.metrics_vs_cut(metric).plot()
-            plt.title(title)
-            plt.legend()
+            if out.plots_needed():
+                out.figure(title)
+                report.metrics_vs_cut(metric).plot()
+                plt.title(title)
+                plt.legend()
             from rep.report.metrics import OptimalMetric
             metric_optimal = OptimalMetric(metric)
             best_cut, best_metric = metric_optimal.compute(y_true=pred_tmp['y_true'],
@@ -486,10 +481,7 @@ def final_training(real_data, mc_data, bkg_sel, clf='xgb', n_folds=10, columns=N
             mc_train, mc_test = mc_data.get_fold(i)
             real_train.data_name_addition = "train"
             real_test.data_name_addition = "test"
-            bkg_df = real_train.pandasDF()
-
-            bkg_df = bkg_df.ix[np.array(bkg_df[bkg_sel].T)[0] == 1]
-            real_train.set_data(bkg_df)
+            real_train = real_train.select(bkg_cut)
             real_train.data_name_addition = "train bkg"
 
             real_test_index = real_test.index
@@ -537,17 +529,18 @@ def final_training(real_data, mc_data, bkg_sel, clf='xgb', n_folds=10, columns=N
             add_branch_to_rootfile(filename=root_dict['filenames'],
                                    treename=root_dict.get('treename'),
                                    new_branch=pred_mc, branch_name=save_mc_pred)
-        out.figure("predictions total")
-        plt.legend()
-        plt.title("Predictions of MC vs all real data")
-        plt.hist(pred_real, bins=30)
-        plt.hist(pred_mc, bins=30)
-
-        out.figure("predictions total normalized")
-        plt.legend()
-        plt.title("Predictions of MC vs all real data normalized")
-        plt.hist(pred_real, bins=30, normed=True, alpha=0.5, range=(0, 1))
-        plt.hist(pred_mc, bins=30, normed=True, alpha=0.5, range=(0, 1))
+        if out.plots_needed():
+            out.figure("predictions total")
+            plt.legend()
+            plt.title("Predictions of MC vs all real data")
+            plt.hist(pred_real, bins=30)
+            plt.hist(pred_mc, bins=30)
+
+            out.figure("predictions total normalized")
+            plt.legend()
+            plt.title("Predictions of MC vs all real data normalized")
+            plt.hist(pred_real, bins=30, normed=True, alpha=0.5, range=(0, 1))
+            plt.hist(pred_mc, bins=30, normed=True, alpha=0.5, range=(0, 1))
 
     return output
 
@@ -806,6 +799,8 @@ def reweightCV(real_data, mc_data, columns=None, n_folds=10,
         - *train_similar* : The scores of this method in a dict
         - *roc_auc_score* : The scores of this method in a dict
     """
+    import matplotlib.pyplot as plt
+
     import numpy as np
 
     import raredecay.analysis.ml_analysis as ml_ana
@@ -877,12 +872,13 @@ def reweightCV(real_data, mc_data, columns=None, n_folds=10,
         predictions = output['y_proba'][:, 1][output['y_true'] == 0]
         weights_pred = np.log(output['weights'][output['y_true'] == 0])
         weights_pred = output['weights'][output['y_true'] == 0]
-        out.figure("Correlation of weights and predictions")
-        plt.scatter(predictions, weights_pred)
-        plt.xlabel("predictions")
-        plt.ylabel("weights")
-        out.figure("Correlation of weights and predictions hexbin")
-        plt.hexbin(x=predictions, y=weights_pred, gridsize=150)
+        if out.plots_needed():
+            out.figure("Correlation of weights and predictions")
+            plt.scatter(predictions, weights_pred)
+            plt.xlabel("predictions")
+            plt.ylabel("weights")
+            out.figure("Correlation of weights and predictions hexbin")
+            plt.hexbin(x=predictions, y=weights_pred, gridsize=150)
 #        sns.jointplot(x=predictions, y=weights_pred, kind="hex")
 
 
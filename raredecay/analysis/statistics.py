@@ -10,25 +10,12 @@ from __future__ import division, absolute_import
 
 import numpy as np
 
-
-import ROOT
-from ROOT import RooRealVar, RooArgList, RooArgSet, RooAddPdf, RooDataSet, RooAbsReal
-from ROOT import RooFit, RooCBShape, RooExponential
-from ROOT import RooGaussian, RooMinuit
-from ROOT import TCanvas  # HACK to prevent not plotting canvas by root_numpy import. BUG.
-from root_numpy import array2tree
-from ROOT import RooCategory, RooUnblindPrecision
+# ROOT and RooFit are slow to import, therefore only imported when fitting
 
 from raredecay.globals_ import out
 
 from raredecay import meta_config
 
-import matplotlib.pyplot as plt
-# Bug fixing below
-#plt.figure("TMPONLYTOFIGHTASTRANGEBUG")
-#plt.plot([1, 2, 3])
-#plt.close("TMPONLYTOFIGHTASTRANGEBUG")
-# Bug fix end
 
 def fit_mass(data, column, x, sig_pdf=None, bkg_pdf=None, n_sig=None, n_bkg=None,
              blind=False, nll_profile=False, second_storage=None, log_plot=False,
@@ -77,6 +64,13 @@ def fit_mass(data, column, x, sig_pdf=None, bkg_pdf=None, n_sig=None, n_bkg=None
         number. If no number of background events is required, -999 will be
         returned.
     """
+    import ROOT
+    from ROOT import RooRealVar, RooArgList, RooArgSet, RooAddPdf, RooDataSet, RooAbsReal
+    from ROOT import RooFit
+    from ROOT import TCanvas  # HACK to prevent not plotting canvas by root_numpy import. BUG.
+    from root_numpy import array2tree
+    from ROOT import RooCategory, RooUnblindPrecision
+
 
     if not (isinstance(column, str) or len(column) == 1):
         raise ValueError("Fitting to several columns " + str(column) + " not supported.")
@@ -492,6 +486,7 @@ if __name__ == '__main__':
     from raredecay.tools.data_storage import HEPDataStorage
     import pandas as pd
     import matplotlib.pyplot as plt
+    from ROOT import RooRealVar, RooAddPdf, RooCBShape, RooExponential
 
 #    np.random.seed(40)
 
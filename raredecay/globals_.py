@@ -44,14 +44,13 @@ randint : int
 methods
 -------
 free_cpus
-    Return the number of available cores. Currently not sophisticated, but
-    can be extended if wanted
+    Return the number of cores which are not leased from the
+    :py:data:`~raredecay.tools.cpu_budget.cpu_budget`.
 """
 
 from __future__ import division, absolute_import
 
 from raredecay.tools import output
-from raredecay import meta_config
 from raredecay.run_config import config
 
 # ==============================================================================
@@ -75,13 +74,11 @@ logger_cfg = cfg.logger_cfg  # only if not save_output
 # parallel profile
 # ==============================================================================
 
-n_cpu_used = 0
-
-
 def free_cpus():
     """Return the number of free cpus, 1 if no or one are free"""
-    n_out = max([meta_config.n_cpu_max - n_cpu_used, 1])
-    return n_out
+    from raredecay.tools.cpu_budget import cpu_budget  # imports globals_ for the logger
+
+    return cpu_budget.free
 
 
 if __name__ == '__main__':
@@ -57,6 +57,12 @@ use_gpu = False  # If True, optimisation for GPU use is done (e.g. nn not parall
 # This does NOT use the GPU yet, but "not use the cpu" where the GPU will be invoked
 use_stratified_folding = True  # StratifiedKFolding is better, from a statistical point of view,
 # but also needs more memory, mostly insignificantly but can be large
+FIGURE_WORKERS = None  # processes rendering the figures to file at the end. If None, n_cpu_max
+# If True, the figures are saved to file (in the background) and closed already when a new
+# figure is requested instead of at the end of the run. Keeps the memory usage low in long runs.
+# Only a new figure triggers this, not the return of a function (figures like the ones of
+# HEPDataStorage.plot are added to by several calls); call out.flush_figures() for that.
+EAGER_FIGURES = False  # default: False
 
 
 def get_n_cpu(n_cpu=None):
@@ -99,6 +105,25 @@ def set_parallel_profile(n_cpu=-1, gpu_in_use=False, stratified_kfolding=True):
 # The ending of a certain variable type. Change with caution and good reason.
 PICKLE_DATATYPE = "pickle"  # default: 'pickle'
 ROOT_DATATYPE = "root"  # default 'root'
+PLOT_SPEC_DATATYPE = "npz"  # default 'npz', the content of the figures (see tools.plot_spec)
+
+# ------------------------------------------------------------------------------
+#  Caching of ROOT-data
+# ------------------------------------------------------------------------------
+
+# Branches read from ROOT-files are kept in memory (shared by all data-storages)
+# up to this size. The least recently used branches are removed first.
+ROOT_CACHE_MAX_BYTES = 2 * 1024 ** 3  # default: 2 GB. 0 disables the cache
+# If a directory is given, the branches are also stored there as .npy files and
+# memory-mapped in later runs instead of reading the ROOT-file again.
+ROOT_CACHE_DIR = None  # default: None (no disk cache)
+# The number of rows read at once when iterating over data in chunks
+# (HEPDataStorage.iter_chunks), e.g. for predictions and plots of large samples.
+CHUNK_SIZE = 1000000  # default: 1000000
+# The directory where data shared with worker processes is written to (and
+# memory-mapped by them, see tools.shared_data). If None, /dev/shm (shared
+# memory) is used if available, otherwise the temp directory.
+SHARED_DATA_DIR = None  # default: None
 
 # ------------------------------------------------------------------------------
 # SHARED OBJECT PATHES INPUT & OUTPUT
@@ -135,6 +160,9 @@ NO_PROMPT_ASSUME_YES = True  # no userinput required, assumes yes (e.g. when ove
 MAX_ERROR_COUNT = 1000  # set a maximum number of possible errors (not able to save figure etc.)
 # Criticals will end the run anyway.
 MAX_FIGURES = 1000  # max number of figures to be plotted
+# Record the time and memory used by the expensive stages of a run (reading data, fitting,
+# predicting, saving figures...). The table is written to the results folder at the end.
+PROFILE_STAGES = True  # default: True
 
 
 # ==============================================================================
@@ -168,7 +196,9 @@ DEFAULT_HIST_SETTINGS = dict(
 DEFAULT_SAVE_FIG = dict(
     file_format=['png', 'pdf'],  # default: ['png', 'svg'], the file formats
     dpi=150,                     # to be saved to. For implementations, see OutputHandler()
-    to_pickle=True,  # whether to pickle the plot (and therefore be able to replot)
+    to_pickle=False,  # default: False (was True), whether to pickle the plot (slow and large,
+                      # use to_spec to replot). Also used by save_fig if to_pickle is None
+    to_spec=True,  # whether to save the content of the plot (and therefore be able to replot)
     # save_cfg=None
 )
 
@@ -176,7 +206,8 @@ DEFAULT_SAVE_FIG = dict(
 # about but may be happy to have them saved somewhere)
 DEFAULT_EXT_SAVE_FIG = dict(
     file_format=['png', 'pdf'],
-    to_pickle=True
+    to_pickle=False,
+    to_spec=True
     # save_cfg=None
 )
 
@@ -321,6 +352,9 @@ loggers = {}
 
 verbosity = 4
 plot_verbosity = 3
+# If True, no figures are drawn (nor saved) and the curves only needed for plots are not
+# computed. Without saving the output, this is also the case for plots the plot_verbosity hides.
+NO_PLOTS = False
 
 
 def set_verbosity(new_verbosity):
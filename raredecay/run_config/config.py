@@ -26,7 +26,8 @@ OUTPUT_CFG = dict(
 
 save_fig_cfg = dict(
     file_format=['png', 'pdf'],
-    to_pickle=True,
+    to_pickle=False,
+    to_spec=True,
     dpi=150,
     figsize=(2,10)
 )
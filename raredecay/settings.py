@@ -20,7 +20,7 @@ def initialize(output_path=None, run_name="Test run", overwrite_existing=False,
                run_message="This is a test-run to test the package", verbosity=3,
                plot_verbosity=3, prompt_for_input=False, no_interactive_plots=False,
                logger_console_level='warning', logger_file_level='debug',
-               n_cpu=1, gpu_in_use=False):
+               n_cpu=1, gpu_in_use=False, no_plots=False):
     """Place before Imports! Initialize/change several parameters for the package.
 
     Initialize a run and return an output handler. Most of the implemented
@@ -67,6 +67,9 @@ def initialize(output_path=None, run_name="Test run", overwrite_existing=False,
     gpu_in_use : boolean
         If True, the parallelisation for Theanets is switched of in order to be
         able to use it with (a single) gpu.
+    no_plots : boolean
+        If True, no figures are drawn or saved at all and the computations
+        only needed for plots (report curves etc.) are skipped.
 
     Return
     ------
@@ -78,7 +81,7 @@ def initialize(output_path=None, run_name="Test run", overwrite_existing=False,
         import matplotlib as mpl
         mpl.use("pdf")
 
-    set_verbosity(verbosity=verbosity, plot_verbosity=plot_verbosity)
+    set_verbosity(verbosity=verbosity, plot_verbosity=plot_verbosity, no_plots=no_plots)
     _init_user_input(prompt_for_input=prompt_for_input)
     parallel_profile(n_cpu=n_cpu, gpu_in_use=gpu_in_use)
     logger_file_level = None if output_path is None else logger_file_level
@@ -110,12 +113,18 @@ def finalize(show_plots=True, play_sound_at_end=False):
     return output
 
 
-def set_verbosity(verbosity=3, plot_verbosity=3):
-    """Change the verbosity of the package."""
+def set_verbosity(verbosity=3, plot_verbosity=3, no_plots=None):
+    """Change the verbosity of the package.
+
+    If *no_plots* is True, no figures are drawn or saved (headless mode),
+    if None, it won't change anything.
+    """
     if verbosity is not None:
         meta_config.set_verbosity(verbosity)
     if plot_verbosity is not None:
         meta_config.set_plot_verbosity(plot_verbosity)
+    if no_plots is not None:
+        meta_config.NO_PLOTS = bool(no_plots)
 
 
 def get_output_handler():
@@ -161,13 +170,14 @@ def parallel_profile(n_cpu=-1, gpu_in_use=False):
     meta_config.set_parallel_profile(n_cpu=n_cpu, gpu_in_use=gpu_in_use)
 
 
-def figure_save_config(file_formats=None, to_pickle=True, dpi=150):
+def figure_save_config(file_formats=None, to_pickle=False, dpi=150, to_spec=True):
     """Change the save-options of figures.
 
     If you initialized an output-path, the figures that are plotted during
     the run will be f. On one hand, they are saved as pictures in the
-    given formats, on the other hand the figures (matplotlib) will be saved
-    as a pickle-object (also in the output-folder)
+    given formats, on the other hand the content of the figures will be
+    saved as a plot spec and, optionally, the figures (matplotlib) as a
+    pickle-object (also in the output-folder)
     If the run was not initialized with an output-path, this function will
     have no effect on the behaviour of your script.
 
@@ -183,11 +193,16 @@ def figure_save_config(file_formats=None, to_pickle=True, dpi=150):
         for later plotting. They are saved in the output-folder.
     dpi : int
         The resolution of the images.
+    to_spec : boolean
+        If True, the content of the figures will be saved as a plot spec,
+        which is small and fast to re-plot with
+        :py:func:`~raredecay.tools.plot_spec.replot`.
     """
     # hack for using mutable defaults
     file_formats = copy.deepcopy(file_formats)
     config.save_fig_cfg['file_formats'] = file_formats
     config.save_fig_cfg['to_pickle'] = to_pickle
+    config.save_fig_cfg['to_spec'] = to_spec
     config.save_fig_cfg['dpi'] = dpi
 
 
@@ -203,6 +218,32 @@ def set_random_seed(seed=None):
         meta_config.set_seed(seed)
 
 
+def root_cache_config(max_bytes=None, cache_dir=None):
+    """Change the size of the in-memory cache for branches read from ROOT-files.
+
+    Every branch read from a ROOT-file is kept in memory and shared between
+    all data-storages using this file, so it is decoded only once. If the
+    limit is reached, the least recently used branches are removed.
+
+    Parameters
+    ----------
+    max_bytes : int >= 0
+        The maximum size of the cache in bytes. 0 disables the cache. If None,
+        it won't change anything.
+    cache_dir : str or False
+        A directory to store the branches on disk. Later runs memory-map
+        them instead of reading the ROOT-files again. False disables the
+        disk cache. If None, it won't change anything.
+    """
+    from raredecay.tools.root_cache import branch_cache
+
+    if max_bytes is not None:
+        meta_config.ROOT_CACHE_MAX_BYTES = int(max_bytes)
+        branch_cache.max_bytes = None  # follow the meta_config value, evicts if needed
+    if cache_dir is not None:
+        meta_config.ROOT_CACHE_DIR = cache_dir if cache_dir else None
+
+
 def _init_output_to_file(file_path, run_name="Test run", overwrite_existing=False,
                          run_message="This is a test-run to test the package",
                          prompt_for_input=False):
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Process-wide budget of cpus for nested parallel work.
+
+Several levels of the analysis can run in parallel: the folds of a
+FoldingClassifier, the points of a hyper-parameter search, the threads of a
+classifier (*nthreads*, *n_jobs*)... If every level takes
+:py:const:`~raredecay.meta_config.n_cpu_max` cpus, the machine is
+oversubscribed; if only one level does, cores are idle.
+
+Therefore, parallel work *leases* cpus from the budget and returns them when
+finished. A lease in another thread (e.g. a worker of a parallel task) only
+gets the cpus which are still free (but at least one), so the total never
+exceeds the budget. A lease nested in the same thread uses the cpus of the
+enclosing lease, as the caller waits for it to finish. Inside a lease,
+:py:meth:`CPUBudget.available` returns the leased cpus (e.g. used by
+:py:func:`~raredecay.analysis.ml_analysis.make_clf`). How they are split
+between the parallel tasks and the threads of a classifier is decided by
+:py:func:`split_cpus`. All decisions are logged.
+
+Instances
+---------
+cpu_budget : :py:class:`~raredecay.tools.cpu_budget.CPUBudget`
+    The budget used by the analysis functions.
+"""
+from __future__ import division, absolute_import
+
+import threading
+import functools
+import contextlib
+
+from raredecay import meta_config
+from raredecay.tools import dev_tool
+
+import importlib
+cfg = importlib.import_module(meta_config.run_config)
+logger = dev_tool.make_logger(__name__, **cfg.logger_cfg)
+
+
+def split_cpus(n_cpu, n_tasks=None, n_threads=None):
+    """Split cpus between parallel tasks and the threads of each task.
+
+    Parameters
+    ----------
+    n_cpu : int >= 1
+        The number of cpus available.
+    n_tasks : int >= 1 or None
+        The number of tasks which can run in parallel (e.g. folds). If None,
+        the cpus are given to the threads (if *n_threads* is None) or as
+        many tasks as possible are run in parallel.
+    n_threads : int >= 1 or None
+        The (fixed) number of threads each task uses. If None, it is chosen.
+
+    Return
+    ------
+    out : (int, int)
+        The number of parallel workers and the number of threads for each
+        task. Their product is never bigger than *n_cpu*.
+    """
+    n_cpu = max(int(n_cpu), 1)
+    if n_threads is not None:
+        n_threads = max(int(n_threads), 1)
+        n_workers = max(n_cpu // n_threads, 1)
+        if n_tasks is not None:
+            n_workers = min(n_workers, max(int(n_tasks), 1))
+        return n_workers, n_threads
+    if n_tasks is None:
+        return 1, n_cpu
+    n_workers = min(max(int(n_tasks), 1), n_cpu)
+    return n_workers, n_cpu // n_workers
+
+
+class CPUBudget(object):
+    """Thread-safe budget of cpus which are leased to parallel work.
+
+    Parameters
+    ----------
+    n_cpu : int >= 1 or None
+        The total number of cpus. If None,
+        :py:const:`~raredecay.meta_config.n_cpu_max` is used.
+    """
+
+    def __init__(self, n_cpu=None):
+        self._n_cpu = n_cpu
+        self._lock = threading.Lock()
+        self._local = threading.local()  # the leases of the current thread
+        self._n_used = 0
+        self.n_leases = 0
+        self.max_used = 0
+
+    @property
+    def total(self):
+        """The total number of cpus of the budget."""
+        if self._n_cpu is None:
+            return meta_config.n_cpu_max
+        return self._n_cpu
+
+    @total.setter
+    def total(self, n_cpu):
+        self._n_cpu = n_cpu
+
+    @property
+    def n_used(self):
+        """The number of cpus currently leased."""
+        return self._n_used
+
+    @property
+    def free(self):
+        """The number of free cpus, at least 1."""
+        return max(self.total - self._n_used, 1)
+
+    def available(self):
+        """Return the cpus of the innermost lease of this thread or else the free ones."""
+        leases = getattr(self._local, 'leases', None)
+        return leases[-1] if leases else self.free
+
+    def acquire(self, n_cpu=None, name=""):
+        """Lease cpus from the budget, return them with :py:meth:`release`.
+
+        Parameters
+        ----------
+        n_cpu : int or None
+            The number of cpus wanted. None means all free ones, -1, -2,...
+            all free ones but 0, 1,... (like
+            :py:func:`~raredecay.meta_config.get_n_cpu`).
+        name : str
+            The name of the work, used in the log.
+
+        Return
+        ------
+        out : int >= 1
+            The number of cpus granted. This is the number wanted but at
+            most the free ones and at least 1 (even if none is free, the work
+            has to be done).
+        """
+        with self._lock:
+            free = max(self.total - self._n_used, 0)
+            wanted = free if n_cpu is None else n_cpu
+            if wanted < 0:
+                wanted = free + wanted + 1
+            granted = max(min(wanted, free), 1)
+            self._n_used += granted
+            self.n_leases += 1
+            self.max_used = max(self.max_used, self._n_used)
+            n_used = self._n_used
+        logger.info("cpu budget: " + str(name) + " leased " + str(granted) + " cpus (wanted " +
+                    str(n_cpu) + "), " + str(n_used) + " of " + str(self.total) + " in use")
+        return granted
+
+    def release(self, n_cpu, name=""):
+        """Return cpus leased with :py:meth:`acquire` to the budget."""
+        with self._lock:
+            self._n_used = max(self._n_used - n_cpu, 0)
+            n_used = self._n_used
+        logger.debug("cpu budget: " + str(name) + " returned " + str(n_cpu) + " cpus, " +
+                     str(n_used) + " of " + str(self.total) + " in use")
+
+    @contextlib.contextmanager
+    def lease(self, n_cpu=None, name=""):
+        """Context manager to lease cpus, see :py:meth:`acquire`.
+
+        If the current thread holds a lease already, its cpus are used (but
+        at most *n_cpu*) instead of acquiring new ones.
+
+        Example
+        -------
+        >>> with cpu_budget.lease(name="folding") as n_cpu:
+        ...     clf_dict = make_clf('xgb', n_cpu=n_cpu, n_tasks=n_folds)
+        ...     # fit the classifier
+        """
+        if not hasattr(self._local, 'leases'):
+            self._local.leases = []
+        nested = bool(self._local.leases)
+        if nested:
+            granted = self._local.leases[-1]
+            if n_cpu is not None:
+                granted = max(min(granted, n_cpu if n_cpu > 0 else granted + n_cpu + 1), 1)
+            logger.debug("cpu budget: " + str(name) + " uses " + str(granted) +
+                         " cpus of the enclosing lease")
+        else:
+            granted = self.acquire(n_cpu=n_cpu, name=name)
+        self._local.leases.append(granted)
+        try:
+            yield granted
+        finally:
+            self._local.leases.pop()
+            if not nested:
+                self.release(granted, name=name)
+
+    def leasing(self, name=None, n_cpu=None):
+        """Decorator to run every call of a function inside a lease.
+
+        Parameters
+        ----------
+        name : str or None
+            The name used in the log. If None, the name of the function is used.
+        n_cpu : int or None
+            The number of cpus wanted, see :py:meth:`acquire`.
+        """
+        def decorator(function):
+            lease_name = function.__name__ if name is None else name
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.lease(n_cpu=n_cpu, name=lease_name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """Return the number of leases and the maximum of cpus used at once."""
+        return {'n_leases': self.n_leases, 'max_used': self.max_used, 'total': self.total}
+
+
+cpu_budget = CPUBudget()
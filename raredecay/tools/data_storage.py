@@ -13,15 +13,13 @@ import copy
 import warnings
 import math
 import random
+import re
 
 import pandas as pd
-import seaborn as sns
 import numpy as np
-import matplotlib.pyplot as plt
-
-from rep.data.storage import LabeledDataStorage
 
 from raredecay.tools import data_tools, dev_tool
+from raredecay.tools.root_cache import branch_cache
 try:
     from raredecay.globals_ import out
     out_imported = True
@@ -38,6 +36,111 @@ import importlib
 cfg = importlib.import_module(meta_config.run_config)
 modul_logger = dev_tool.make_logger(__name__, **cfg.logger_cfg)
 
+# names in cut expressions which are not columns
+_EXPR_KEYWORDS = frozenset(['and', 'or', 'not', 'in', 'True', 'False', 'abs', 'sqrt', 'exp',
+                            'expm1', 'log', 'log10', 'log1p', 'sin', 'cos', 'tan', 'arcsin',
+                            'arccos', 'arctan', 'arctan2', 'sinh', 'cosh', 'tanh'])
+
+
+class _RowIndex(object):
+    """The rows of the data used by a storage, as int64 positions.
+
+    A contiguous range of rows is only stored as (start, stop), everything
+    else as an int64 array. All row selections are positional gathers
+    (``iloc``/``take``), no label lookups.
+
+    Parameters
+    ----------
+    positions : 1-D array-like of int or None
+        The positions of the rows. If None, the range given by *start* and
+        *stop* is used.
+    start : int
+        The first row of a contiguous range.
+    stop : int or None
+        The end (exclusive) of a contiguous range. If None, all rows from
+        *start* on are used.
+    """
+
+    def __init__(self, positions=None, start=0, stop=None):
+        if positions is not None:
+            positions = np.asarray(positions, dtype=np.int64)
+            n_rows = len(positions)
+            if n_rows > 0 and positions[-1] - positions[0] == n_rows - 1 and \
+                    (n_rows == 1 or np.all(np.diff(positions) == 1)):
+                start, stop, positions = int(positions[0]), int(positions[-1]) + 1, None
+        self._positions = positions
+        self.start = start
+        self.stop = stop
+
+    @property
+    def is_contiguous(self):
+        """True if the rows are a contiguous range."""
+        return self._positions is None
+
+    @property
+    def positions(self):
+        """The positions as int64 array. The stop of the range has to be known."""
+        if self._positions is None:
+            return np.arange(self.start, self.stop, dtype=np.int64)
+        return self._positions
+
+    def take(self, positions):
+        """Return the rows at *positions* (relative to self) as a new instance."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if self._positions is None:
+            return _RowIndex(positions + self.start)
+        return _RowIndex(self._positions.take(positions))
+
+    def gather(self, data):
+        """Return the rows of a DataFrame (positional, no labels involved)."""
+        if self._positions is None:
+            if self.start == 0 and (self.stop is None or self.stop == len(data)):
+                return data
+            return data.iloc[self.start:self.stop]
+        return data.take(self._positions)
+
+    def gather_array(self, array):
+        """Return the rows of a 1-D array, a view if they are contiguous."""
+        if self._positions is None:
+            return array[self.start:self.stop]
+        return array.take(self._positions)
+
+
+def _percentile_range(values, lower=0.01, upper=99.99):
+    """Return the *lower* and *upper* percentile of the values.
+
+    Same as :py:func:`numpy.percentile` (linear interpolation), but only the
+    needed elements are found with :py:func:`numpy.partition` instead of
+    sorting the values.
+    """
+    n_values = len(values)
+    positions = np.array([lower, upper]) / 100. * (n_values - 1)
+    low = np.floor(positions).astype(np.intp)
+    high = np.minimum(low + 1, n_values - 1)
+    partitioned = np.partition(values, np.unique(np.concatenate((low, high))))
+    fraction = positions - low
+    result = partitioned[low] * (1 - fraction) + partitioned[high] * fraction
+    return float(result[0]), float(result[1])
+
+
+def _bin_counts(values, bin_edges, weights=None, uniform=True):
+    """Return the (weighted) number of values in the bins, like :py:func:`numpy.histogram`.
+
+    Uniform bins are computed directly from the values, others with a
+    binary search. Both are counted with :py:func:`numpy.bincount`.
+    """
+    n_bins = len(bin_edges) - 1
+    lower, upper = bin_edges[0], bin_edges[-1]
+    inside = (values >= lower) & (values <= upper)
+    values = values[inside]
+    if uniform and upper > lower:
+        bin_ids = ((values - lower) * (n_bins / (upper - lower))).astype(np.intp)
+    else:
+        bin_ids = np.searchsorted(bin_edges, values, side='right') - 1
+    np.clip(bin_ids, 0, n_bins - 1, out=bin_ids)  # the upper edge belongs to the last bin
+    weights = None if weights is None else weights[inside]
+    return np.bincount(bin_ids, weights=weights, minlength=n_bins).astype('f8')
+
 
 class HEPDataStorage(object):
     """Data-storage for data, weights, targets; conversion; plots and more"""
@@ -66,7 +169,8 @@ class HEPDataStorage(object):
         }
 
     def __init__(self, data, index=None, target=None, sample_weights=None,
-                 data_name=None, data_name_addition=None, column_alias=None):
+                 data_name=None, data_name_addition=None, column_alias=None,
+                 cache_dir=None):
         """Initialize instance and load data.
 
         Parameters
@@ -98,9 +202,16 @@ class HEPDataStorage(object):
             | *Example: 'reweighted', 'shuffled', '5 GeV cut applied' etc.*
         column_alias : |column_alias_type|
             |column_alias_docstring|
+        cache_dir : str or False or None
+            Only for root-dicts: a directory where the branches read are
+            stored as .npy files, which are memory-mapped instead of reading
+            the ROOT-file again (also in later runs). If None,
+            :py:const:`~raredecay.meta_config.ROOT_CACHE_DIR` is used, False
+            disables it.
         """
         # initialize logger
         self.logger = modul_logger
+        self.cache_dir = cache_dir
 
         # initialize index
         # self._index = None
@@ -109,9 +220,14 @@ class HEPDataStorage(object):
         # self._data = None
         self._data_type = None
         self.column_alias = {} if column_alias is None else column_alias
-        self._fold_index = None  # list with indeces of folds
+        self._fold_ids = None  # array with the fold of every row
+        self._n_folds = 0
         self._fold_status = None  # tuple (my_fold_number, total_n_folds)
         self._length = None
+        self._rows = None  # _RowIndex, the rows used of self._data
+        self._label_map = None  # pd.Index of self._index, label -> position
+        self._version = 0  # increased on every change of the data or the weights
+        self._hist_cache = {}  # ranges and histograms of the columns, see plot
         self.set_data(data=data, index=index)
         # self._columns = None
 
@@ -132,7 +248,8 @@ class HEPDataStorage(object):
 #        self.set_labels(data_labels=data_labels)
 
         # initialize weights
-        self._weights = None
+        self._weights = None  # 1 or float64 array aligned to the rows
+        self._weights_stats = None  # cached sums, invalidated on write
         self.set_weights(sample_weights)
 
         # plot settings
@@ -226,13 +343,48 @@ class HEPDataStorage(object):
         3. otherwise, a list of indeces as usuall (0, len-1) will be returned
         """
         if index is None:
-            temp = list(range(len(self))) if self._index is None else self._index
+            temp = list(range(len(self))) if self._index is None else self._index.tolist()
         else:
             temp = index
         return temp
 
+    def _get_labels(self):
+        """Return the index as an array without creating a list."""
+        return np.arange(len(self)) if self._index is None else self._index
+
+    def _get_positions(self, index):
+        """Return the positions (0 to len - 1) of the labels in the own index."""
+        if self._index is None:
+            return np.asarray(index, dtype=np.int64)
+        if self._label_map is None:
+            self._label_map = pd.Index(self._index)
+        if self._label_map.is_unique:
+            positions = self._label_map.get_indexer(index)
+        else:
+            positions = self._label_map.get_indexer_non_unique(index)[0]
+        if np.any(positions < 0):
+            raise KeyError("Index contains labels which are not in the data")
+        return positions
+
+    def _get_rows(self, index=None):
+        """Return the rows of self._data (_RowIndex) corresponding to the index."""
+        if index is None:
+            return self._rows
+        if self._data_type == 'root':
+            positions = index  # the entries of the tree are the index
+        else:
+            data_index = self._data.index
+            if data_index.is_unique:
+                positions = data_index.get_indexer(index)
+            else:
+                positions = data_index.get_indexer_non_unique(index)[0]
+            if np.any(positions < 0):
+                raise KeyError("Index contains labels which are not in the data")
+        return _RowIndex(positions)
+
     def _set_index(self, index):
         """If index is not None -> assign. Else try to get from data"""
+        self._label_map = None
         if index is None:
             self._index = None
             if self._data_type == 'root':
@@ -243,9 +395,9 @@ class HEPDataStorage(object):
                 index_list = self._data.index.tolist()
                 # TODO: remove HACK with length, replace with len(self)
                 if not index_list == range(len(self)):  # if special indexing
-                    self._index = index_list
+                    self._index = np.asarray(index_list)
         else:
-            self._index = index
+            self._index = np.asarray(index)
 
     @property
     def columns(self):
@@ -275,11 +427,7 @@ class HEPDataStorage(object):
         index = self._index
         if index is None:
             if self._data_type == 'root':
-                temp_root_dict = copy.deepcopy(self._data)
-                temp_branch = temp_root_dict.pop('branches')  # remove to only use one branch
-                temp_branch = data_tools.to_list(temp_branch)
-                self._length = len(data_tools.to_ndarray(dict(branches=temp_branch[0],
-                                                              **temp_root_dict)))
+                self._length = branch_cache.get_n_entries(self._data, cache_dir=self.cache_dir)
             elif self._data_type == 'df':
                 self._length = len(self._data)
             elif self._data_type == 'array':
@@ -344,6 +492,7 @@ class HEPDataStorage(object):
         # get the data_type
         self._data = data
         self._data_type = self._get_data_type(data)
+        self._changed()
 
         self.index = index
         self.columns = columns
@@ -353,14 +502,16 @@ class HEPDataStorage(object):
 
         # root data
         if self._data_type == 'root':
-            pass
+            self._rows = _RowIndex() if self._index is None else self._get_rows(self._index)
         # pandas DataFrame
         elif self._data_type == 'df':
-
-            self._data = self._make_df(index=self._index)  # No cols, it's set above
+            if self._index is not None:
+                self._data = self._get_rows(self._index).gather(self._data)
+            self._rows = _RowIndex()
         # numpy array
         elif self._data_type == 'array':
             self._data = self._make_df(index=self._index)
+            self._rows = _RowIndex()
             warnings.warn(DeprecationWarning, "Not safe, it's better to use pandas DataFrame")
         else:
             raise NotImplementedError("Other dataformats are not yet implemented")
@@ -402,11 +553,9 @@ class HEPDataStorage(object):
         # TODO: implement if targets are different
 
         if weights_ratio > 0 and second_storage is not None:
-            weights_1 = self.get_weights(index=index)
-            weights_2 = second_storage.get_weights()
-
-            sum_weight_1 = float(sum(weights_1))
-            sum_weight_2 = float(sum(weights_2))
+            # the weights are normalized to a mean of 1: the sum is the length
+            sum_weight_1 = float(length)
+            sum_weight_2 = float(len(second_storage))
 
             ratio_1 = weights_ratio * sum_weight_2 / sum_weight_1
             self.logger.info("ratio_1 = " + str(ratio_1))
@@ -445,19 +594,54 @@ class HEPDataStorage(object):
             weights_out = self._weights
             if normalize != 1 or normalize is not True:
                 weights_out = pd.Series(np.ones(length), index=index)
-            else:
-                normalize = False
-        elif index is None:
-            weights_out = self._weights
+                if normalize or normalize > 0:
+                    normalize = 1 if normalize is True else normalize
+                    weights_out *= normalize
         else:
-            weights_out = self._weights.loc[index]
-        weights_out = copy.deepcopy(weights_out)
-        if normalize or normalize > 0:
-            normalize = 1 if normalize is True else normalize
-            weights_out *= normalize / weights_out.mean()
+            positions = None if index is self._index else self._get_positions(index)
+            weights_out = self._get_weights_array(positions=positions, normalize=normalize)
+            if positions is None and not weights_out.flags.writeable:
+                weights_out = weights_out.copy()
+            weights_out = pd.Series(weights_out, index=index, copy=False)
 
         return weights_out
 
+    def _get_weights_array(self, positions=None, normalize=True):
+        """Return the weights as float64 array, the internal one if possible.
+
+        Without *positions* and normalization (or if they are already
+        normalized), a read-only view of the internal array is returned.
+        The weights have to be an array (not 1).
+        """
+        if positions is None:
+            weights = self._weights
+            mean = self._get_weights_stats()['mean']
+        else:
+            weights = self._weights.take(positions)
+            mean = weights.mean()
+        if normalize or normalize > 0:
+            normalize = 1 if normalize is True else normalize
+            factor = normalize / mean
+            if factor != 1:
+                return weights * factor
+        if positions is None:
+            weights = weights.view()
+            weights.flags.writeable = False
+        return weights
+
+    def _get_weights_stats(self):
+        """Return the (cached) sum, mean and sum of squares of the weights."""
+        if self._weights_stats is None:
+            if dev_tool.is_in_primitive(self._weights, (None, 1)):
+                length = float(len(self))
+                self._weights_stats = dict(sum=length, mean=1., sumsq=length)
+            else:
+                weights_sum = float(self._weights.sum())
+                self._weights_stats = dict(sum=weights_sum,
+                                           mean=weights_sum / len(self._weights),
+                                           sumsq=float(np.dot(self._weights, self._weights)))
+        return self._weights_stats
+
     def set_weights(self, sample_weights, index=None):
         """Set the weights of the sample.
 
@@ -486,31 +670,37 @@ class HEPDataStorage(object):
 
     def _set_weights(self, sample_weights, index=None):
         """Set the weights"""
+        positions = None if index is None else self._get_positions(index)
         index = self.index if index is None else index
-        length = len(self) if index is None else len(index)
+        self._weights_stats = None
+        self._changed()
 
         if dev_tool.is_in_primitive(sample_weights, (None, 1)):
-            if index is None or len(self) == len(index):
+            if positions is None or len(self) == len(positions):
                 self._weights = 1
                 return
             else:
-                sample_weights = pd.Series(np.ones(len(index)), index=index)
-        #    else:
-        #        sample_weights = np.ones(length)
+                sample_weights = 1.
         elif isinstance(sample_weights, pd.Series):
-            sample_weights = sample_weights[index]
+            sample_weights = sample_weights[index].values
         else:
-            sample_weights = pd.Series(sample_weights, index=index, dtype='f8')
+            sample_weights = np.asarray(sample_weights, dtype='f8')
 
-        if len(self) == length and index is None:
-            self._weights = sample_weights
+        if positions is None:
+            # always an own, contiguous array
+            self._weights = np.array(sample_weights, dtype='f8')
+            assert len(self._weights) == len(self), "Weights do not have the same length as the data"
         else:
             if dev_tool.is_in_primitive(self._weights, (None, 1)):
-                self._weights = pd.Series(np.ones(len(self)), index=self._index)
-            self._weights.update(sample_weights)
+                self._weights = np.ones(len(self))
+            self._weights[positions] = sample_weights
 
     def set_root_selection(self, selection, exception_if_failure=True):
-        """Set the selection in a root-file. Only possible if a root-file is provided."""
+        """Set the selection in a root-file. Only possible if a root-file is provided.
+
+        .. warning:: reloads the data. Use
+           :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.select()` instead.
+        """
         warnings.warn("Method set_root_selection very unsafe currently!")
         meta_config.warning_occured()
         if self._data_type == 'root':
@@ -522,6 +712,48 @@ class HEPDataStorage(object):
         else:
             self.logger.error("selection not applied, no root-dict")
 
+    def select(self, expr, chunk_size=None):
+        """Return a view on the rows passing the cut *expr*.
+
+        The cut is evaluated vectorized (with :py:func:`pandas.eval`), chunk by
+        chunk, only reading the columns used in it. No data is copied, so
+        cuts can be chained cheaply: ``storage.select("B_PT > 1000").select("nTracks < 300")``
+
+        Parameters
+        ----------
+        expr : str
+            The cut over the names of the columns/branches (or their alias),
+            like "B_PT > 1000 & (nSPDHits < 600 | l1_PT > 500)". The ROOT
+            operators &&, || and ! can be used as well.
+        chunk_size : int > 0
+            The number of rows to evaluate at once. If None,
+            :py:const:`~raredecay.meta_config.CHUNK_SIZE` is used.
+
+        Return
+        ------
+        out : :py:class:`~raredecay.tools.data_storage.HEPDataStorageView`
+            The rows passing the cut.
+        """
+        chunk_size = meta_config.CHUNK_SIZE if chunk_size is None else int(chunk_size)
+        eval_expr = re.sub(r'!(?!=)', '~', expr.replace('&&', '&').replace('||', '|'))
+        inverse_alias = {alias: col for col, alias in self.column_alias.items()}
+        names = [name for name in re.findall(r'\b[A-Za-z_]\w*\b', eval_expr)
+                 if name not in _EXPR_KEYWORDS]
+        names = sorted(set(names))
+        columns = [inverse_alias.get(name, name) for name in names]
+
+        mask = np.empty(len(self), dtype=bool)
+        for positions, arrays in self._iter_blocks(columns, chunk_size):
+            mask[positions[0]:positions[-1] + 1] = pd.eval(eval_expr,
+                                                           local_dict=dict(zip(names, arrays)))
+        rows = np.flatnonzero(mask)
+
+        n_rows = len(self)
+        self.logger.info("Selection '" + expr + "' on " + self.name + ": " + str(len(rows)) +
+                         " of " + str(n_rows) + " rows pass (" +
+                         str(round(100. * len(rows) / max(n_rows, 1), 2)) + "%)")
+        return HEPDataStorageView(self, rows=rows, add_to_name=" " + expr)
+
     def pandasDF(self, columns=None, index=None):
         """Return a pandas DataFrame representation of the data
 
@@ -547,13 +779,15 @@ class HEPDataStorage(object):
 
         return data_out
 
+    @dev_tool.profiled("HEPDataStorage._make_df")
     def _make_df(self, columns=None, index=None, copy=False):
         """Return a DataFrame from the internal data. Does some dirty, internal work."""
         # initialize data
         # TODO: remove trailing comment?
         data = self._data  # if dev_tool.is_in_primitive(data) else data
         columns = self.columns if columns is None else data_tools.to_list(columns)
-        index = self._index if index is None else data_tools.to_list(index)
+        rows = self._get_rows(index)
+        index = self._index if index is None else index
 
         if self._data_type == 'root':
             # update root dictionary
@@ -561,10 +795,12 @@ class HEPDataStorage(object):
             for key, val in temp_root_dict.items():
                 if dev_tool.is_in_primitive(val, None):
                     temp_root_dict[key] = self.data.get(key)
-            data = data_tools.to_pandas(temp_root_dict, columns=columns)
+            data = pd.DataFrame(branch_cache.get(temp_root_dict, cache_dir=self.cache_dir),
+                                columns=columns)
 
         elif self._data_type == 'array':
             data = pd.DataFrame(data, index=index, columns=columns, copy=copy)
+            rows = None  # the index was already applied
         elif self._data_type == 'df':
             if columns is not None:
                 data = data[columns]
@@ -572,13 +808,62 @@ class HEPDataStorage(object):
             raise NotImplementedError("Unknown/not yet implemented data type")
 
         assert isinstance(data, pd.DataFrame), "data did not convert correctly"
-        data = data if index is None else data.ix[index]
+        data = data if rows is None else rows.gather(data)
 
         if isinstance(self.column_alias, dict) and len(self.column_alias) > 0:
-            data.rename(columns=self.column_alias, inplace=True, copy=False)
+            # not inplace, the data may be shared with other storages
+            data = data.rename(columns=self.column_alias, copy=False)
 
         return data
 
+    def _get_column_arrays(self, columns, rows):
+        """Return the columns at the rows (_RowIndex) as a list of 1-D arrays.
+
+        No DataFrame is created; contiguous rows are views on the data or on
+        the (read-only) arrays of the branch cache.
+        """
+        return [rows.gather_array(array) for array in self._read_columns(columns)]
+
+    def _read_columns(self, columns):
+        """Return the columns of all the (underlying) data as a list of 1-D arrays."""
+        if self._data_type == 'root':
+            return branch_cache.get(dict(self._data, branches=columns),
+                                    cache_dir=self.cache_dir).values()
+        elif self._data_type in ('df', 'array'):
+            return [self._data[col].values for col in columns]
+        else:
+            raise NotImplementedError("Unknown/not yet implemented data type")
+
+    def _get_targets_array(self, labels):
+        """Return the targets of the labels as array or, if primitive, as 0-d array."""
+        if dev_tool.is_in_primitive(self._target, (-1, 0, 1, None)):
+            if self._target is None:
+                self.logger.warning("Target list consists of None!")
+            return np.asarray(self._target)
+        target_index = self._target.index
+        if target_index.is_unique:
+            return self._target.values.take(target_index.get_indexer(labels))
+        return self._target.loc[labels].values
+
+    def _fill_weights(self, out, positions, normalize=None, sample_weights=None):
+        """Write the weights of the positions into *out*, normalized to a mean of *normalize*.
+
+        If *sample_weights* (aligned to the rows of self) is given, it is used
+        instead of the weights of the storage.
+        """
+        weights = self._weights if sample_weights is None else sample_weights
+        normalize = 1 if normalize is True else normalize
+        if dev_tool.is_in_primitive(weights, (None, 1)):
+            out.fill(normalize if normalize > 0 else 1.)
+            return
+        if isinstance(weights, pd.Series):
+            weights = weights[self._get_labels()].values
+        weights = np.asarray(weights, dtype='f8')
+        assert len(weights) == len(self), "Weights do not have the same length as the data"
+        out[:] = weights.take(positions)
+        if normalize > 0 and len(out) > 0:
+            out *= normalize / out.mean()
+
 #    def get_labels(self, columns=None, as_list=False):
 #        """Return the human readable branch-labels of the data.
 #
@@ -676,8 +961,10 @@ class HEPDataStorage(object):
             target.sort_index(inplace=True)
         self._target = target
 
+    @dev_tool.profiled("HEPDataStorage.make_dataset")
     def make_dataset(self, second_storage=None, index=None, index_2=None, columns=None,
-                     weights_ratio=0, shuffle=False, targets_from_data=False):
+                     weights_ratio=0, shuffle=False, targets_from_data=False,
+                     sample_weights=None, sample_weights_2=None):
         """Create data, targets and weights of the instance (and another one).
 
         In machine-learning, it is very often required to have data, it's
@@ -721,68 +1008,320 @@ class HEPDataStorage(object):
             generator.
         targets_from_data
             OUTDATED, dont use it. Use two datastorage, one labeled 0, one 1
-         """
-        # initialize values
+        sample_weights : |sample_weights_type|
+            If given, these weights (for all rows of the calling storage)
+            are used instead of the ones of the storage. The storage is
+            not changed.
+        sample_weights_2 : |sample_weights_type|
+            Same as *sample_weights* for the second storage.
 
-#        normalize_1 = 1
-#        normalize_2 = 1
-#
-#        if weights_ratio > 0 and second_storage is not None:
-#            weights_1 = self.get_weights(index=index)
-#            weights_2 = second_storage.get_weights(index=index_2)
-#
-#            sum_weight_1 = float(sum(weights_1))
-#            sum_weight_2 = float(sum(weights_2))
-#
-#            ratio_1 = weights_ratio * sum_weight_2 / sum_weight_1
-#            self.logger.info("ratio_1 = " + str(ratio_1))
-#            if ratio_1 >= 1:
-#                ratio_2 = 1.0
-#            else:
-#                ratio_2 = 1.0 / ratio_1
-#                ratio_1 = 1.0
-#
-#            normalize_1 = ratio_1
-#            normalize_2 = ratio_2
-#        elif weights_ratio > 0 and second_storage is None:
-#            normalize_1 = weights_ratio
-#        else:
-#            normalize_1 = None
+        Return
+        ------
+        out : tuple(pandas DataFrame, targets, weights)
+            The data (a DataFrame around the matrix created by
+            :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.make_dataset_arrays()`,
+            not copied), the targets and the weights. Without a second
+            storage, the targets and weights are pandas Series with the
+            index of the data, otherwise numpy arrays.
+         """
+        columns = self.columns if columns is None else data_tools.to_list(columns)
+        data, targets, weights, labels = self._make_dataset_arrays(
+            second_storage=second_storage, index=index, index_2=index_2, columns=columns,
+            weights_ratio=weights_ratio, shuffle=shuffle, sample_weights=sample_weights,
+            sample_weights_2=sample_weights_2)
 
-        if shuffle is not False:
-            index = self.index if index is None else index
-            if isinstance(shuffle, int) and shuffle is not True:
-                rand_seed = shuffle
-                rand_seed_2 = shuffle + 74
-            else:
-                rand_seed = rand_seed_2 = None
-            random.shuffle(index, random=rand_seed)
-        data = self.pandasDF(columns=columns, index=index)
+        out_columns = [self.column_alias.get(col, col) for col in columns]
+        data = pd.DataFrame(data, index=labels, columns=out_columns, copy=False)
         if second_storage is None:
-            targets = self.get_targets(index=index)
-#        weights = self.get_weights(index=index, normalize=normalize_1)
+            if targets.ndim == 0:
+                targets = np.repeat(targets, len(data))
+            targets = pd.Series(targets, index=labels)
+            weights = pd.Series(weights, index=labels, copy=False)
+
+        return data, targets, weights
+
+    def make_dataset_arrays(self, second_storage=None, index=None, index_2=None, columns=None,
+                            weights_ratio=0, shuffle=False, dtype=np.float64,
+                            sample_weights=None, sample_weights_2=None):
+        """Create data, targets and weights as numpy arrays, without intermediate DataFrames.
+
+        Same as :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.make_dataset()`,
+        but the final number of rows is computed first and the columns of
+        both storages are written directly into one preallocated,
+        C-contiguous matrix.
+
+        Parameters
+        ----------
+        second_storage : instance of
+        :py:class:`~raredecay.tools.data_storage.HEPDataStorage`
+            A second data-storage. Its rows are appended to the ones of the
+            calling storage.
+        index : |index_type|
+            The index for the **calling** (the *first*) storage instance.
+            |index_docstring|
+        index_2 : |index_type|
+            The index for the (optional) **second storage instance**.
+            |index_docstring|
+        columns : list(str, str, str, ...)
+            The columns to be used of **both** data-storages.
+        weights_ratio : float >= 0
+            The (relative) normalization, see
+            :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.make_dataset()`.
+        shuffle : boolean or int
+            If True or int, the rows of each storage are shuffled. If an
+            int is provided, it will be used as a seed.
+        dtype : numpy dtype
+            The dtype of the data matrix, for example np.float32 to halve
+            the memory.
+        sample_weights : |sample_weights_type|
+            If given, these weights (for all rows of the calling storage)
+            are used instead of the ones of the storage. The storage is
+            not changed.
+        sample_weights_2 : |sample_weights_type|
+            Same as *sample_weights* for the second storage.
 
+        Return
+        ------
+        out : tuple(2-D array, 1-D array, 1-D array)
+            The data (n_rows x n_columns), the targets and the weights (float64).
+        """
+        columns = self.columns if columns is None else data_tools.to_list(columns)
+        data, targets, weights, _labels = self._make_dataset_arrays(
+            second_storage=second_storage, index=index, index_2=index_2, columns=columns,
+            weights_ratio=weights_ratio, shuffle=shuffle, dtype=dtype,
+            sample_weights=sample_weights, sample_weights_2=sample_weights_2)
+        if targets.ndim == 0:
+            targets = np.repeat(targets, len(data))
+        return data, targets, weights
+
+    def _make_dataset_arrays(self, second_storage=None, index=None, index_2=None, columns=None,
+                             weights_ratio=0, shuffle=False, dtype=np.float64,
+                             sample_weights=None, sample_weights_2=None):
+        """Fill the preallocated data, targets and weights. Also return the labels.
+
+        Without a second storage, the targets may be a 0-d array (a
+        primitive target) and the labels are the index of the rows used,
+        otherwise the labels are None.
+        """
+        if shuffle is not False and isinstance(shuffle, int) and shuffle is not True:
+            rand_seed, rand_seed_2 = shuffle, shuffle + 74
+        else:
+            rand_seed = rand_seed_2 = None
+        positions_1 = self._get_dataset_positions(index, shuffle, rand_seed)
+        n_rows_1 = len(positions_1)
+        n_rows = n_rows_1
         if second_storage is not None:
             assert isinstance(second_storage, HEPDataStorage), "Wrong type, not an HEPDataStorage"
-            if shuffle is not False:
-                index_2 = second_storage.index if index_2 is None else index_2
-                random.shuffle(index_2, random=rand_seed_2)
-            data_2 = second_storage.pandasDF(columns=columns, index=index_2)
-            data = pd.concat((data, data_2), ignore_index=True, copy=False)
+            columns_2 = columns if columns is not None else second_storage.columns
+            positions_2 = second_storage._get_dataset_positions(index_2, shuffle, rand_seed_2)
+            n_rows += len(positions_2)
 
-            targets_1 = self.get_targets()
-            targets_2 = second_storage.get_targets()
-            targets = np.concatenate((targets_1, targets_2))
+        # the normalization of the weights, see get_weights
+        normalize_1 = normalize_2 = weights_ratio if weights_ratio > 0 else None
+        if weights_ratio > 0 and second_storage is not None:
+            # the weights are normalized to a mean of 1: the sum is the length
+            ratio_1 = weights_ratio * len(positions_2) / n_rows_1
+            self.logger.info("ratio_1 = " + str(ratio_1))
+            if ratio_1 >= 1:
+                normalize_1, normalize_2 = ratio_1, 1.0
+            else:
+                normalize_1, normalize_2 = 1.0, 1.0 / ratio_1
+
+        data = np.empty((n_rows, len(columns)), dtype=dtype, order='C')
+        weights = np.empty(n_rows, dtype='f8')
+        rows_1 = self._rows.take(positions_1)
+        for col_id, array in enumerate(self._get_column_arrays(columns, rows_1)):
+            data[:n_rows_1, col_id] = array
+        self._fill_weights(weights[:n_rows_1], positions_1, normalize=normalize_1,
+                           sample_weights=sample_weights)
+        labels = self._get_labels().take(positions_1)
+        targets_1 = self._get_targets_array(labels)
 
-            if max(targets_1) != min(targets_1) or max(targets_2) != min(targets_2) and weights_ratio > 0:
-                raise ValueError("Very unfortunately is the case of mixed targets in a HEPDataStorage and weights_ratio"+
-                                 "not yet implemented. Please make an issue!")
+        if second_storage is None:
+            return data, targets_1, weights, labels
+
+        rows_2 = second_storage._rows.take(positions_2)
+        for col_id, array in enumerate(second_storage._get_column_arrays(columns_2, rows_2)):
+            data[n_rows_1:, col_id] = array
+        second_storage._fill_weights(weights[n_rows_1:], positions_2, normalize=normalize_2,
+                                     sample_weights=sample_weights_2)
+        labels_2 = second_storage._get_labels().take(positions_2)
+        targets_2 = second_storage._get_targets_array(labels_2)
+
+        if weights_ratio > 0 and (np.unique(targets_1).size > 1 or np.unique(targets_2).size > 1):
+            raise ValueError("Very unfortunately is the case of mixed targets in a HEPDataStorage and weights_ratio"+
+                             "not yet implemented. Please make an issue!")
+        targets = np.empty(n_rows, dtype=np.result_type(targets_1, targets_2))
+        targets[:n_rows_1] = targets_1
+        targets[n_rows_1:] = targets_2
+
+        return data, targets, weights, None
+
+    def _get_dataset_positions(self, index=None, shuffle=False, rand_seed=None):
+        """Return the (shuffled) positions of the index as int64 array."""
+        if index is None:
+            positions = np.arange(len(self), dtype=np.int64)
+        else:
+            positions = np.array(self._get_positions(list(index)), dtype=np.int64)
+        if shuffle is not False:
+            if rand_seed is None:
+                random.shuffle(positions, random=meta_config.randfloat)
+            else:
+                np.random.RandomState(rand_seed).shuffle(positions)
+        return positions
 
-#            weights_2 = second_storage.get_weights(index=index_2, normalize=normalize_2)
+    def iter_chunks(self, columns=None, chunk_size=None, normalize=True, as_array=False,
+                    dtype=np.float64):
+        """Iterate over the data in blocks of at most *chunk_size* rows.
 
-        weights = self.get_weights(normalize=weights_ratio, second_storage=second_storage)
+        Only one block is in memory at a time: ROOT-trees are read in ranges
+        of entries (see
+        :py:meth:`~raredecay.tools.root_cache.BranchCache.get_chunk`), so
+        samples larger than the memory can be predicted, histogrammed etc.
 
-        return data, targets, weights
+        Parameters
+        ----------
+        columns : str or list(str, str, str, ...)
+            The columns to use. If None, all are used.
+        chunk_size : int > 0
+            The maximum number of rows of a block. If None,
+            :py:const:`~raredecay.meta_config.CHUNK_SIZE` is used.
+        normalize : boolean or float > 0
+            The normalization of the weights like for
+            :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.get_weights()`,
+            with respect to *all* rows (not to every block).
+        as_array : boolean
+            If True, the data of a block is a 2-D array instead of a DataFrame.
+        dtype : numpy dtype
+            The dtype of the data if *as_array* is True.
+
+        Yields
+        ------
+        out : tuple(data, targets, weights)
+            The data of the block as pandas DataFrame (with the index of the
+            rows) or 2-D array, the targets and the weights as 1-D arrays.
+        """
+        columns = self.columns if columns is None else data_tools.to_list(columns)
+        chunk_size = meta_config.CHUNK_SIZE if chunk_size is None else int(chunk_size)
+        if not chunk_size > 0:
+            raise ValueError("chunk_size has to be larger then 0")
+        normalize = 1 if normalize is True else normalize
+        factor = normalize / self._get_weights_stats()['mean'] if normalize > 0 else 1.
+        out_columns = [self.column_alias.get(col, col) for col in columns]
+        # a primitive target (or None, warned about) is the same for all blocks
+        primitive_target = dev_tool.is_in_primitive(self._target, (-1, 0, 1, None))
+        if primitive_target:
+            target = self._get_targets_array(None)
+
+        for positions, arrays in self._iter_blocks(columns, chunk_size):
+            weights = np.empty(len(positions))
+            self._fill_weights(weights, positions)
+            if factor != 1:
+                weights *= factor
+            labels = positions if self._index is None else self._index.take(positions)
+            targets = target if primitive_target else self._get_targets_array(labels)
+            if targets.ndim == 0:
+                targets = np.repeat(targets, len(positions))
+            if as_array:
+                data = np.empty((len(positions), len(columns)), dtype=dtype)
+                for col_id, array in enumerate(arrays):
+                    data[:, col_id] = array
+            else:
+                data = pd.DataFrame(dict(zip(out_columns, arrays)), index=labels,
+                                    columns=out_columns)
+            yield data, targets, weights
+
+    def _iter_blocks(self, columns, chunk_size):
+        """Yield the positions (consecutive) and columns of the blocks of rows."""
+        chunk_size = meta_config.CHUNK_SIZE if chunk_size is None else chunk_size
+        if self._data_type == 'root' and self._is_streamable():
+            return self._iter_root_blocks(columns, chunk_size)
+        return self._iter_row_blocks(columns, chunk_size)
+
+    def _is_streamable(self):
+        """True if the rows can be read as ranges of entries of the root-tree."""
+        if not self._rows.is_contiguous:
+            return False
+        if any(self._data.get(key) is not None for key in ('start', 'stop', 'step')):
+            return False
+        # with a selection, the entry of a row is only known by counting from the first one
+        return self._rows.start == 0 or not self._data.get('selection')
+
+    def _iter_root_blocks(self, columns, chunk_size):
+        """Yield the positions and columns of blocks read as ranges of tree entries."""
+        root_dict = dict(self._data, branches=columns)
+        n_rows = len(self)
+        entry = self._rows.start
+        if self._data.get('selection'):
+            tree_dict = dict(self._data)
+            del tree_dict['selection']
+            n_entries = branch_cache.get_n_entries(tree_dict, cache_dir=self.cache_dir)
+        else:
+            n_entries = entry + n_rows
+        position = 0
+        while position < n_rows and entry < n_entries:
+            arrays = branch_cache.get_chunk(root_dict, entry, min(entry + chunk_size, n_entries),
+                                            cache_dir=self.cache_dir).values()
+            entry += chunk_size
+            n_block = min(len(arrays[0]), n_rows - position)
+            if n_block > 0:
+                yield (np.arange(position, position + n_block, dtype=np.int64),
+                       [array[:n_block] for array in arrays])
+                position += n_block
+
+    def _changed(self):
+        """Invalidate everything computed from the data or the weights."""
+        self._version += 1
+        self._hist_cache = {}
+
+    def _get_column_range(self, column, chunk_size=None):
+        """Return the (cached) 0.01 and 99.99 percentile of a column."""
+        key = ('range', self._version, column)
+        if key not in self._hist_cache:
+            values = [arrays[0] for _p, arrays in self._iter_blocks([column], chunk_size)]
+            self._hist_cache[key] = _percentile_range(np.concatenate(values))
+        return self._hist_cache[key]
+
+    def _get_histograms(self, columns, bin_edges, uniform=True, chunk_size=None):
+        """Return the (cached) weighted histograms of the columns.
+
+        The histograms not yet cached are filled in one pass over the data,
+        with the weights normalized like in
+        :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.get_weights()`.
+        """
+        keys = [('hist', self._version, column, tuple(edges))
+                for column, edges in zip(columns, bin_edges)]
+        missing = [i for i, key in enumerate(keys) if key not in self._hist_cache]
+        if missing:
+            counts = [np.zeros(len(bin_edges[i]) - 1) for i in missing]
+            weighted = not dev_tool.is_in_primitive(self._weights, (None, 1))
+            factor = 1. / self._get_weights_stats()['mean']
+            for positions, arrays in self._iter_blocks([columns[i] for i in missing],
+                                                       chunk_size):
+                weights = None
+                if weighted:
+                    weights = np.empty(len(positions))
+                    self._fill_weights(weights, positions)
+                    weights *= factor
+                for count, i, array in zip(counts, missing, arrays):
+                    count += _bin_counts(array, bin_edges[i], weights, uniform)
+            for count, i in zip(counts, missing):
+                self._hist_cache[keys[i]] = count
+        return [self._hist_cache[key] for key in keys]
+
+    def _iter_row_blocks(self, columns, chunk_size):
+        """Yield the positions and columns of blocks of the rows.
+
+        The columns are read once, not for every block: if the branch cache
+        does not keep them (e.g. ROOT_CACHE_MAX_BYTES is 0), every block
+        would read the whole branches again.
+        """
+        n_rows = len(self)
+        arrays = self._read_columns(columns)
+        for start in range(0, n_rows, chunk_size):
+            positions = np.arange(start, min(start + chunk_size, n_rows), dtype=np.int64)
+            rows = self._rows.take(positions)
+            yield positions, [rows.gather_array(array) for array in arrays]
 
     def copy_storage(self, columns=None, index=None, add_to_name=" cp"):
         """Return a copy of self (with only some of the columns, indices etc).
@@ -812,6 +1351,7 @@ class HEPDataStorage(object):
                                      sample_weights=new_weights,
                                      index=new_index,
                                      column_alias=new_column_alias,
+                                     cache_dir=self.cache_dir,
                                      data_name=self.data_name,
                                      data_name_addition=self.data_name_addition + add_to_name)
         new_storage.columns = columns
@@ -837,6 +1377,8 @@ class HEPDataStorage(object):
             Return a Labeled Data Storage instance created with the data
             from inside this instance.
         """
+        from rep.data.storage import LabeledDataStorage
+
         index = self.index if index is None else list(index)
         columns = self.columns if columns is None else columns
         random_state = meta_config.randint()
@@ -846,7 +1388,32 @@ class HEPDataStorage(object):
                                      random_state=random_state, shuffle=shuffle)
         return new_lds
 
-    def make_folds(self, n_folds=10, shuffle=True):
+    def publish(self, columns=None, directory=None):
+        """Share the data read-only with worker processes, without copies.
+
+        The data, targets and (not normalized) weights are written once to
+        files (by default in shared memory) which the workers memory-map,
+        see :py:mod:`~raredecay.tools.shared_data`.
+
+        Parameters
+        ----------
+        columns : str or list(str, str, str, ...)
+            The columns to share. If None, all are shared.
+        directory : str or None
+            Where to write the files. If None,
+            :py:const:`~raredecay.meta_config.SHARED_DATA_DIR` is used.
+
+        Return
+        ------
+        out : :py:class:`~raredecay.tools.shared_data.SharedData`
+            A small, picklable handle to send to the workers. The files are
+            removed when it is closed (e.g. used in a *with* statement).
+        """
+        from raredecay.tools import shared_data
+
+        return shared_data.publish(self, columns=columns, directory=directory)
+
+    def make_folds(self, n_folds=10, shuffle=True, stratified=False):
         """Create shuffled train-test folds which can be accessed via :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.get_fold()`.
 
         Split the data into n folds (for usage in KFold validaten etc.).
@@ -857,6 +1424,10 @@ class HEPDataStorage(object):
         To get a certain fold (train-test pair), use
         :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.get_fold()`
 
+        The folds are stored as one fold-id per row (see
+        :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.get_fold_ids()`),
+        which can be given to other storages or functions to reuse them.
+
         Parameters
         ----------
         n_folds : int > 1
@@ -864,24 +1435,85 @@ class HEPDataStorage(object):
             example, a simple 2/3-1/3 split, just specify n_folds = 3 and
             just take one fold.
         shuffle : boolean or int
-            If True or int, shuffle the data before slicing.
+            If True or int, shuffle the data before slicing. If an int is
+            provided, it will be used as a seed.
+        stratified : boolean
+            If True, every fold gets the same number of rows of every target
+            class (up to one) and about the same sum of the weights.
         """
         if not n_folds > 1:
             raise ValueError("Number of folds has to be higher then 1")
 
-        self._fold_index = []
-
-        # split indices of shuffled list
         length = len(self)
-        temp_indeces = [int(round(length / n_folds)) * i for i in range(n_folds)]
-        temp_indeces.append(length)  # add last index. len(index) = n_folds + 1
+        if shuffle is False:
+            rand_state = None
+        elif isinstance(shuffle, int) and shuffle is not True:
+            rand_state = np.random.RandomState(shuffle)
+        else:
+            rand_state = np.random.RandomState(meta_config.randint())
+        fold_dtype = np.min_scalar_type(n_folds - 1)
+
+        if stratified:
+            fold_ids = np.empty(length, dtype=fold_dtype)
+            targets = self._get_targets_array(self._get_labels())
+            weights = None if dev_tool.is_in_primitive(self._weights, (None, 1)) else self._weights
+            if targets.ndim == 0:
+                classes = [np.arange(length, dtype=np.int64)]
+            else:
+                classes = [np.flatnonzero(targets == target) for target in np.unique(targets)]
+            for positions in classes:
+                if rand_state is not None:
+                    positions = rand_state.permutation(positions)
+                if weights is not None:
+                    # neighbours have similar weights and go to different folds
+                    positions = positions[np.argsort(weights.take(positions), kind='mergesort')]
+                n_blocks = -(-len(positions) // n_folds)
+                if rand_state is None:
+                    block_ids = np.tile(np.arange(n_folds), n_blocks)
+                else:  # every block of n_folds rows is a random permutation of the folds
+                    block_ids = np.argsort(rand_state.rand(n_blocks, n_folds), axis=1).ravel()
+                fold_ids[positions] = block_ids[:len(positions)]
+        else:
+            # split the (shuffled) rows into consecutive folds
+            fold_bounds = np.minimum(int(round(length / n_folds)) * np.arange(n_folds + 1), length)
+            fold_bounds[-1] = length  # the last fold gets the rest
+            fold_ids = np.repeat(np.arange(n_folds, dtype=fold_dtype), np.diff(fold_bounds))
+            if rand_state is not None:
+                rand_state.shuffle(fold_ids)
 
-        # get a copy of index and shuffle it if True
-        temp_index = copy.deepcopy(self._make_index())
-        if shuffle is not False:
-            random.shuffle(temp_index, random=meta_config.randfloat)
-        for i in range(n_folds):
-            self._fold_index.append(temp_index[temp_indeces[i]:temp_indeces[i + 1]])
+        self._fold_ids = fold_ids
+        self._n_folds = n_folds
+
+    def get_fold_ids(self):
+        """Return the fold of every row as an array or None if no folds have been created.
+
+        Return
+        ------
+        out : 1-D array of uint
+            The number of the fold (from 0 to n_folds - 1) of every row. It
+            can be set to another storage of the same length with
+            :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.set_fold_ids()`.
+        """
+        return None if self._fold_ids is None else self._fold_ids.copy()
+
+    def set_fold_ids(self, fold_ids, n_folds=None):
+        """Set the folds, one fold-id per row, e.g. from another storage.
+
+        Parameters
+        ----------
+        fold_ids : 1-D array-like of int
+            The number of the fold (from 0 to n_folds - 1) of every row.
+        n_folds : int > 1
+            The number of folds. If None, the highest fold-id + 1 is used.
+        """
+        fold_ids = np.asarray(fold_ids)
+        n_folds = int(fold_ids.max()) + 1 if n_folds is None else n_folds
+        if len(fold_ids) != len(self):
+            raise ValueError("fold_ids do not have the same length as the data")
+        if not n_folds > 1 or fold_ids.min() < 0 or fold_ids.max() >= n_folds:
+            raise ValueError("Invalid fold_ids or n_folds")
+        self._fold_ids = fold_ids.astype(np.min_scalar_type(n_folds - 1))
+        self._n_folds = n_folds
 
     def get_fold(self, fold):
         """Return the specified fold: train and test data as instance of :py:class:`~raredecay.tools.data_storage.HEPDataStorage`.
@@ -893,24 +1525,23 @@ class HEPDataStorage(object):
 
         Return
         ------
-        out : tuple(HEPDataStorage, HEPDataStorage)
-            Return the *train* and the *test* data in a HEPDataStorage
+        out : tuple(HEPDataStorageView, HEPDataStorageView)
+            Return the *train* and the *test* data as views on the data
+            (no copies), see
+            :py:class:`~raredecay.tools.data_storage.HEPDataStorageView`
         """
-        assert self._fold_index is not None, "Tried to get a fold but data has no folds." + \
-                                             " First create them (make_folds())"
-        assert isinstance(fold, int) and fold < len(self._fold_index), "Value of fold is invalid"
-        train_index = []
-        for i, index_slice in enumerate(self._fold_index):
-            if i == fold:
-                test_index = copy.deepcopy(index_slice)
-            else:
-                train_index += copy.deepcopy(index_slice)
-        n_folds = len(self._fold_index)
-        test_DS = self.copy_storage(index=test_index)
+        assert self._fold_ids is not None, "Tried to get a fold but data has no folds." + \
+                                           " First create them (make_folds())"
+        assert isinstance(fold, int) and fold < self._n_folds, "Value of fold is invalid"
+        test_mask = self._fold_ids == fold
+        test_rows = np.flatnonzero(test_mask)
+        train_rows = np.flatnonzero(~test_mask)
+        n_folds = self._n_folds
+        test_DS = HEPDataStorageView(self, rows=test_rows)
         test_DS._fold_status = (fold, n_folds)
         # + 1 human-readable
         test_DS.fold_name = "test set fold " + str(fold + 1) + " of " + str(n_folds)
-        train_DS = self.copy_storage(index=train_index)
+        train_DS = HEPDataStorageView(self, rows=train_rows)
         train_DS._fold_status = (fold, n_folds)
         train_DS.fold_name = "train set fold " + str(fold + 1) + " of " + str(n_folds)
         return train_DS, test_DS
@@ -923,7 +1554,7 @@ class HEPDataStorage(object):
         out : int
             The number of folds which are currently available.
         """
-        return 0 if self._fold_index is None else len(self._fold_index)
+        return 0 if self._fold_ids is None else self._n_folds
 
     def plot_correlation(self, second_storage=None, figure=None, columns=None,
                          method='pearson', plot_importance=5):
@@ -953,6 +1584,7 @@ class HEPDataStorage(object):
         out : pandas DataFrame
             Return the feature-correlations in a pandas DataFrame
         """
+        import seaborn as sns
         from statsmodels.stats.weightstats import DescrStatsW
         columns = self.columns if columns is None else columns
 
@@ -962,10 +1594,12 @@ class HEPDataStorage(object):
         data, _tmp, weights = self.make_dataset(second_storage=second_storage,
                                                 shuffle=True, columns=columns)
         del _tmp
-        out.save_fig(figure, importance=plot_importance)
         ds = DescrStatsW(data.as_matrix(), weights=weights)
         correlation = ds.cov
         correlation = data.corr(method=method)
+        if not out.plots_needed(importance=plot_importance):
+            return correlation
+        out.save_fig(figure, importance=plot_importance)
         corr_plot = sns.heatmap(correlation.T)
 
         corr_plot.set_title("Correlation of " + data_name)
@@ -982,7 +1616,7 @@ class HEPDataStorage(object):
     def plot(self, figure=None, columns=None, index=None, title=None, sub_title=None,
              data_name=None, bins=None, log_y_axes=False, plot_range=None, x_label=None,
              y_label="probability density", sample_weights=None, importance=3,
-             see_all=False, hist_settings=None, figure_kwargs=None):
+             see_all=False, hist_settings=None, figure_kwargs=None, chunk_size=None):
         """Draw histograms of the data.
 
         .. warning:: Only 99.98% of the newest plotted data will be shown to focus
@@ -1027,15 +1661,30 @@ class HEPDataStorage(object):
         hist_settings : dict
             A dictionary containing the settings as keywords for the
             :py:func:`~matplotlib.pyplot.hist()` function.
+        chunk_size : int > 0
+            Without *index* and *sample_weights*, the data is histogrammed in
+            chunks of this size instead of loading all columns at once. If
+            None, :py:const:`~raredecay.meta_config.CHUNK_SIZE` is used.
+            The ranges and histograms are cached, so plotting the same
+            storage again (e.g. in another figure) only draws the bins.
 
+        Return
+        ------
+        out : :py:class:`~matplotlib.figure.Figure` or None
+            The figure or, if no plot is needed (see
+            :py:meth:`~raredecay.tools.output.OutputHandler.plots_needed`),
+            None.
         """
+        import matplotlib.pyplot as plt
+
 # ==============================================================================
 #        initialize values
 # ==============================================================================
-        if sample_weights is None:
-            sample_weights = self._get_weights(index=index)
-            if dev_tool.is_in_primitive(sample_weights, 1):
-                sample_weights = None
+        if not out.plots_needed(importance=importance):
+            return None  # nothing would be shown or saved
+        chunk_size = meta_config.CHUNK_SIZE if chunk_size is None else chunk_size
+        # only the histograms of the whole storage (with its weights) are cached
+        use_cache = index is None and sample_weights is None
         figure_kwargs = {} if figure_kwargs is None else figure_kwargs
 
         # update hist_settings
@@ -1049,9 +1698,20 @@ class HEPDataStorage(object):
             hist_settings['range'] = plot_range
 
         # create data
-        data_plot = self.pandasDF(columns=columns, index=index)
-        columns = data_plot.columns.values
-        self.logger.debug("plot columns from pandasDataFrame: " + str(columns))
+        data_columns = self.columns if columns is None else data_tools.to_list(columns)
+        columns = [self.column_alias.get(col, col) for col in data_columns]
+        if use_cache:
+            col_arrays = weights = None  # read chunk by chunk, only if not cached
+        else:
+            rows = self._rows if index is None else self._rows.take(self._get_positions(list(index)))
+            col_arrays = self._get_column_arrays(data_columns, rows)
+            if sample_weights is None:
+                sample_weights = self._get_weights(index=index)
+            if dev_tool.is_in_primitive(sample_weights, (None, 1)):
+                weights = None
+            else:
+                weights = np.asarray(sample_weights, dtype='f8')
+        self.logger.debug("plot columns: " + str(columns))
 
         # set the right number of rows and columns for the subplot
         subplot_col = int(math.ceil(math.sqrt(len(columns))))
@@ -1084,27 +1744,49 @@ class HEPDataStorage(object):
 # ==============================================================================
 #       Start plotting
 # ==============================================================================
+        # only plot in range x_limits, otherwise the plot is too big
+        x_limits_cols = []
+        for col_id, column in enumerate(columns):
+            x_limits = self.__figure_dic.get(figure).get(column)
+            if dev_tool.is_in_primitive(x_limits, None) or see_all:
+                if use_cache:
+                    lower, upper = self._get_column_range(data_columns[col_id], chunk_size)
+                else:
+                    lower, upper = _percentile_range(col_arrays[col_id])
+                if dev_tool.is_in_primitive(x_limits, None):
+                    x_limits = (lower, upper)
+                else:  # see_all: choose the maximum range. Bins not nicely overlapping.
+                    x_limits = (min(x_limits[0], lower), max(x_limits[1], upper))
+            if 'range' in hist_settings:
+                x_limits = hist_settings.pop('range')
+            self.__figure_dic[figure].update({column: x_limits})
+            x_limits_cols.append(x_limits)
+
+        # the histograms of all columns, filled in one pass over the data
+        n_bins = hist_settings['bins']
+        uniform_bins = isinstance(n_bins, (int, long, np.integer))
+        if uniform_bins:
+            bin_edges = [np.linspace(low, high, n_bins + 1) for low, high in x_limits_cols]
+        else:
+            bin_edges = [np.asarray(n_bins, dtype='f8')] * len(columns)
+        if use_cache:
+            bin_counts = self._get_histograms(data_columns, bin_edges, uniform_bins, chunk_size)
+        else:
+            bin_counts = [_bin_counts(array, edges, weights, uniform_bins)
+                          for array, edges in zip(col_arrays, bin_edges)]
+
         # plot the distribution column by column
         for col_id, column in enumerate(columns, 1):
             # create sub title
             sub_title_tmp = column if sub_title is None else sub_title
             x_label = "" if x_label is None else x_label
 
-            # only plot in range x_limits, otherwise the plot is too big
-            x_limits = self.__figure_dic.get(figure).get(column)
-            lower, upper = np.percentile(np.hstack(data_plot[column]),
-                                         [0.01, 99.99])
-            if dev_tool.is_in_primitive(x_limits, None):
-                x_limits = (lower, upper)
-            elif see_all:  # choose the maximum range. Bins not nicely overlapping.
-                x_limits = (min(x_limits[0], lower), max(x_limits[1], upper))
-            if 'range' in hist_settings:
-                x_limits = hist_settings.pop('range')
-            self.__figure_dic[figure].update({column: x_limits})
-
+            # draw the precomputed bins: one entry per bin, weighted with the bin content
             plt.subplot(subplot_row, subplot_col, col_id)
-            plt.hist(data_plot[column], weights=sample_weights, log=log_y_axes,
-                     range=x_limits, label=label_name, **hist_settings)
+            edges = bin_edges[col_id - 1]
+            plt.hist(edges[:-1], weights=bin_counts[col_id - 1], log=log_y_axes,
+                     range=x_limits_cols[col_id - 1], label=label_name,
+                     **dict(hist_settings, bins=edges))
 
             # set labels, titles...
             plt.title(sub_title_tmp)
@@ -1179,6 +1861,8 @@ class HEPDataStorage(object):
         out : figure
             Return the figure
         """
+        import matplotlib.pyplot as plt
+
         # TODO: make nice again
         out_figure = out.save_fig(figure)
         weights = self.get_weights()
@@ -1196,6 +1880,68 @@ class HEPDataStorage(object):
 
 # TODO: add correlation matrix
 
+
+class HEPDataStorageView(HEPDataStorage):
+    """A HEPDataStorage using the data of another storage without copying it.
+
+    The view shares the data (the DataFrame or the root-dict) of the storage
+    it was created from and only holds its own index and weights (a single
+    column). The targets are shared as well until they are set: then the view
+    gets its own ones and the original storage is not affected.
+    Like a copy, the weights of the view are normalized (to a mean of 1).
+
+    Views are returned for example by
+    :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.get_fold()`.
+
+    Parameters
+    ----------
+    storage : :py:class:`~raredecay.tools.data_storage.HEPDataStorage`
+        The storage to take the data from.
+    index : |index_type|
+        The indices of the rows of *storage* to use.
+    rows : 1-D array of int
+        Instead of the *index*, the positions of the rows in *storage*
+        (from 0 to len(storage) - 1) can be given. This is faster.
+    add_to_name : str
+        An addition to the data_name_addition of the view.
+    """
+
+    def __init__(self, storage, index=None, rows=None, add_to_name=" cp"):
+        # do not call HEPDataStorage.__init__, it would copy the data
+        self.logger = storage.logger
+        self.cache_dir = storage.cache_dir
+        self._data_type = storage.data_type
+        # a shallow copy of a root-dict, the selection may be changed
+        self._data = dict(storage.data) if self._data_type == 'root' else storage.data
+        self.column_alias = dict(storage.column_alias)
+        self._fold_ids = None
+        self._n_folds = 0
+        self._fold_status = None
+        if rows is None:
+            self._index = np.asarray(index)
+            rows = storage._get_positions(self._index)
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            self._index = storage._get_labels().take(rows)
+        self._rows = storage._rows.take(rows)
+        self._label_map = None
+        self._version = 0
+        self._hist_cache = {}
+        self._length = len(self._index)
+        self._columns = list(storage.columns)
+        self._name = [storage.data_name, storage.data_name_addition + add_to_name, ""]
+
+        self._target = storage._target
+        self._weights = storage._weights
+        if not dev_tool.is_in_primitive(self._weights, (None, 1)):
+            # one column only, normalized like for a copy
+            self._weights = storage._get_weights_array(positions=rows)
+        self._weights_stats = None
+
+        self.hist_settings = storage.hist_settings
+        self.supertitle_fontsize = storage.supertitle_fontsize
+
+
 #if __name__ == '__main__':
 #
 #    n_tested = 0
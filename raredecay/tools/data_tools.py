@@ -16,17 +16,13 @@ import pandas as pd
 import numpy as np
 import cPickle as pickle
 
-try:
-    from root_numpy import root2array, array2root
-except ImportError:
-    warnings.warn("could not import from root_numpy!")
-
 
 # both produce error (27.07.2016) when importing them if run from main.py.
 # No problem when run as main...
 
 # from raredecay.tools import dev_tool
 from raredecay import meta_config
+from raredecay.tools.root_cache import branch_cache
 
 
 def apply_cuts(signal_data, bkg_data, percent_sig_to_keep=100, bkg_length=None):
@@ -89,8 +85,7 @@ def add_to_rootfile(rootfile, new_branch, branch_name=None, overwrite=True):
     branch_name : str
         The name of the branche resp. the name in the dtype of the array.
     """
-    # from root_numpy import root2array, array2tree
-
+    from root_numpy import array2root
     from rootpy.io import root_open
     from ROOT import TObject
     # get the right parameters
@@ -284,7 +279,8 @@ def to_ndarray(data_in, float_array=True):
         The data to be converted
     """
     if is_root(data_in):
-        data_in = root2array(**data_in)  # why **? it's a root dict
+        # only the first branch is used, like the first field of a record array
+        data_in = branch_cache.get(data_in).values()[0]
     # change numpy.void to normal floats
     if isinstance(data_in, (pd.Series, pd.DataFrame)):
         test_sample = data_in.iloc[0]
@@ -329,7 +325,12 @@ def to_pandas(data_in, index=None, columns=None):
         The data to be converted
     """
     if is_root(data_in):
-        data_in = root2array(**data_in)  # why **? it's a root dict
+        from raredecay.tools.dev_tool import profile_stage
+
+        if isinstance(columns, str):
+            columns = [columns]
+        with profile_stage("data_tools.to_pandas (ROOT read)"):
+            data_in = pd.DataFrame(branch_cache.get(data_in), index=index, columns=columns)
     if is_list(data_in):
         data_in = np.array(data_in)
     if is_ndarray(data_in):
@@ -8,9 +8,20 @@ Contains several useful tools for all kind of programs
 """
 from __future__ import division, absolute_import
 
+import os
+import time
+import functools
+import contextlib
+import threading
+import collections
+
 import pandas as pd
 import numpy as np
-import collections
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 from raredecay import meta_config
 
@@ -246,3 +257,105 @@ def play_sound(duration=0.3, frequency=440):
     freq = frequency
     import os
     os.system('play --no-show-progress --null --channels 1 synth %s sine %f' % (duration, freq))
+
+
+# ==============================================================================
+#  Profiling of the (expensive) stages of a run
+# ==============================================================================
+
+# name of the stage -> [calls, total wall time, max wall time, total cpu time, max peak-RSS delta]
+_profile_stats = collections.OrderedDict()
+_profile_lock = threading.Lock()  # stages can be profiled from several threads
+
+
+def _peak_rss():
+    """Return the peak resident set size of the process in MB (0 if unknown)."""
+    if resource is None:
+        return 0.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.  # in kB on Linux
+
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """Record the wall time, cpu time and peak RSS increase of a stage.
+
+    The measurements are aggregated per name, see
+    :py:func:`~raredecay.tools.dev_tool.get_profile`. Nested stages are
+    recorded independently. Does nothing if
+    :py:const:`~raredecay.meta_config.PROFILE_STAGES` is False.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage.
+
+    Examples
+    --------
+    >>> with profile_stage("read data"):
+    ...     data = storage.pandasDF()
+    """
+    if not meta_config.PROFILE_STAGES:
+        yield
+        return
+    rss_start = _peak_rss()
+    cpu_start = sum(os.times()[:2])
+    wall_start = time.time()
+    try:
+        yield
+    finally:
+        wall_time = time.time() - wall_start
+        cpu_time = sum(os.times()[:2]) - cpu_start
+        rss_delta = _peak_rss() - rss_start
+        with _profile_lock:
+            stats = _profile_stats.setdefault(name, [0, 0., 0., 0., 0.])
+            stats[0] += 1
+            stats[1] += wall_time
+            stats[2] = max(stats[2], wall_time)
+            stats[3] += cpu_time
+            stats[4] = max(stats[4], rss_delta)
+
+
+def profiled(name=None):
+    """Decorator to profile every call of a function as a stage.
+
+    Parameters
+    ----------
+    name : str or None
+        The name of the stage. If None, the name of the function is used.
+    """
+    def decorator(function):
+        stage_name = function.__name__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_profile():
+    """Return the aggregated measurements of all profiled stages.
+
+    Return
+    ------
+    out : pandas DataFrame
+        One row per stage with the columns *calls*, *total [s]*, *mean [s]*,
+        *max [s]*, *cpu [s]* and *peak RSS increase [MB]*, sorted by the
+        total wall time.
+    """
+    columns = ['calls', 'total [s]', 'mean [s]', 'max [s]', 'cpu [s]',
+               'peak RSS increase [MB]']
+    with _profile_lock:
+        snapshot = [(name, list(stats)) for name, stats in _profile_stats.iteritems()]
+    rows = [[calls, total, total / calls, max_time, cpu, rss]
+            for _, (calls, total, max_time, cpu, rss) in snapshot]
+    profile = pd.DataFrame(rows, index=[name for name, _ in snapshot], columns=columns)
+    return profile.sort_values('total [s]', ascending=False)
+
+
+def reset_profile():
+    """Remove all the measurements of the profiled stages."""
+    with _profile_lock:
+        _profile_stats.clear()
+
@@ -33,6 +33,7 @@ from rep.report import ClassificationReport
 
 from raredecay import globals_
 from raredecay.tools import dev_tool
+from raredecay.tools.cpu_budget import cpu_budget
 from raredecay import meta_config
 
 import importlib
@@ -247,12 +248,12 @@ class Mayou(Classifier):
             self._factory.add_classifier(key, val)
 
         # parallel on factory level -> good mixture of clfs (one uses lot of RAM, one cpu...)
-        parallel_profile = 'threads-' + str(min([len(self._factory.items()),
-                                                 globals_.free_cpus()]))
+        with cpu_budget.lease(n_cpu=len(self._factory.items()), name="Mayou factory") as n_cpu:
+            parallel_profile = 'threads-' + str(n_cpu)
 
-        # fit all classifiers
-        print "start fitting factory"
-        self._factory.fit(X, y, sample_weight, parallel_profile=parallel_profile)
+            # fit all classifiers
+            print "start fitting factory"
+            self._factory.fit(X, y, sample_weight, parallel_profile=parallel_profile)
 
         return self
 
@@ -11,14 +11,75 @@ import warnings
 import timeit
 import time
 import cStringIO as StringIO
-import copy
+import multiprocessing
 
-import matplotlib.pyplot as plt
 import cPickle as pickle
-import seaborn as sns
 
 from raredecay import meta_config
 from raredecay.tools import dev_tool  # , data_tools
+from raredecay.tools.root_cache import branch_cache
+
+# matplotlib and seaborn are slow to import, they are imported (and the plotting
+# style is set) with the first figure.
+
+
+def _init_figure_worker():
+    """Use the (non-interactive) Agg backend in a process rendering figures."""
+    import matplotlib.pyplot as plt
+
+    plt.switch_backend('Agg')
+
+
+def _figure_targets(path, fig_name, file_formats, save_cfg=None):
+    """Return the (file_name, extension, save_cfg) to save a figure to.
+
+    The creation date is not written to PDFs, so a figure rendered by a
+    worker is byte-identical to the one rendered in this process (and to
+    the one of an earlier run).
+    """
+    targets = []
+    for extension in file_formats:
+        target_cfg = dict(save_cfg or {})
+        if extension == 'pdf':
+            target_cfg.setdefault('metadata', {'CreationDate': None})
+        targets.append((path + extension + '/' + fig_name + "." + extension, extension,
+                        target_cfg))
+    return targets
+
+
+def _save_figure(figure, targets):
+    """Save a figure to every (file_name, extension, save_cfg) in targets.
+
+    Return
+    ------
+    out : list((str, str))
+        The file names which could not be saved together with the error.
+    """
+    failures = []
+    for file_name, extension, save_cfg in targets:
+        try:
+            figure.savefig(file_name, format=extension, **save_cfg)
+        except Exception as error:
+            failures.append((file_name, repr(error)))
+    return failures
+
+
+def _render_figure(task):
+    """Unpickle a figure and save it, used in the worker processes.
+
+    Return the name of the figure and the failures, see
+    :py:func:`~raredecay.tools.output._save_figure`.
+    """
+    import matplotlib.pyplot as plt
+
+    fig_name, pickled_figure, targets = task
+    try:
+        figure = pickle.loads(pickled_figure)
+    except Exception as error:
+        return fig_name, [(fig_name, repr(error))]
+    failures = _save_figure(figure, targets)
+    plt.close(figure)
+    return fig_name, failures
 
 
 class OutputHandler(object):
@@ -33,9 +94,12 @@ class OutputHandler(object):
     def __init__(self):
         """Initialize an output handler"""
 
-        self.output = ""
-        self.end_output = ""
-        self._loud_end_output = ""
+        self._output = []  # the output not (yet) written to the results file
+        self._output_file = None
+        self._output_file_name = None
+        self._output_tail = ""  # the end of the output, to enforce new lines
+        self._end_output = []
+        self._loud_end_output = []
         self._IO_string = ""
         self.logger = None
         self._logger_cfg = None
@@ -49,15 +113,18 @@ class OutputHandler(object):
         self._figures = {}
         self._formats_used = set([])
         self._pickle_folder = False
+        self._spec_folder = False
+        self._figure_folders = set([])
+        self._figure_pool = None
+        self._pending_figures = []
+        self._n_figures = 0
+        self._n_figures_done = 0
+        self._plot_style_set = False
 
         # start timer and log current time
         self._start_timer = timeit.default_timer()
         self._start_time = time.strftime("%c")
 
-        # set plotting style
-        sns.set_context("poster")
-        plt.rc('figure', figsize=(20, 20))
-
         setattr(self, 'print', self._print)
 
     def _check_initialization(self, return_error=False):
@@ -142,6 +209,15 @@ class OutputHandler(object):
             subprocess.call(['mkdir', '-p', self._output_path + value])
         subprocess.call(['touch', self._output_path + 'run_NOT_finished'])  # show that ongoing run
 
+        # the output is written to the results file while running
+        self._output_file_name = (self._output_path + self._output_folders.get('results') +
+                                  '/output.txt')
+        try:
+            self._open_output_file()
+        except IOError:
+            warnings.warn("Could not open the output file, the output is kept in memory",
+                          RuntimeWarning)
+
         # set meta-config variables
         meta_config.set_parallel_profile(n_cpu=meta_config.n_cpu_max,
                                          gpu_in_use=meta_config.use_gpu)
@@ -165,6 +241,50 @@ class OutputHandler(object):
             run_name += " " + temp_add if temp_add != "" else ""
         self._run_name = str(run_name)
 
+    @property
+    def output(self):
+        """The output collected so far (read back from the results file if saved)."""
+        if self._output_file is None:
+            return "".join(self._output)
+        self._output_file.flush()
+        with open(self._output_file_name) as output_file:
+            return output_file.read() + "".join(self._output)
+
+    @property
+    def end_output(self):
+        """The output which will be added again at the end of the run."""
+        return "".join(self._end_output)
+
+    def _open_output_file(self):
+        """Open the results file and write the output collected so far to it."""
+        self._output_file = open(self._output_file_name, 'w')
+        output = "".join(self._output).lstrip("\n")  # remove leading blank lines
+        self._output = []
+        self._output_file.write(output)
+        self._output_file.flush()
+
+    def _write_output(self, text):
+        """Add text to the output. If it is saved, the text goes to the results file.
+
+        The file is flushed after every call, so the output of a crashed run
+        stays on disk.
+        """
+        if not text:
+            return
+        tail = text[-1]
+        if not self._output_tail:
+            text = text.lstrip("\n")  # remove leading blank lines
+        if self._output_file is None:
+            self._output.append(text)
+        else:
+            try:
+                self._output_file.write(text)
+                self._output_file.flush()
+            except (IOError, ValueError):
+                self._output.append(text)
+                meta_config.error_occured()
+        self._output_tail = tail
+
     def get_logger_path(self):
         """Return the path for the log folder."""
         if self._save_output:
@@ -220,24 +340,63 @@ class OutputHandler(object):
         self.add_output(self._IO_string.getvalue(), importance=importance, **add_output_kwarg)
         return self._IO_string.getvalue()
 
+    def plots_needed(self, importance=3):
+        """Return whether a figure of a certain importance will be saved or shown.
+
+        Use it to skip drawing (and computing the curves for) figures that
+        would be thrown away anyway.
+
+        Parameters
+        ----------
+        importance : {0, 1, 2, 3, 4, 5}
+            The importance of the figure, see
+            :py:meth:`~raredecay.tools.output.OutputHandler.save_fig`.
+
+        Return
+        ------
+        out : boolean
+            False if :py:const:`~raredecay.meta_config.NO_PLOTS` is True or if
+            the output is not saved and the plot_verbosity hides the figure.
+        """
+        if meta_config.NO_PLOTS:
+            return False
+        return self._save_output or 5 - round(importance) < meta_config.plot_verbosity
+
+    def _set_plot_style(self):
+        """Import matplotlib and seaborn and set the plotting style (once)."""
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
+        if not self._plot_style_set:
+            sns.set_context("poster")
+            plt.rc('figure', figsize=(20, 20))
+            self._plot_style_set = True
+        return plt
+
     def figure(self, *args, **kwargs):
         """FUTURE: Wrapper around save_fig()."""
         return self.save_fig(*args, **kwargs)
 
-    def save_fig(self, figure, importance=3, file_format=None, to_pickle=True,
+    def save_fig(self, figure, importance=3, file_format=None, to_pickle=None, to_spec=True,
                  figure_kwargs=None, **save_cfg):
         """Advanced :py:meth:`matplotlib.pyplot.figure()`. Create and save a
         certain figure at the end of the run.
 
         To create and save a figure, you just enter an already created or a new
         figure as a Parameters and specify the fileformats it should be saved
-        to. The figure can also be pickled so that it can be re-plotted
-        anytime.
+        to. The content of the figure is saved as a plot spec (see
+        :py:mod:`~raredecay.tools.plot_spec`) so that it can be re-plotted
+        anytime. The figure can also be pickled.
 
 
         .. note:: The figure will be saved at the end of the run
             (by calling :py:meth:`~raredecay.tools.output.OutputHandler.finalize`)
             so any change you make until the end will be applied to the plot.
+            If :py:const:`~raredecay.meta_config.EAGER_FIGURES` is True, the
+            figures registered before are saved (in the background) and closed
+            already when a new figure is requested (only then, not when a
+            function returns), see
+            :py:meth:`~raredecay.tools.output.OutputHandler.flush_figures`.
 
         Parameters
         ----------
@@ -254,8 +413,15 @@ class OutputHandler(object):
         file_format : str or list(str, str, str,...)
             The ending of the desired format, example: 'png' (default).
             If you don't want to save it, enter a blank list.
-        to_pickle : boolean
-            If True, the plot will be saved to a pickle file.
+        to_pickle : boolean or None
+            If True, the plot will be saved to a pickle file. If None, the
+            *to_pickle* of :py:const:`~raredecay.meta_config.DEFAULT_SAVE_FIG`
+            is used, which is False: the plots used to be pickled by default,
+            set it to True to get the pickles back.
+        to_spec : boolean
+            If True, the content of the plot will be saved as a plot spec
+            (NPZ-file), which can be re-rendered with
+            :py:func:`~raredecay.tools.plot_spec.replot`.
         **save_cfg : keyword args
             Will be used as arguments in :py:func:`~matplotlib.pyplot.savefig()`
 
@@ -266,9 +432,19 @@ class OutputHandler(object):
         """
         plot = 5 - round(importance) < meta_config.plot_verbosity  # to plot or not to plot
         figure_kwargs = {} if figure_kwargs is None else figure_kwargs
+        if meta_config.NO_PLOTS:
+            return figure
+        plt = self._set_plot_style()
 
         if self._save_output:
+            if meta_config.EAGER_FIGURES:
+                label = figure if isinstance(figure, str) else None
+                label = figure.get_label() if hasattr(figure, 'get_label') else label
+                self.flush_figures(keep=label)
+            if to_pickle is None:
+                to_pickle = meta_config.DEFAULT_SAVE_FIG['to_pickle']
             self._pickle_folder = self._pickle_folder or to_pickle
+            self._spec_folder = self._spec_folder or to_spec
             if isinstance(figure, (int, str)):
                 figure = plt.figure(figure, **figure_kwargs)  # TODO: changeable?
 
@@ -286,7 +462,8 @@ class OutputHandler(object):
 
             # add figure to dict for later output to file
             figure_dict = {'figure': figure, 'file_format': file_format,
-                           'to_pickle': to_pickle, 'plot': plot, 'save_cfg': save_cfg}
+                           'to_pickle': to_pickle, 'to_spec': to_spec, 'plot': plot,
+                           'save_cfg': save_cfg}
             self._figures[figure.get_label()] = figure_dict
         else:
             self._check_initialization()
@@ -295,54 +472,171 @@ class OutputHandler(object):
 
         return figure
 
-    def _figure_to_file(self):
-        """Write all figures from the _figures dictionary to file."""
+    def flush_figures(self, keep=None):
+        """Save the registered figures to file and close them.
 
-        # check if there are figures to plot, else return
-        if self._figures == {}:
-            self.logger.info("_figure_to_file called but nothing to save/plot")
-            return None
+        The figures are pickled and rendered in the background by a pool of
+        :py:const:`~raredecay.meta_config.FIGURE_WORKERS` processes (with the
+        Agg backend). With one worker, they are rendered one by one in this
+        process. The files are the same in both cases (PNG and PDF, as no
+        creation date is written). Only the figures which will be plotted
+        stay open.
+
+        Called by :py:meth:`~raredecay.tools.output.OutputHandler.save_fig`
+        if :py:const:`~raredecay.meta_config.EAGER_FIGURES` is True. Call it
+        explicitly to flush the figures at another point, e.g. when a
+        function that plotted returns.
+
+        .. note:: Changes made to a figure after it has been flushed won't
+            be saved anymore.
 
-        # create folders if they don't exist already
+        Parameters
+        ----------
+        keep : str or None
+            The label of a figure which is not flushed (e.g. because it is
+            about to be drawn).
+        """
+        if not self._save_output:
+            return
+
+        figures = dict((label, fig_dict) for label, fig_dict in self._figures.iteritems()
+                       if label != keep)
+        if figures:
+            import matplotlib.pyplot as plt
+            from raredecay.tools.plot_spec import save_plot_spec
+
+            path = self._make_figure_folders()
+            n_workers = 1
+            if meta_config.MULTIPROCESSING:
+                n_workers = meta_config.get_n_cpu(meta_config.FIGURE_WORKERS)
+            parallel = n_workers > 1 and (meta_config.EAGER_FIGURES or len(figures) > 1)
+
+            for label, fig_dict in figures.iteritems():
+                del self._figures[label]
+                self._n_figures += 1
+                fig_name = label
+                for char in self._REPLACE_CHAR:
+                    fig_name = fig_name.replace(char, "_")
+                figure = fig_dict.get('figure')
+                targets = _figure_targets(path, fig_name, fig_dict.get('file_format'),
+                                          fig_dict.get('save_cfg'))
+
+                if fig_dict.get('to_spec'):
+                    file_name = (path + meta_config.PLOT_SPEC_DATATYPE + '/' +
+                                 fig_name + "." + meta_config.PLOT_SPEC_DATATYPE)
+                    try:
+                        save_plot_spec(figure, str(file_name))
+                    except Exception as error:
+                        self.logger.error("Could not save the plot spec " + str(file_name) +
+                                          ": " + repr(error))
+                        meta_config.error_occured()
+
+                # pickle the figure, the pickled figure is also sent to the workers
+                pickled_figure = None
+                if fig_dict.get('to_pickle') or parallel:
+                    try:
+                        pickled_figure = pickle.dumps(figure, meta_config.PICKLE_PROTOCOL)
+                    except:
+                        pickled_figure = None
+                if fig_dict.get('to_pickle'):
+                    file_name = (path + meta_config.PICKLE_DATATYPE + '/' +
+                                 fig_name + "." + meta_config.PICKLE_DATATYPE)
+                    try:
+                        if pickled_figure is None:
+                            raise pickle.PicklingError("Could not pickle the figure")
+                        with open(str(file_name), 'wb') as f:
+                            f.write(pickled_figure)
+                    except:
+                        self.logger.error("Could not open file" + str(file_name) +
+                                          " OR pickle the figure to it")
+                        meta_config.error_occured()
+
+                # save figures to file
+                if parallel and pickled_figure is not None and targets:
+                    if self._figure_pool is None:
+                        n_processes = n_workers
+                        if not meta_config.EAGER_FIGURES:
+                            n_processes = min(n_workers, len(figures))
+                        self._figure_pool = multiprocessing.Pool(n_processes,
+                                                                 initializer=_init_figure_worker)
+                    self._pending_figures.append(self._figure_pool.apply_async(
+                        _render_figure, ((fig_name, pickled_figure, targets),)))
+                else:
+                    self._report_figure_progress(_save_figure(figure, targets))
+
+                # delete if it is not intended to be plotted
+                if not fig_dict.get('plot'):
+                    plt.close(figure)
+
+        self._collect_figures(wait=False)
+
+    def _make_figure_folders(self):
+        """Create the folders for the figures if they don't exist already.
+
+        Return
+        ------
+        out : str
+            The path of the plots folder.
+        """
         path = self.get_plots_path()
-        for format_ in self._formats_used:
+        folders = set(self._formats_used)
+        if self._pickle_folder:
+            folders.add(meta_config.PICKLE_DATATYPE)
+        if self._spec_folder:
+            folders.add(meta_config.PLOT_SPEC_DATATYPE)
+        for format_ in folders - self._figure_folders:
             assert isinstance(format_, str), "Format is not a string: " + str(format_)
             subprocess.call(['mkdir', '-p', path + format_])
-        if self._pickle_folder:
-            subprocess.call(['mkdir', '-p', path + meta_config.PICKLE_DATATYPE])
-
-        # save figures to file
-        for fig_name, fig_dict in self._figures.iteritems():
-            for char in self._REPLACE_CHAR:
-                fig_name = fig_name.replace(char, "_")
-            for extension in fig_dict.get('file_format'):
-                file_path = path + extension + '/'
-                file_name = file_path + fig_name + "." + extension
-                try:
-                    figure_tmp = fig_dict['figure']
-#                    figure_tmp.tight_layout()
-                    figure_tmp.savefig(file_name, format=extension,
-                                       **fig_dict.get('save_cfg'))
-                except:
-                    self.logger.error("Could not save figure" + str(figure_tmp))
-                    meta_config.error_occured()
+        self._figure_folders.update(folders)
+        return path
+
+    def _collect_figures(self, wait=False):
+        """Report the figures rendered by the workers.
 
-            if fig_dict.get('to_pickle'):
-                file_name = (path + meta_config.PICKLE_DATATYPE + '/' +
-                             fig_name + "." + meta_config.PICKLE_DATATYPE)
+        Parameters
+        ----------
+        wait : boolean
+            If True, wait for all figures to be rendered and close the pool.
+        """
+        pending = []
+        for result in self._pending_figures:
+            if wait or result.ready():
                 try:
-                    with open(str(file_name), 'wb') as f:
-                        pickle.dump(fig_dict.get('figure'), f, meta_config.PICKLE_PROTOCOL)
-                except:
-                    self.logger.error("Could not open file" + str(file_name) +
-                                      " OR pickle the figure to it")
-                    meta_config.error_occured()
+                    fig_name, failures = result.get()
+                except Exception as error:
+                    failures = [("(unknown)", repr(error))]
+                self._report_figure_progress(failures)
+            else:
+                pending.append(result)
+        self._pending_figures = pending
 
-            # delete if it is not intended to be plotted
-            if not fig_dict.get('plot'):
-                plt.close(fig_dict.get('figure'))
-        # clear the _figures dict
-        self._figures = {}
+        if wait and self._figure_pool is not None:
+            self._figure_pool.close()
+            self._figure_pool.join()
+            self._figure_pool = None
+
+    @dev_tool.profiled("OutputHandler._figure_to_file")
+    def _figure_to_file(self):
+        """Write all (remaining) figures to file and wait until they are saved."""
+
+        # check if there are figures to plot, else return
+        if self._figures == {} and not self._pending_figures:
+            self.logger.info("_figure_to_file called but nothing to save/plot")
+            return None
+
+        self.flush_figures()
+        self._collect_figures(wait=True)
+
+    def _report_figure_progress(self, failures):
+        """Log the failures of a saved figure and the progress (every 10%)."""
+        self._n_figures_done += 1
+        for file_name, error in failures:
+            self.logger.error("Could not save figure " + str(file_name) + ": " + error)
+            meta_config.error_occured()
+        n_figures = self._n_figures
+        if self._n_figures_done == n_figures or self._n_figures_done % max(n_figures // 10, 1) == 0:
+            self.logger.info("Saved figures: " + str(self._n_figures_done) + " of " +
+                             str(n_figures))
 
     @staticmethod
     def _make_title(title, title_format):
@@ -436,7 +730,7 @@ class OutputHandler(object):
         temp_out = ""
 
         # enforce new line
-        if (len(self.output) > 0) and (not self.output.endswith("\n")):
+        if self._output_tail and not self._output_tail.endswith("\n"):
             temp_out = "\n" if force_newline else ""
 
         # set title, subtitle and section with title_format, subtitle_format...
@@ -465,11 +759,11 @@ class OutputHandler(object):
         # print and add to output collector
         if do_print:
             if to_end:
-                self._loud_end_output += temp_out
+                self._loud_end_output.append(temp_out)
             print temp_out  # ?? why was there sys.stdout.write?!?
         if to_end:
-            self.end_output += temp_out
-        self.output += temp_out
+            self._end_output.append(temp_out)
+        self._write_output(temp_out)
 
     def finalize(self, show_plots=True, play_sound_at_end=False):
         """Finalize the run. Save everything and plot.
@@ -492,8 +786,8 @@ class OutputHandler(object):
                         title="Different parameters", obj_separator=" : ", importance=2)
 
         # print the output which should be printed at the end of the run
-        sys.stdout.write(self._loud_end_output)
-        self.output += self.end_output
+        sys.stdout.write("".join(self._loud_end_output))
+        self._write_output(self.end_output)
 
         # add current version (if available)
         if self._save_output and os.path.isdir(meta_config.GIT_DIR_PATH):
@@ -519,7 +813,23 @@ class OutputHandler(object):
         self.add_output(["Warnings encountered during run", meta_config._warning_count],
                         obj_separator=" : ")
 
-        output = copy.deepcopy(self.output)
+        # cache information
+        cache_stats = branch_cache.stats()
+        if cache_stats['hits'] + cache_stats['misses'] > 0:
+            self.add_output(["ROOT branch cache (hits, misses, evictions, disk hits)",
+                             (cache_stats['hits'], cache_stats['misses'],
+                              cache_stats['evictions'], cache_stats['disk_hits'])],
+                            obj_separator=" : ", importance=2)
+        from raredecay.tools.cpu_budget import cpu_budget  # its logger needs globals_
+
+        budget_stats = cpu_budget.stats()
+        if budget_stats['n_leases'] > 0:
+            self.add_output(["CPU budget (leases, maximum cpus in use, cpus)",
+                             (budget_stats['n_leases'], budget_stats['max_used'],
+                              budget_stats['total'])],
+                            obj_separator=" : ", importance=2)
+
+        output = self.output
 
 # ==============================================================================
 #       save output to file
@@ -529,19 +839,30 @@ class OutputHandler(object):
             # save figures to file
             self._figure_to_file()
 
-            # Write output to file
+            # Write the profile of the run to file
             # ---------------------
+            profile = dev_tool.get_profile()
+            if len(profile):
+                profile_file = (self._output_path + self._output_folders.get('results') +
+                                '/profile.txt')
+                try:
+                    with open(profile_file, 'w') as f:
+                        f.write(profile.to_string(float_format=lambda x: "%.3f" % x))
+                except IOError:
+                    self.logger.error("Could not save the profile to file")
+                    meta_config.error_occured()
 
-            # remove leading blank lines
-            for i in xrange(1, 100):
-                if not self.output.startswith("\n" * i):  # "break" condition
-                    self.output = self.output[i - 1:]
-                    break
+            # Write output to file
+            # ---------------------
 
-            temp_out_file = self._output_path + self._output_folders.get('results') + '/output.txt'
+            # the output was written while running, only the leftovers remain
             try:
-                with open(temp_out_file, 'w') as f:
-                    f.write(self.output)
+                if self._output_file is None or self._output:
+                    if self._output_file is not None:
+                        self._output_file.close()
+                    self._output = [output]
+                    self._open_output_file()
+                self._output_file.close()
             except:
                 self.logger.error("Could not save output to file")
                 meta_config.error_occured()
@@ -571,7 +892,11 @@ class OutputHandler(object):
             # .finished shows if the run finished
             subprocess.call(['touch', path + 'run_finished_succesfully'])
 
-        self.output = self._loud_end_output = self.end_output = ""
+        self._output = []
+        self._end_output = []
+        self._loud_end_output = []
+        self._output_tail = ""
+        self._output_file = None
 
         if play_sound_at_end:
             try:
@@ -580,9 +905,10 @@ class OutputHandler(object):
             except:
                 print "BEEEEEP, no sound could be played"
 
-        if show_plots:
+        # if pyplot was never imported, there is no figure to show
+        if show_plots and 'matplotlib.pyplot' in sys.modules:
             if not meta_config.NO_PROMPT_ASSUME_YES:
                 raw_input(["Run finished, press Enter to show the plots"])
-            plt.show()
+            sys.modules['matplotlib.pyplot'].show()
 
         return output
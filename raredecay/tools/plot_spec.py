@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""Record the content of a figure as a compact plot spec and re-render it.
+
+A plot spec contains the data of the figure (line coordinates, histogram bars,
+polygons, scatter points, images and texts) and the decoration of the axes
+(titles, labels, limits, scales, ticks). It is saved as a NPZ-file: the
+arrays as members, the rest as a JSON string in the member *__spec__*. This
+is much smaller and faster to load than a pickled figure and does not depend
+on the matplotlib version.
+"""
+from __future__ import division, absolute_import
+
+import os
+import json
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.container import BarContainer
+from matplotlib.collections import PathCollection
+
+try:
+    from matplotlib.colors import to_rgba
+except ImportError:  # matplotlib < 2.0
+    from matplotlib.colors import colorConverter
+    to_rgba = colorConverter.to_rgba
+
+SPEC_VERSION = 1
+_SPEC_KEY = '__spec__'
+
+
+def _rgba(color):
+    """Return a color as a list of floats (or None)."""
+    if color is None:
+        return None
+    color = np.asarray(color)
+    if color.ndim == 2:
+        if len(color) == 0:
+            return None
+        color = color[0]
+    if color.dtype.kind in 'SU':
+        color = to_rgba(str(color))
+    return [float(value) for value in color]
+
+
+def _text(text):
+    """Return the string of a text (or None if it is empty)."""
+    text = text.get_text() if hasattr(text, 'get_text') else text
+    return text if text else None
+
+
+def _label(artist):
+    """Return the label of an artist or None for the ones hidden from a legend."""
+    label = artist.get_label()
+    return None if label is None or str(label).startswith('_') else label
+
+
+def figure_to_spec(figure):
+    """Extract the content of a figure.
+
+    Parameters
+    ----------
+    figure : :py:class:`matplotlib.figure.Figure`
+        The figure to extract the content from.
+
+    Return
+    ------
+    out : (dict, dict)
+        The JSON-serializable description of the figure and the arrays it
+        refers to by key.
+    """
+    arrays = {}
+
+    def add_array(name, values):
+        key = name + str(len(arrays))
+        arrays[key] = np.asarray(values)
+        return key
+
+    spec = {'version': SPEC_VERSION,
+            'label': figure.get_label(),
+            'size': [float(size) for size in figure.get_size_inches()],
+            'title': _text(figure._suptitle) if getattr(figure, '_suptitle', None) else None,
+            'axes': [], 'unsupported': []}
+
+    for ax in figure.axes:
+        ax_spec = {'position': [float(pos) for pos in ax.get_position().bounds],
+                   'title': _text(ax.get_title()), 'xlabel': _text(ax.get_xlabel()),
+                   'ylabel': _text(ax.get_ylabel()),
+                   'xlim': [float(lim) for lim in ax.get_xlim()],
+                   'ylim': [float(lim) for lim in ax.get_ylim()],
+                   'xscale': ax.get_xscale(), 'yscale': ax.get_yscale(),
+                   'legend': ax.get_legend() is not None,
+                   'xticks': add_array('xticks', ax.get_xticks()),
+                   'yticks': add_array('yticks', ax.get_yticks()),
+                   'xticklabels': [label.get_text() for label in ax.get_xticklabels()],
+                   'yticklabels': [label.get_text() for label in ax.get_yticklabels()],
+                   'artists': []}
+        artists = ax_spec['artists']
+
+        for line in ax.get_lines():
+            artists.append({'kind': 'line', 'label': _label(line),
+                            'x': add_array('x', line.get_xdata()),
+                            'y': add_array('y', line.get_ydata()),
+                            'color': _rgba(line.get_color()), 'alpha': line.get_alpha(),
+                            'linestyle': line.get_linestyle(),
+                            'linewidth': float(line.get_linewidth()),
+                            'marker': line.get_marker(), 'drawstyle': line.get_drawstyle()})
+
+        # bars (e.g. histograms) are stored as edges and heights, not as patches
+        bar_patches = set()
+        for container in ax.containers:
+            if not isinstance(container, BarContainer) or not len(container.patches):
+                continue
+            patches = container.patches
+            bar_patches.update(id(patch) for patch in patches)
+            artists.append({'kind': 'bars', 'label': _label(container) or _label(patches[0]),
+                            'x': add_array('x', [patch.get_x() for patch in patches]),
+                            'y': add_array('y', [patch.get_y() for patch in patches]),
+                            'width': add_array('width', [patch.get_width() for patch in patches]),
+                            'height': add_array('height',
+                                                [patch.get_height() for patch in patches]),
+                            'facecolor': _rgba(patches[0].get_facecolor()),
+                            'edgecolor': _rgba(patches[0].get_edgecolor()),
+                            'alpha': patches[0].get_alpha()})
+
+        for patch in ax.patches:
+            if id(patch) in bar_patches:
+                continue
+            vertices = patch.get_patch_transform().transform(patch.get_path().vertices)
+            artists.append({'kind': 'polygon', 'label': _label(patch),
+                            'xy': add_array('xy', vertices), 'fill': bool(patch.get_fill()),
+                            'facecolor': _rgba(patch.get_facecolor()),
+                            'edgecolor': _rgba(patch.get_edgecolor()),
+                            'alpha': patch.get_alpha(),
+                            'linewidth': float(patch.get_linewidth())})
+
+        for collection in ax.collections:
+            if isinstance(collection, PathCollection):
+                artists.append({'kind': 'scatter', 'label': _label(collection),
+                                'xy': add_array('xy', collection.get_offsets()),
+                                'sizes': add_array('sizes', collection.get_sizes()),
+                                # one color per point (or a single one for all)
+                                'colors': add_array('colors', collection.get_facecolors()),
+                                'alpha': collection.get_alpha()})
+            else:
+                spec['unsupported'].append(type(collection).__name__)
+
+        for image in ax.images:
+            extent = image.get_extent()
+            artists.append({'kind': 'image', 'data': add_array('data', image.get_array()),
+                            'extent': [float(value) for value in extent],
+                            'cmap': image.get_cmap().name, 'clim': [float(lim) for lim in image.get_clim()],
+                            'origin': getattr(image, 'origin', None)})
+
+        for text in ax.texts:
+            x_pos, y_pos = text.get_position()
+            artists.append({'kind': 'text', 'x': float(x_pos), 'y': float(y_pos),
+                            'text': text.get_text(),
+                            'transform': 'axes' if text.get_transform() == ax.transAxes
+                            else 'data'})
+        spec['axes'].append(ax_spec)
+
+    return spec, arrays
+
+
+def save_plot_spec(figure, file_name):
+    """Save the content of a figure as a plot spec (NPZ-file).
+
+    Parameters
+    ----------
+    figure : :py:class:`matplotlib.figure.Figure`
+        The figure to save.
+    file_name : str
+        The file to save the plot spec to.
+    """
+    spec, arrays = figure_to_spec(figure)
+    arrays[_SPEC_KEY] = np.array(json.dumps(spec))
+    with open(file_name, 'wb') as spec_file:
+        np.savez_compressed(spec_file, **arrays)
+
+
+def load_plot_spec(file_name):
+    """Load a plot spec saved with :py:func:`save_plot_spec`.
+
+    Return
+    ------
+    out : (dict, dict)
+        The description of the figure and the arrays it refers to, see
+        :py:func:`figure_to_spec`.
+    """
+    with np.load(file_name) as data:
+        arrays = dict((key, data[key]) for key in data.files)
+    spec = json.loads(str(arrays.pop(_SPEC_KEY)))
+    return spec, arrays
+
+
+def spec_to_figure(spec, arrays, figure=None):
+    """Re-create a figure from a plot spec.
+
+    Parameters
+    ----------
+    spec : dict
+        The description of the figure.
+    arrays : dict
+        The arrays the description refers to.
+    figure : :py:class:`matplotlib.figure.Figure` or None
+        The figure to draw into. If None, a new one (with the size of the
+        original) is created.
+
+    Return
+    ------
+    out : :py:class:`matplotlib.figure.Figure`
+        The re-created figure.
+    """
+    if figure is None:
+        figure = plt.figure(figsize=spec['size'])
+    if spec.get('title'):
+        figure.suptitle(spec['title'])
+
+    for ax_spec in spec['axes']:
+        ax = figure.add_axes(ax_spec['position'])
+        for artist in ax_spec['artists']:
+            kind = artist['kind']
+            if kind == 'line':
+                ax.plot(arrays[artist['x']], arrays[artist['y']], label=artist['label'],
+                        color=artist['color'], alpha=artist['alpha'],
+                        linestyle=artist['linestyle'], linewidth=artist['linewidth'],
+                        marker=artist['marker'], drawstyle=artist['drawstyle'])
+            elif kind == 'bars':
+                ax.bar(arrays[artist['x']], arrays[artist['height']],
+                       width=arrays[artist['width']], bottom=arrays[artist['y']],
+                       align='edge', label=artist['label'], color=artist['facecolor'],
+                       edgecolor=artist['edgecolor'], alpha=artist['alpha'])
+            elif kind == 'polygon':
+                ax.add_patch(plt.Polygon(arrays[artist['xy']], closed=True,
+                                         fill=artist['fill'], label=artist['label'],
+                                         facecolor=artist['facecolor'],
+                                         edgecolor=artist['edgecolor'], alpha=artist['alpha'],
+                                         linewidth=artist['linewidth']))
+            elif kind == 'scatter':
+                xy = arrays[artist['xy']]
+                colors = arrays[artist['colors']]
+                ax.scatter(xy[:, 0], xy[:, 1], s=arrays[artist['sizes']],
+                           color=colors if len(colors) else None, alpha=artist['alpha'],
+                           label=artist['label'])
+            elif kind == 'image':
+                ax.imshow(arrays[artist['data']], extent=artist['extent'], cmap=artist['cmap'],
+                          clim=artist['clim'], origin=artist['origin'], aspect='auto')
+            elif kind == 'text':
+                transform = ax.transAxes if artist['transform'] == 'axes' else ax.transData
+                ax.text(artist['x'], artist['y'], artist['text'], transform=transform)
+
+        ax.set_xscale(ax_spec['xscale'])
+        ax.set_yscale(ax_spec['yscale'])
+        ax.set_xticks(arrays[ax_spec['xticks']])
+        ax.set_yticks(arrays[ax_spec['yticks']])
+        if any(ax_spec['xticklabels']):
+            ax.set_xticklabels(ax_spec['xticklabels'])
+        if any(ax_spec['yticklabels']):
+            ax.set_yticklabels(ax_spec['yticklabels'])
+        ax.set_xlim(ax_spec['xlim'])
+        ax.set_ylim(ax_spec['ylim'])
+        if ax_spec['title']:
+            ax.set_title(ax_spec['title'])
+        if ax_spec['xlabel']:
+            ax.set_xlabel(ax_spec['xlabel'])
+        if ax_spec['ylabel']:
+            ax.set_ylabel(ax_spec['ylabel'])
+        if ax_spec['legend']:
+            ax.legend()
+
+    return figure
+
+
+def replot(spec_path, file_format='png', output_path=None, **save_cfg):
+    """Re-render all plot specs in a folder (e.g. the *npz* folder of a run).
+
+    Parameters
+    ----------
+    spec_path : str
+        The folder containing the plot specs or a single plot spec file.
+    file_format : str
+        The format to render the figures to.
+    output_path : str or None
+        The folder to save the figures to. If None, a folder named after
+        the format next to *spec_path* is used.
+    **save_cfg : keyword args
+        Will be used as arguments in :py:func:`~matplotlib.pyplot.savefig()`
+
+    Return
+    ------
+    out : list(str)
+        The files written.
+    """
+    if os.path.isdir(spec_path):
+        spec_dir = spec_path
+        spec_files = sorted(name for name in os.listdir(spec_path) if name.endswith('.npz'))
+    else:
+        spec_dir, spec_files = os.path.split(spec_path)
+        spec_files = [spec_files]
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(os.path.normpath(spec_dir)), file_format)
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+
+    written = []
+    for spec_file in spec_files:
+        spec, arrays = load_plot_spec(os.path.join(spec_dir, spec_file))
+        figure = spec_to_figure(spec, arrays)
+        file_name = os.path.join(output_path, os.path.splitext(spec_file)[0] + '.' + file_format)
+        figure.savefig(file_name, format=file_format, **save_cfg)
+        plt.close(figure)
+        written.append(file_name)
+    return written
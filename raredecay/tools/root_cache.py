@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""Process-wide cache for branches read from ROOT-trees.
+
+Every conversion of a *root-dict* to an array goes through
+:py:func:`~root_numpy.root2array`, which decodes the requested branches from
+disk again and again. As the same branches are needed many times during a run
+(pandasDF, plots, make_dataset, every fold,...), the decoded arrays are kept in
+a least-recently-used cache which is limited in bytes
+(see :py:const:`~raredecay.meta_config.ROOT_CACHE_MAX_BYTES`).
+
+An entry is identified by the file(s) (including modification time and size),
+the tree, the branch and the selection (and any other argument to
+root2array). Therefore, data-storages pointing to the same file share their
+entries and a changed file will be read again.
+
+The number of entries of a root-dict is cached as well and, if possible,
+determined by ROOT without reading any branch.
+
+Optionally, the branches are also stored on disk in a cache directory
+(see :py:const:`~raredecay.meta_config.ROOT_CACHE_DIR`): every branch read is
+written as a raw *.npy* file, together with a small manifest (JSON) containing
+the source files (path, modification time, size), the tree, the selection and
+the dtypes. Later runs memory-map these files instead of decoding the
+ROOT-file, so the pages are shared (via the OS page cache) between processes
+on the same machine.
+
+Instances
+---------
+branch_cache : :py:class:`~raredecay.tools.root_cache.BranchCache`
+    The cache used by :py:mod:`~raredecay.tools.data_tools` for all reads.
+"""
+from __future__ import division, absolute_import
+
+import os
+import glob
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+root2array = None  # imported from root_numpy at the first read (slow to import)
+
+from raredecay import meta_config
+
+
+class BranchCache(object):
+    """Least-recently-used cache of decoded ROOT-branches, limited in bytes.
+
+    Parameters
+    ----------
+    max_bytes : int >= 0 or None
+        The maximum number of bytes the cached arrays can occupy. If None,
+        :py:const:`~raredecay.meta_config.ROOT_CACHE_MAX_BYTES` is used.
+        A value of 0 disables the caching.
+    cache_dir : str or False or None
+        The directory to store the branches on disk. If None,
+        :py:const:`~raredecay.meta_config.ROOT_CACHE_DIR` is used. False
+        disables the disk cache.
+    """
+
+    _MANIFEST = 'manifest.json'
+
+    def __init__(self, max_bytes=None, cache_dir=None):
+        self._max_bytes = max_bytes
+        self._cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.RLock()
+        self._n_entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+
+    @property
+    def max_bytes(self):
+        """The maximum size of the cache in bytes."""
+        if self._max_bytes is None:
+            return meta_config.ROOT_CACHE_MAX_BYTES
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict(0)
+
+    @property
+    def cache_dir(self):
+        """The directory of the disk cache or False if disabled."""
+        if self._cache_dir is None:
+            return meta_config.ROOT_CACHE_DIR or False
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, cache_dir):
+        self._cache_dir = cache_dir
+
+    def get(self, root_dict, cache_dir=None):
+        """Return the branches of a root-dict, read from the cache if possible.
+
+        Parameters
+        ----------
+        root_dict : root-dict
+            A valid argument to :py:func:`~root_numpy.root2array`. The
+            'branches' can be a string or a list of strings.
+        cache_dir : str or False or None
+            The directory of the disk cache to use. If None, the one of the
+            instance is used.
+
+        Return
+        ------
+        out : OrderedDict{str: 1-D numpy array}
+            The decoded branches in the order they were requested. The arrays
+            are shared between all users of the cache and therefore read-only.
+        """
+        root_dict = dict(root_dict)
+        branches = root_dict.pop('branches')
+        branches = [branches] if isinstance(branches, str) else list(branches)
+
+        base_key = self._make_key(root_dict)
+        if base_key is None or self.max_bytes <= 0:
+            with self._lock:
+                self.misses += len(branches)
+            if base_key is None:
+                return self._read(root_dict, branches)
+            return self._get_missing(root_dict, branches, base_key, cache_dir)
+
+        arrays = {}
+        missing = []
+        with self._lock:
+            for branch in branches:
+                key = base_key + (branch,)
+                array = self._entries.pop(key, None)
+                if array is None:
+                    self.misses += 1
+                    if branch not in missing:
+                        missing.append(branch)
+                else:
+                    self.hits += 1
+                    self._entries[key] = array  # most recently used is last
+                    arrays[branch] = array
+
+        if missing:
+            new_arrays = self._get_missing(root_dict, missing, base_key, cache_dir)
+            with self._lock:
+                for branch, array in new_arrays.iteritems():
+                    self._add(base_key + (branch,), array)
+            arrays.update(new_arrays)
+
+        return OrderedDict((branch, arrays[branch]) for branch in branches)
+
+    def get_chunk(self, root_dict, start, stop, cache_dir=None):
+        """Return the branches of the entries *start* to *stop* of the tree.
+
+        Used to iterate over trees which do not fit into memory. Branches
+        already in the cache (in memory or on disk) are sliced, otherwise
+        only the range is read with :py:func:`~root_numpy.root2array` and
+        *not* added to the cache.
+        With a *selection*, the range refers to the entries of the tree
+        before the selection, so less than *stop* - *start* entries may be
+        returned.
+
+        Parameters
+        ----------
+        root_dict : root-dict
+            A valid argument to :py:func:`~root_numpy.root2array` without
+            *start*, *stop* and *step*.
+        start : int
+            The first entry of the tree.
+        stop : int
+            The end (exclusive) of the entries.
+        cache_dir : str or False or None
+            The directory of the disk cache to use. If None, the one of the
+            instance is used.
+
+        Return
+        ------
+        out : OrderedDict{str: 1-D numpy array}
+            The branches in the order they were requested, read-only.
+        """
+        root_dict = dict(root_dict)
+        branches = root_dict.pop('branches')
+        branches = [branches] if isinstance(branches, str) else list(branches)
+
+        base_key = None if root_dict.get('selection') else self._make_key(root_dict)
+        if base_key is not None:
+            arrays = OrderedDict()
+            with self._lock:
+                for branch in branches:
+                    array = self._entries.get(base_key + (branch,))
+                    if array is not None:
+                        arrays[branch] = array[start:stop]
+            cache_dir = self.cache_dir if cache_dir is None else cache_dir
+            if len(arrays) < len(branches) and cache_dir:
+                entry_dir = self._get_entry_dir(cache_dir, base_key)
+                manifest = self._load_manifest(entry_dir, base_key)
+                for branch in branches:
+                    if branch not in arrays:
+                        array = self._load_branch(entry_dir, manifest, branch)
+                        if array is not None:
+                            arrays[branch] = array[start:stop]
+            if len(arrays) == len(set(branches)):
+                return OrderedDict((branch, arrays[branch]) for branch in branches)
+
+        return self._read(dict(root_dict, start=start, stop=stop), branches)
+
+    def _get_missing(self, root_dict, branches, base_key, cache_dir=None):
+        """Return the branches from the disk cache or, if not there, from the file(s)."""
+        cache_dir = self.cache_dir if cache_dir is None else cache_dir
+        if not cache_dir:
+            return self._read(root_dict, branches)
+
+        entry_dir = self._get_entry_dir(cache_dir, base_key)
+        manifest = self._load_manifest(entry_dir, base_key)
+        arrays = OrderedDict()
+        for branch in branches:
+            array = self._load_branch(entry_dir, manifest, branch)
+            if array is not None:
+                arrays[branch] = array
+        with self._lock:
+            self.disk_hits += len(arrays)
+
+        to_read = [branch for branch in branches if branch not in arrays]
+        if to_read:
+            new_arrays = self._read(root_dict, to_read)
+            for branch, array in new_arrays.iteritems():
+                self._save_branch(entry_dir, manifest, branch, array)
+            try:
+                self._save_manifest(entry_dir, manifest)
+            except (IOError, OSError):
+                pass  # the disk cache is optional, the branches are read anyway
+            arrays.update(new_arrays)
+        return OrderedDict((branch, arrays[branch]) for branch in branches)
+
+    @staticmethod
+    def _get_entry_dir(cache_dir, base_key):
+        """Return the directory of the entries of a key (without the file stats)."""
+        files, options = base_key
+        name = repr(([path for path, _mtime, _size in files], options))
+        return os.path.join(os.path.expanduser(cache_dir), hashlib.sha1(name).hexdigest())
+
+    def _load_manifest(self, entry_dir, base_key):
+        """Return the manifest of the entry directory, a new one if missing or outdated."""
+        files, options = base_key
+        options = dict(options)
+        new_manifest = dict(files=[list(stat) for stat in files], options=options,
+                            treename=options.get('treename'),
+                            selection=options.get('selection'), branches={})
+        try:
+            with open(os.path.join(entry_dir, self._MANIFEST)) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, ValueError):
+            return new_manifest
+        if manifest.get('files') != new_manifest['files']:
+            return new_manifest  # the file(s) changed, the branches are outdated
+        return manifest
+
+    def _save_manifest(self, entry_dir, manifest):
+        """Write the manifest atomically, so concurrent readers never see half of it."""
+        self._write_atomic(entry_dir, self._MANIFEST,
+                           lambda tmp_file: json.dump(manifest, tmp_file, indent=1))
+
+    @staticmethod
+    def _load_branch(entry_dir, manifest, branch):
+        """Return the memory-mapped (read-only) branch or None if not on disk."""
+        info = manifest['branches'].get(branch)
+        if info is None:
+            return None
+        try:
+            array = np.load(os.path.join(entry_dir, info['file']), mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+        if str(array.dtype) != info['dtype']:
+            return None
+        return array
+
+    def _save_branch(self, entry_dir, manifest, branch, array):
+        """Write a branch as .npy file and add it to the manifest."""
+        if array.dtype.hasobject:
+            return  # can't be memory-mapped (e.g. variable length arrays)
+        filename = hashlib.sha1(branch).hexdigest() + '.npy'
+        try:
+            self._write_atomic(entry_dir, filename, lambda tmp_file: np.save(tmp_file, array))
+        except (IOError, OSError):
+            return
+        manifest['branches'][branch] = dict(file=filename, dtype=str(array.dtype))
+
+    @staticmethod
+    def _write_atomic(directory, filename, write):
+        """Write to a temporary file in *directory* and rename it to *filename*."""
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):  # could be created by another process
+                    raise
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(tmp_fd, 'wb') as tmp_file:
+                write(tmp_file)
+            os.rename(tmp_path, os.path.join(directory, filename))
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def get_n_entries(self, root_dict, cache_dir=None):
+        """Return the number of entries a root-dict yields, without reading it.
+
+        The number is taken from the entry count of the tree (respecting
+        *start*, *stop* and *step*) or, if a *selection* is given, from
+        counting the selected entries in ROOT, which only reads the branches
+        used in the selection. The result is cached per file, tree and
+        selection (and stored in the manifest of the disk cache).
+        If ROOT is not available (or other arguments are used), the first
+        branch is read through the cache instead.
+
+        Parameters
+        ----------
+        root_dict : root-dict
+            A valid argument to :py:func:`~root_numpy.root2array`.
+        cache_dir : str or False or None
+            The directory of the disk cache to use. If None, the one of the
+            instance is used.
+
+        Return
+        ------
+        out : int
+            The number of entries.
+        """
+        root_dict = dict(root_dict)
+        branches = root_dict.pop('branches', None)
+        key = self._make_key(root_dict)
+        if key is not None:
+            with self._lock:
+                n_entries = self._n_entries.get(key)
+            if n_entries is not None:
+                return n_entries
+
+        cache_dir = self.cache_dir if cache_dir is None else cache_dir
+        n_entries = None
+        if key is not None and cache_dir:
+            entry_dir = self._get_entry_dir(cache_dir, key)
+            manifest = self._load_manifest(entry_dir, key)
+            n_entries = manifest.get('n_entries')
+        if n_entries is None and key is not None and set(root_dict) <= set(['filenames', 'treename', 'selection',
+                                                      'start', 'stop', 'step']):
+            try:
+                n_entries = self._count_entries(**root_dict)
+            except ImportError:
+                pass
+        if n_entries is None:
+            branch = branches if isinstance(branches, str) else list(branches)[0]
+            n_entries = len(self.get(dict(root_dict, branches=branch), cache_dir=cache_dir)[branch])
+
+        if key is not None:
+            with self._lock:
+                self._n_entries[key] = n_entries
+            if cache_dir and manifest.get('n_entries') != n_entries:
+                manifest = self._load_manifest(entry_dir, key)  # may be updated by the read
+                manifest['n_entries'] = n_entries
+                try:
+                    self._save_manifest(entry_dir, manifest)
+                except (IOError, OSError):
+                    pass
+        return n_entries
+
+    @staticmethod
+    def _count_entries(filenames, treename=None, selection=None, start=None, stop=None,
+                       step=None):
+        """Count the entries with ROOT. Return None if this is not possible."""
+        from ROOT import TChain  # slow to import, therefore only when needed
+
+        ranged = not (start is None and stop is None and step is None)
+        if treename is None or (selection and ranged):
+            return None
+        chain = TChain(treename)
+        for filename in [filenames] if isinstance(filenames, str) else filenames:
+            chain.Add(filename)
+        if selection:
+            n_entries = chain.GetEntries(selection)
+        else:
+            n_entries = len(xrange(*slice(start, stop, step).indices(chain.GetEntries())))
+        return int(n_entries)
+
+    def stats(self):
+        """Return the counters and the current size of the cache as a dict."""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        disk_hits=self.disk_hits, n_entries=len(self._entries),
+                        n_bytes=self._n_bytes, max_bytes=self.max_bytes)
+
+    def clear(self):
+        """Remove all entries from the (in-memory) cache. The counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._n_entries.clear()
+            self._n_bytes = 0
+
+    @staticmethod
+    def _make_key(root_dict):
+        """Return the key (without the branch) or None if no file was found."""
+        filenames = root_dict.get('filenames')
+        filenames = [filenames] if isinstance(filenames, str) else list(filenames)
+        files = []
+        for filename in filenames:
+            paths = sorted(glob.glob(os.path.expanduser(filename)))  # wildcards are allowed
+            if not paths:
+                return None
+            for path in paths:
+                stat = os.stat(path)
+                files.append((os.path.abspath(path), stat.st_mtime, stat.st_size))
+        options = tuple(sorted((key, repr(val)) for key, val in root_dict.iteritems()
+                               if key != 'filenames'))
+        return tuple(files), options
+
+    @staticmethod
+    def _read(root_dict, branches):
+        """Decode the branches from the file(s)."""
+        global root2array
+        if root2array is None:
+            from root_numpy import root2array
+        records = root2array(branches=branches, **root_dict)
+        arrays = OrderedDict()
+        for branch, field in zip(branches, records.dtype.names):
+            array = records[field].copy()
+            array.flags.writeable = False
+            arrays[branch] = array
+        return arrays
+
+    def _add(self, key, array):
+        """Add an array to the cache, remove the least recently used if needed."""
+        n_bytes = array.nbytes
+        if n_bytes > self.max_bytes:
+            return
+        old_array = self._entries.pop(key, None)
+        if old_array is not None:
+            self._n_bytes -= old_array.nbytes
+        self._evict(n_bytes)
+        self._entries[key] = array
+        self._n_bytes += n_bytes
+
+    def _evict(self, n_bytes_needed):
+        """Remove entries until *n_bytes_needed* fit into the cache."""
+        while self._entries and self._n_bytes + n_bytes_needed > self.max_bytes:
+            _key, old_array = self._entries.popitem(last=False)
+            self._n_bytes -= old_array.nbytes
+            self.evictions += 1
+
+
+branch_cache = BranchCache()
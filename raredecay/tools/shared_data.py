@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""Data of a data-storage shared read-only with worker processes.
+
+Sending a data-storage (or a DataFrame) to a process pool pickles the whole
+data for every task; with 32 workers, a sample of 10 GB uses 320 GB.
+Instead, :py:func:`publish` writes the column matrix, the weights and the
+targets once (in blocks, see
+:py:meth:`~raredecay.tools.data_storage.HEPDataStorage.iter_chunks`) as raw
+*.npy* files to a directory, by default in shared memory (*/dev/shm*, see
+:py:const:`~raredecay.meta_config.SHARED_DATA_DIR`). It returns a
+:py:class:`SharedData`, a small handle which can be pickled to the workers.
+In a worker, :py:meth:`SharedData.attach` memory-maps the files read-only:
+the pages are shared (via the OS page cache) between all processes, so the
+fan-out to any number of workers costs no additional memory.
+
+The process which published the data owns the files and removes them with
+:py:meth:`SharedData.close` (or at the end of a *with* block). Copies of the
+handle (e.g. unpickled in a worker) never remove them.
+
+Example
+-------
+>>> with mc_data.publish(columns=['B_PT', 'B_ETA']) as shared:
+...     results = pool.map(train_fold, [(shared, rows) for rows in folds])
+
+>>> def train_fold((shared, rows)):  # in the worker process
+...     data, targets, weights = shared.attach()  # no copy
+...     ...
+"""
+from __future__ import division, absolute_import
+
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+
+from raredecay import meta_config
+from raredecay.tools import dev_tool, data_tools
+
+import importlib
+cfg = importlib.import_module(meta_config.run_config)
+logger = dev_tool.make_logger(__name__, **cfg.logger_cfg)
+
+
+def _default_dir():
+    """Return the directory for the data: shared memory if possible, else the temp dir."""
+    if meta_config.SHARED_DATA_DIR:
+        return meta_config.SHARED_DATA_DIR
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+class SharedData(object):
+    """Handle of data published with :py:func:`publish`, picklable.
+
+    Only the path and the description of the files are pickled, never the
+    data.
+
+    Parameters
+    ----------
+    path : str
+        The directory containing the files.
+    columns : list(str, str, ...)
+        The columns of the data matrix.
+    n_rows : int
+        The number of rows.
+    owner : boolean
+        If True, :py:meth:`close` removes the files.
+    """
+
+    _FILES = {'data': 'data.npy', 'targets': 'targets.npy', 'weights': 'weights.npy',
+              'index': 'index.npy'}
+    _MANIFEST = 'manifest.json'
+
+    def __init__(self, path, columns, n_rows, owner=False):
+        self.path = path
+        self.columns = list(columns)
+        self.n_rows = n_rows
+        self._owner = owner
+        self._arrays = {}
+
+    @classmethod
+    def from_path(cls, path):
+        """Return a (not owning) handle of the data published to *path*."""
+        with open(os.path.join(path, cls._MANIFEST)) as manifest_file:
+            manifest = json.load(manifest_file)
+        return cls(path, columns=manifest['columns'], n_rows=manifest['n_rows'])
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getstate__(self):
+        # only the description is sent, copies do not own the files
+        return {'path': self.path, 'columns': self.columns, 'n_rows': self.n_rows}
+
+    def __setstate__(self, state):
+        self.__init__(owner=False, **state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        if self._owner:
+            self.close()
+
+    def _get(self, name):
+        """Return the (cached) read-only memory-map of a file or None if missing."""
+        if name not in self._arrays:
+            file_path = os.path.join(self.path, self._FILES[name])
+            self._arrays[name] = np.load(file_path, mmap_mode='r') \
+                if os.path.isfile(file_path) else None
+        return self._arrays[name]
+
+    def attach(self, columns=None):
+        """Return read-only views of the data, the targets and the weights.
+
+        Nothing is copied: the arrays are memory-mapped and the pages are
+        shared with every other process using the same files.
+
+        Parameters
+        ----------
+        columns : str or list(str, str, ...)
+            If given, only the view of these columns is returned (which is a
+            copy if the columns are not consecutive).
+
+        Return
+        ------
+        out : tuple(2-D array, 1-D array or None, 1-D array)
+            The data (rows x columns, column-major so every column is
+            contiguous), the targets (None if the storage had no target) and
+            the (not normalized) weights.
+        """
+        data = self._get('data')
+        if columns is not None:
+            positions = [self.columns.index(col) for col in data_tools.to_list(columns)]
+            if positions == range(positions[0], positions[-1] + 1):
+                data = data[:, positions[0]:positions[-1] + 1]
+            else:
+                data = data[:, positions]
+        return data, self._get('targets'), self._get('weights')
+
+    def get_index(self):
+        """Return the index of the data-storage or None if it was not numeric."""
+        return self._get('index')
+
+    def to_storage(self, columns=None, data_name=None):
+        """Return a data-storage around the attached data.
+
+        The data is not copied (the DataFrame is a view of the memory-map),
+        the targets and weights are (they are small compared to the data).
+
+        Parameters
+        ----------
+        columns : list(str, str, ...)
+            The columns to use, all if None.
+        data_name : str
+            The name of the data-storage.
+
+        Return
+        ------
+        out : :py:class:`~raredecay.tools.data_storage.HEPDataStorage`
+            The data-storage.
+        """
+        import pandas as pd
+        from raredecay.tools.data_storage import HEPDataStorage
+
+        columns = self.columns if columns is None else columns
+        data, targets, weights = self.attach(columns=columns)
+        index = self.get_index()
+        data = pd.DataFrame(data, columns=columns, copy=False,
+                            index=None if index is None else np.asarray(index))
+        return HEPDataStorage(data, target=None if targets is None else np.asarray(targets),
+                              sample_weights=weights, data_name=data_name)
+
+    def close(self):
+        """Forget the memory-maps and, if this handle owns them, remove the files."""
+        self._arrays = {}
+        if self._owner:
+            self._owner = False
+            shutil.rmtree(self.path, ignore_errors=True)
+            logger.debug("removed shared data " + self.path)
+
+
+def publish(storage, columns=None, directory=None, chunk_size=None):
+    """Write the data, targets and weights of a data-storage to shared files.
+
+    The data is written in blocks of rows, so a storage larger than the
+    memory (e.g. a ROOT-tree) can be published as well.
+
+    Parameters
+    ----------
+    storage : :py:class:`~raredecay.tools.data_storage.HEPDataStorage`
+        The data-storage to publish.
+    columns : str or list(str, str, ...)
+        The columns to publish, all if None.
+    directory : str or None
+        The directory in which a new (unique) directory for the files is
+        created. If None, :py:const:`~raredecay.meta_config.SHARED_DATA_DIR`
+        or, if not set, */dev/shm* (if available) or the temp directory is
+        used.
+    chunk_size : int > 0
+        The number of rows written at once, see
+        :py:meth:`~raredecay.tools.data_storage.HEPDataStorage.iter_chunks`.
+
+    Return
+    ------
+    out : :py:class:`~raredecay.tools.shared_data.SharedData`
+        The handle, owning the files.
+    """
+    columns = storage.columns if columns is None else data_tools.to_list(columns)
+    n_rows = len(storage)
+    path = tempfile.mkdtemp(prefix='raredecay_shared_',
+                            dir=_default_dir() if directory is None else directory)
+    shared = SharedData(path, columns=columns, n_rows=n_rows, owner=True)
+    try:
+        files = SharedData._FILES
+        data = np.lib.format.open_memmap(os.path.join(path, files['data']), mode='w+',
+                                         dtype=np.float64, shape=(n_rows, len(columns)),
+                                         fortran_order=True)
+        targets = weights = None
+        has_targets = False
+        start = 0
+        for chunk, chunk_targets, chunk_weights in storage.iter_chunks(
+                columns=columns, chunk_size=chunk_size, normalize=False, as_array=True):
+            if weights is None:
+                weights = np.lib.format.open_memmap(os.path.join(path, files['weights']),
+                                                    mode='w+', dtype=np.float64,
+                                                    shape=(n_rows,))
+                # without a target (None, object dtype), no targets are written
+                has_targets = chunk_targets.dtype.kind != 'O'
+                if has_targets:
+                    targets = np.lib.format.open_memmap(
+                        os.path.join(path, files['targets']), mode='w+',
+                        dtype=chunk_targets.dtype, shape=(n_rows,))
+            stop = start + len(chunk)
+            data[start:stop] = chunk
+            weights[start:stop] = chunk_weights
+            if has_targets:
+                targets[start:stop] = chunk_targets
+            start = stop
+        for array in (data, targets, weights):
+            if array is not None:
+                array.flush()
+        del data, targets, weights
+
+        index = np.asarray(storage.index)
+        if index.dtype.kind in 'iuf':
+            np.save(os.path.join(path, files['index']), index)
+        else:
+            logger.warning("index of " + str(storage.name) + " is not numeric, not published")
+        with open(os.path.join(path, SharedData._MANIFEST), 'w') as manifest_file:
+            json.dump({'columns': columns, 'n_rows': n_rows, 'has_targets': has_targets},
+                      manifest_file)
+    except BaseException:
+        shared.close()
+        raise
+    logger.info("published " + str(n_rows) + " rows of " + str(storage.name) + " to " + path)
+    return shared
@@ -0,0 +1,67 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of the cpu budget."""
+from __future__ import division
+
+import threading
+
+from raredecay.tools.cpu_budget import CPUBudget, split_cpus
+
+
+def test_split_cpus():
+    assert split_cpus(64) == (1, 64)
+    assert split_cpus(64, n_tasks=10) == (10, 6)
+    assert split_cpus(64, n_tasks=100) == (64, 1)
+    assert split_cpus(64, n_threads=1) == (64, 1)
+    assert split_cpus(64, n_tasks=10, n_threads=1) == (10, 1)
+    assert split_cpus(64, n_threads=8) == (8, 8)
+    assert split_cpus(4, n_threads=8) == (1, 8)
+    for n_cpu in (1, 7, 64):
+        for n_tasks in (None, 1, 3, 10, 100):
+            n_workers, n_threads = split_cpus(n_cpu, n_tasks=n_tasks)
+            assert n_workers * n_threads <= n_cpu
+
+
+def test_lease():
+    budget = CPUBudget(n_cpu=8)
+    assert budget.available() == 8
+    with budget.lease(n_cpu=3, name="first") as n_cpu:
+        assert n_cpu == 3
+        assert budget.available() == 3
+        assert budget.free == 5
+        # nested in the same thread: uses the cpus of the enclosing lease
+        with budget.lease(name="nested") as n_nested:
+            assert n_nested == 3
+            assert budget.n_used == 3
+        assert budget.acquire(name="second") == 5
+        # nothing free anymore, but the work has to be done
+        assert budget.acquire(name="third") == 1
+        budget.release(1)
+        budget.release(5)
+    assert budget.n_used == 0
+    assert budget.stats() == {'n_leases': 3, 'max_used': 9, 'total': 8}
+
+
+def test_lease_threads():
+    budget = CPUBudget(n_cpu=8)
+    granted = []
+    finish = threading.Event()
+
+    def work():
+        with budget.lease(n_cpu=2) as n_cpu:
+            granted.append(n_cpu)
+            finish.wait(10)
+
+    with budget.lease(n_cpu=6):
+        threads = [threading.Thread(target=work) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while len(granted) < 2:
+            finish.wait(0.01)
+        # a thread does not share the lease of another one: 2 are free, then none (-> 1)
+        assert sorted(granted) == [1, 2]
+        assert budget.n_used == 9
+        finish.set()
+        for thread in threads:
+            thread.join()
+    assert budget.n_used == 0
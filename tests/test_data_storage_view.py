@@ -0,0 +1,67 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of the views (folds) of a data-storage."""
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+
+from raredecay.tools.data_storage import HEPDataStorage, HEPDataStorageView
+
+
+def test_fold_views():
+    n_row = 100
+    data = pd.DataFrame(np.random.normal(size=(n_row, 3)), columns=['a', 'b', 'c'])
+    weights = np.random.uniform(0.5, 1.5, size=n_row)
+    storage = HEPDataStorage(data, target=1, sample_weights=weights)
+    storage.make_folds(4, shuffle=False)
+    train, test = storage.get_fold(1)
+
+    assert isinstance(test, HEPDataStorageView)
+    assert test.data is storage.data  # shared, not copied
+    assert len(train) == 75 and len(test) == 25
+    assert np.allclose(test.pandasDF().values, data.values[25:50])
+    assert np.isclose(test.get_weights(normalize=False).mean(), 1)
+
+    # copy-on-write: setting the weights of the view does not change the original
+    test.set_weights(np.ones(len(test)) * 2)
+    assert np.allclose(test.get_weights(normalize=False), 2)
+    assert np.allclose(storage.get_weights(normalize=False), weights)
+    assert np.isclose(train.get_weights(normalize=False).mean(), 1)
+
+
+def test_stratified_folds():
+    n_row = 90
+    data = pd.DataFrame(np.random.normal(size=(n_row, 2)), columns=['a', 'b'])
+    targets = np.array([0, 1, 1] * 30)
+    weights = np.random.uniform(0.5, 1.5, size=n_row)
+    storage = HEPDataStorage(data, target=targets, sample_weights=weights)
+    storage.make_folds(3, shuffle=42, stratified=True)
+    fold_ids = storage.get_fold_ids()
+
+    assert fold_ids.dtype == np.uint8
+    for fold in range(3):
+        train, test = storage.get_fold(fold)
+        assert len(test) == 30 and len(train) == 60
+        assert np.sum(test.get_targets() == 0) == 10
+    # the folds can be reused
+    other = HEPDataStorage(data.copy(), target=targets)
+    other.set_fold_ids(fold_ids)
+    assert other.get_n_folds() == 3
+    assert np.all(other.get_fold(2)[1].index == storage.get_fold(2)[1].index)
+
+
+def test_select():
+    data = pd.DataFrame({'a': np.arange(100), 'b': np.arange(100) % 10},
+                        columns=['a', 'b'])
+    storage = HEPDataStorage(data, target=1, column_alias={'b': 'b_alias'})
+
+    selected = storage.select("a >= 50 && b_alias < 5", chunk_size=30)
+    assert isinstance(selected, HEPDataStorageView)
+    assert selected.data is storage.data
+    assert len(selected) == 25
+    assert np.all(selected.pandasDF()['a'] >= 50)
+
+    # chained cuts
+    selected = selected.select("!(b_alias == 0) | a == 50")
+    assert len(selected) == 21
@@ -0,0 +1,33 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of the profiling of dev_tool."""
+from __future__ import division
+
+from raredecay.tools import dev_tool
+
+
+def test_profile_stage():
+    dev_tool.reset_profile()
+
+    @dev_tool.profiled("square")
+    def square(x):
+        return x ** 2
+
+    assert [square(i) for i in range(3)] == [0, 1, 4]
+    with dev_tool.profile_stage("sum"):
+        sum(range(100000))
+    try:
+        with dev_tool.profile_stage("failing"):
+            raise ValueError("test")
+    except ValueError:
+        pass
+
+    profile = dev_tool.get_profile()
+    assert set(profile.index) == set(["square", "sum", "failing"])
+    assert profile.loc['square', 'calls'] == 3
+    assert profile.loc['sum', 'calls'] == 1
+    assert (profile['total [s]'] >= profile['max [s]']).all()
+    assert (profile['peak RSS increase [MB]'] >= 0).all()
+
+    dev_tool.reset_profile()
+    assert len(dev_tool.get_profile()) == 0
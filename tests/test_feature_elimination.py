@@ -0,0 +1,91 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of backward_feature_elimination."""
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+
+from raredecay import meta_config
+from raredecay.tools.data_storage import HEPDataStorage
+from raredecay.analysis import ml_analysis
+
+
+def _eliminate(n_cpu, correlated=False, **kwargs):
+    random = np.random.RandomState(42)
+    columns = ['a', 'b', 'c', 'd']
+    bkg = pd.DataFrame(random.normal(size=(300, 4)), columns=columns)
+    sig = pd.DataFrame(random.normal(size=(300, 4)) + [1., 0.5, 0., 0.], columns=columns)
+    if correlated:  # 'e' is almost 'a'
+        columns = columns + ['e']
+        for data in (bkg, sig):
+            data['e'] = data['a'] + 0.05 * random.normal(size=300)
+    bkg = HEPDataStorage(bkg, target=0)
+    sig = HEPDataStorage(sig, target=1)
+    n_cpu_max = meta_config.n_cpu_max
+    meta_config.n_cpu_max = n_cpu
+    meta_config.set_seed(7)
+    try:
+        return ml_analysis.backward_feature_elimination(
+            bkg, sig, features=columns, clf={'rdf': {'n_estimators': 20}}, n_folds=2,
+            max_difference_to_best=1, **kwargs)
+    finally:
+        meta_config.n_cpu_max = n_cpu_max
+
+
+def test_parallel_candidates():
+    output = _eliminate(n_cpu=4)
+    # all features but the last are eliminated, every candidate is scored once per round
+    assert len(output['roc_auc']) == 4
+    assert list(output['scores']['features_tot']) == [4, 3, 2]
+    assert output['scores'].drop('features_tot', axis=1).notnull().values.sum() == 4 + 3 + 2
+
+
+def test_time_limit():
+    output = _eliminate(n_cpu=2, max_feature_elimination="0:00")
+    # out of time after the first completed candidates: one round only
+    assert list(output['scores']['features_tot']) == [4]
+    assert len(output['roc_auc']) == 2
+
+
+def test_screen_candidates():
+    label = np.repeat([0, 1], 500)
+    weights = np.ones(1000)
+    scores = [('a', 0.80), ('b', 0.70), ('c', 0.79), ('d', 0.81), ('e', 0.60)]
+    # 'b' and 'e' are clearly worse, at most the better half is kept
+    assert ml_analysis._screen_candidates(scores, label, weights) == ['a', 'c', 'd']
+    assert ml_analysis._screen_candidates(scores[:1], label, weights) == ['a']
+    std = ml_analysis._auc_std([0.5], label, weights)
+    assert np.isclose(std, np.sqrt((0.25 + 499 * (1 / 3. - 1 / 4.) * 2) / 500 ** 2))
+
+
+def test_screening():
+    output = _eliminate(n_cpu=2, screening=0.25)
+    # same output format, the screened out candidates have no score in a round
+    assert len(output['roc_auc']) == 4
+    assert list(output['scores']['features_tot']) == [4, 3, 2]
+    n_scores = output['scores'].drop('features_tot', axis=1).notnull().values.sum(axis=0)
+    assert 3 <= n_scores.sum() < 4 + 3 + 2
+
+
+def test_correlation_groups():
+    random = np.random.RandomState(3)
+    x = random.normal(size=2000)
+    data = pd.DataFrame({'B_IPCHI2': x, 'B_FDCHI2': -x + 0.1 * random.normal(size=2000),
+                         'B_PT': random.normal(size=2000), 'const': np.ones(2000)},
+                        columns=['B_IPCHI2', 'B_PT', 'B_FDCHI2', 'const'])
+    weights = random.uniform(0.5, 1.5, size=2000)
+    correlation = ml_analysis._weighted_correlation(data, weights, chunk_size=300)
+    covariance = np.cov(data.values[:, :3].T, aweights=weights)
+    std = np.sqrt(np.diag(covariance))
+    assert np.allclose(correlation.values[:3, :3], covariance / np.outer(std, std))
+    assert np.allclose(correlation['const'], 0)
+    assert ml_analysis._correlation_groups(correlation, 0.9) == [['B_IPCHI2', 'B_FDCHI2']]
+
+
+def test_group_elimination():
+    output = _eliminate(n_cpu=2, correlated=True, group_correlation=0.9)
+    # 'a' and 'e' are eliminated together first, then one by one
+    assert list(output['scores']['features_tot']) == [5, 3, 2]
+    assert output['roc_auc'].keys()[1] in ('a + e', 'e + a')
+    assert len(output['roc_auc']) == 4
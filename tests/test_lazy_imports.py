@@ -0,0 +1,28 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of the lazy imports of the heavy dependencies."""
+from __future__ import division
+
+import sys
+import subprocess
+
+# slow to import, only imported where they are used
+HEAVY_MODULES = ['ROOT', 'root_numpy', 'rep.estimators', 'rep.metaml', 'hep_ml',
+                 'sklearn.ensemble', 'seaborn', 'matplotlib.pyplot']
+
+IMPORT_CODE = """
+import sys
+import raredecay.analysis.ml_analysis
+import raredecay.analysis.statistics
+import raredecay.analysis.physical_analysis
+import raredecay.tools.data_storage
+import raredecay.tools.metrics
+print ' '.join(sorted(sys.modules))
+"""
+
+
+def test_no_heavy_imports():
+    # in a new interpreter, the modules imported by other tests don't matter
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_CODE])
+    imported = set(output.split())
+    assert [module for module in HEAVY_MODULES if module in imported] == []
@@ -0,0 +1,77 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of make_dataset, iter_chunks and the histograms of a data-storage."""
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+
+from raredecay.tools.data_storage import HEPDataStorage
+
+
+def test_make_dataset_arrays():
+    data1 = pd.DataFrame(np.random.normal(size=(30, 2)), columns=['a', 'b'])
+    data2 = pd.DataFrame(np.random.normal(size=(20, 2)), columns=['a', 'b'])
+    weights1 = np.random.uniform(0.5, 1.5, size=30)
+    storage1 = HEPDataStorage(data1, target=0, sample_weights=weights1)
+    storage2 = HEPDataStorage(data2, target=1)
+
+    data, targets, weights = storage1.make_dataset_arrays(storage2, dtype=np.float32)
+    assert data.shape == (50, 2) and data.dtype == np.float32 and data.flags.c_contiguous
+    assert np.allclose(data, np.concatenate((data1.values, data2.values)), atol=1e-6)
+    assert np.all(targets == [0] * 30 + [1] * 20)
+    assert np.allclose(weights, np.concatenate((weights1, np.ones(20))))
+
+    # the ratio of the sums of the weights, the storages themselves are not changed
+    _data, _targets, weights = storage1.make_dataset_arrays(storage2, weights_ratio=1,
+                                                            sample_weights_2=np.ones(20) * 3)
+    assert np.isclose(weights[:30].sum(), weights[30:].sum())
+    assert np.allclose(storage2.get_weights(normalize=False), 1)
+
+    df, targets, weights = storage1.make_dataset(columns=['b'], index=[3, 5, 7])
+    assert list(df.columns) == ['b'] and df.index.tolist() == [3, 5, 7]
+    assert np.allclose(df['b'], data1['b'][[3, 5, 7]])
+    assert np.allclose(weights, weights1[[3, 5, 7]])
+
+
+def test_iter_chunks():
+    data = pd.DataFrame(np.random.normal(size=(25, 2)), columns=['a', 'b'],
+                        index=range(100, 125))
+    weights = np.random.uniform(0.5, 1.5, size=25)
+    storage = HEPDataStorage(data, target=1, sample_weights=weights,
+                             column_alias={'b': 'b_alias'})
+
+    chunks = list(storage.iter_chunks(chunk_size=10))
+    assert [len(chunk_data) for chunk_data, _t, _w in chunks] == [10, 10, 5]
+    chunk_data = pd.concat([chunk_data for chunk_data, _t, _w in chunks])
+    assert list(chunk_data.columns) == ['a', 'b_alias']
+    assert chunk_data.index.tolist() == range(100, 125)
+    assert np.allclose(chunk_data.values, data.values)
+    assert np.all(np.concatenate([targets for _d, targets, _w in chunks]) == 1)
+    # normalized with respect to all rows, like get_weights
+    assert np.allclose(np.concatenate([chunk_weights for _d, _t, chunk_weights in chunks]),
+                       storage.get_weights())
+
+    block, _t, _w = next(storage.iter_chunks(columns='a', chunk_size=30, as_array=True,
+                                             dtype=np.float32))
+    assert block.shape == (25, 1) and block.dtype == np.float32
+
+
+def test_histogram_engine():
+    from raredecay.tools.data_storage import _percentile_range, _bin_counts
+
+    values = np.random.normal(size=1001)
+    assert np.allclose(_percentile_range(values), np.percentile(values, [0.01, 99.99]))
+    weights = np.random.uniform(size=1001)
+    edges = np.linspace(-1, 2, 13)
+    assert np.allclose(_bin_counts(values, edges, weights),
+                       np.histogram(values, bins=edges, weights=weights)[0])
+    assert np.allclose(_bin_counts(values, edges[[0, 1, 5, 12]], uniform=False),
+                       np.histogram(values, bins=edges[[0, 1, 5, 12]])[0])
+
+    storage = HEPDataStorage(pd.DataFrame({'a': values}), sample_weights=weights)
+    hist = storage._get_histograms(['a'], [edges], chunk_size=100)[0]
+    assert np.allclose(hist, np.histogram(values, bins=edges, weights=weights / weights.mean())[0])
+    assert storage._get_histograms(['a'], [edges])[0] is hist  # cached
+    storage.set_weights(None)
+    assert storage._get_histograms(['a'], [edges])[0] is not hist
@@ -0,0 +1,148 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of the OutputHandler."""
+from __future__ import division
+
+import os
+import multiprocessing
+import cPickle as pickle
+
+import pytest
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from raredecay import meta_config
+from raredecay.tools import output
+
+
+def _figure():
+    figure = plt.figure("render test")
+    plt.hist(np.random.RandomState(3).normal(size=500), bins=20, label="normal")
+    plt.plot([-2, 0, 2], [0, 50, 10], label="line")
+    plt.title("Title")
+    plt.legend()
+    return figure
+
+
+def test_pool_render_identical(tmpdir):
+    figure = _figure()
+    serial, parallel = tmpdir.mkdir('serial'), tmpdir.mkdir('parallel')
+    for folder in (serial, parallel):
+        folder.mkdir('png')
+        folder.mkdir('pdf')
+    formats = ['png', 'pdf']
+    serial_targets = output._figure_targets(str(serial) + '/', 'fig', formats, {'dpi': 50})
+    parallel_targets = output._figure_targets(str(parallel) + '/', 'fig', formats, {'dpi': 50})
+
+    # like OutputHandler.flush_figures: in this process and by a worker
+    assert output._save_figure(figure, serial_targets) == []
+    pool = multiprocessing.Pool(1, initializer=output._init_figure_worker)
+    try:
+        task = ('fig', pickle.dumps(figure, pickle.HIGHEST_PROTOCOL), parallel_targets)
+        assert pool.apply(output._render_figure, (task,)) == ('fig', [])
+    finally:
+        pool.close()
+        pool.join()
+    plt.close(figure)
+
+    for extension in formats:
+        file_name = extension + '/fig.' + extension
+        assert serial.join(file_name).read('rb') == parallel.join(file_name).read('rb')
+
+
+def _output_handler(tmpdir):
+    handler = output.OutputHandler()
+    handler.initialize_save(str(tmpdir), run_name="output test")
+    handler.make_me_a_logger()
+    return handler
+
+
+def _read(file_name):
+    with open(file_name) as output_file:
+        return output_file.read()
+
+
+def test_output_written_while_running(tmpdir):
+    handler = _output_handler(tmpdir)
+    handler.add_output(["first", 1], section="First section")
+    handler.add_output("the configuration", section="Configuration", to_end=True, importance=0)
+    handler.add_output("second", subtitle="Second")
+
+    # already in the results file before finalize, as after a crash
+    written = _read(handler._output_file_name)
+    for text in ("First section", "the configuration", "second"):
+        assert text in written
+    assert handler.output == written
+
+    results_file = handler._output_file_name
+    output_text = handler.finalize(show_plots=False)
+    assert _read(results_file) == output_text
+    assert not output_text.startswith("\n")
+    # in place and, once, at the end of the run
+    assert output_text.count("the configuration") == 2
+    assert output_text.split("END OF RUN")[1].count("the configuration") == 1
+
+
+def test_output_in_memory(tmpdir, monkeypatch):
+    def no_file(self):
+        raise IOError("no results file")
+
+    monkeypatch.setattr(output.OutputHandler, '_open_output_file', no_file)
+    with pytest.warns(RuntimeWarning):
+        handler = _output_handler(tmpdir)
+    monkeypatch.undo()
+    handler.add_output("kept in memory", section="Memory")
+    assert not os.path.exists(handler._output_file_name)
+    assert "kept in memory" in handler.output
+
+    results_file = handler._output_file_name
+    output_text = handler.finalize(show_plots=False)
+    assert "kept in memory" in output_text and not output_text.startswith("\n")
+    assert _read(results_file) == output_text
+
+
+def test_eager_figures(tmpdir, monkeypatch):
+    monkeypatch.setattr(meta_config, 'EAGER_FIGURES', True)
+    monkeypatch.setattr(meta_config, 'FIGURE_WORKERS', 1)  # rendered in this process
+    handler = _output_handler(tmpdir)
+    png_path = handler.get_plots_path() + 'png/'
+
+    first = handler.save_fig("first figure", importance=1, file_format='png')
+    plt.plot([0, 1], [1, 0])
+    # requested again to draw on it, like HEPDataStorage.plot for overlays
+    assert handler.save_fig("first figure", importance=1, file_format='png') is first
+    plt.plot([0, 1], [0, 1])
+    assert not os.path.exists(png_path + 'first_figure.png')
+    assert "first figure" in plt.get_figlabels()
+
+    second = handler.save_fig("second figure", importance=1, file_format='png')
+    assert os.path.exists(png_path + 'first_figure.png')
+    assert "first figure" not in plt.get_figlabels()  # closed, the number may be reused
+    assert not os.path.exists(png_path + 'second_figure.png')
+    assert second.get_label() in plt.get_figlabels()
+
+    handler.finalize(show_plots=False)
+    assert os.path.exists(png_path + 'second_figure.png')
+
+
+def test_no_plots(monkeypatch):
+    from raredecay import settings
+    from raredecay.globals_ import out
+    from raredecay.tools.data_storage import HEPDataStorage
+
+    for name in ('NO_PLOTS', 'verbosity', 'plot_verbosity'):  # restored afterwards
+        monkeypatch.setattr(meta_config, name, getattr(meta_config, name))
+    settings.set_verbosity(no_plots=True)
+    plt.close('all')
+
+    data = pd.DataFrame(np.random.RandomState(5).normal(size=(100, 3)), columns=['a', 'b', 'c'])
+    storage = HEPDataStorage(data, target=1)
+    assert not out.plots_needed(importance=5)
+    assert storage.plot(figure="no plot", importance=5) is None
+    assert out.save_fig("no figure", importance=5) == "no figure"
+    correlation = storage.plot_correlation(figure="no correlation plot", plot_importance=5)
+    assert np.allclose(correlation.values, data.corr().values)
+    assert plt.get_fignums() == []
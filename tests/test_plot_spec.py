@@ -0,0 +1,61 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of the plot specs."""
+from __future__ import division
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from raredecay.tools import plot_spec
+
+
+def test_plot_spec(tmpdir):
+    figure = plt.figure("plot spec test")
+    counts, edges, _ = plt.hist(np.linspace(0, 1, 100), bins=10, label="linear")
+    plt.plot([0, 0.5, 1], [0, 1, 0.5], label="roc")
+    plt.title("Title")
+    plt.xlabel("x")
+    plt.legend()
+    spec_dir = tmpdir.mkdir('npz')
+    plot_spec.save_plot_spec(figure, str(spec_dir.join('test.npz')))
+    plt.close(figure)
+
+    spec, arrays = plot_spec.load_plot_spec(str(spec_dir.join('test.npz')))
+    assert spec['label'] == "plot spec test"
+    assert spec['unsupported'] == []
+    ax_spec = spec['axes'][0]
+    assert (ax_spec['title'], ax_spec['xlabel'], ax_spec['legend']) == ("Title", "x", True)
+    line, bars = ax_spec['artists']
+    assert np.allclose(arrays[line['y']], [0, 1, 0.5])
+    assert np.allclose(arrays[bars['height']], counts)
+    assert np.allclose(arrays[bars['x']], edges[:-1])
+
+    figure = plot_spec.spec_to_figure(spec, arrays)
+    ax = figure.axes[0]
+    assert ax.get_title() == "Title"
+    assert np.allclose(ax.get_lines()[0].get_ydata(), [0, 1, 0.5])
+    assert np.allclose([patch.get_height() for patch in ax.patches], counts)
+    plt.close(figure)
+
+    written = plot_spec.replot(str(spec_dir))
+    assert written == [str(tmpdir.join('png', 'test.png'))]
+    assert tmpdir.join('png', 'test.png').size() > 0
+
+
+def test_plot_spec_scatter(tmpdir):
+    figure = plt.figure("plot spec scatter test")
+    colors = plt.cm.viridis(np.linspace(0, 1, 5))
+    plt.scatter(np.arange(5), np.arange(5) ** 2, c=colors, s=np.arange(1, 6) * 10)
+    file_name = str(tmpdir.join('scatter.npz'))
+    plot_spec.save_plot_spec(figure, file_name)
+    plt.close(figure)
+
+    spec, arrays = plot_spec.load_plot_spec(file_name)
+    scatter, = spec['axes'][0]['artists']
+    assert np.allclose(arrays[scatter['colors']], colors)  # every color, not only the first
+
+    figure = plot_spec.spec_to_figure(spec, arrays)
+    assert np.allclose(figure.axes[0].collections[0].get_facecolors(), colors)
+    plt.close(figure)
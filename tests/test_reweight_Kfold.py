@@ -0,0 +1,52 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of reweight_Kfold in worker processes."""
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+
+from raredecay import meta_config
+from raredecay.tools.data_storage import HEPDataStorage
+from raredecay.analysis import ml_analysis
+
+
+def _reweight(n_cpu, labeled=True, n_reweights=2):
+    random = np.random.RandomState(42)
+    # a shuffled index, the weights of the folds have to be merged by it
+    mc = HEPDataStorage(pd.DataFrame(random.normal(size=(400, 2)), columns=['a', 'b'],
+                                     index=random.permutation(400) * 3),
+                        target=0 if labeled else None)
+    real = HEPDataStorage(pd.DataFrame(random.normal(0.3, 1.2, size=(300, 2)),
+                                       columns=['a', 'b']), target=1 if labeled else None)
+    n_cpu_max = meta_config.n_cpu_max
+    meta_config.n_cpu_max = n_cpu
+    meta_config.set_seed(7)
+    try:
+        weights = ml_analysis.reweight_Kfold(mc, real, columns=['a', 'b'], n_folds=3,
+                                             n_reweights=n_reweights, reweighter='bins',
+                                             add_weights_to_data=False)['weights']
+    finally:
+        meta_config.n_cpu_max = n_cpu_max
+    assert list(weights.index) == list(mc.index)
+    return weights
+
+
+def test_reweight_Kfold_parallel():
+    weights = _reweight(n_cpu=3)
+    assert len(weights) == 400 and np.all(np.isfinite(weights))
+    # every fold has its own seed: the same weights in every parallel run
+    assert np.allclose(weights, _reweight(n_cpu=3))
+
+
+def test_reweight_Kfold_serial_parallel():
+    # one run: the same folds, the (deterministic) bins reweighter gives the same
+    # weights in the worker processes, merged back to the rows they belong to
+    weights = _reweight(n_cpu=3, n_reweights=1)
+    assert np.allclose(weights, _reweight(n_cpu=1, n_reweights=1))
+
+
+def test_reweight_Kfold_unlabeled():
+    # storages without a target, like in the reweighting examples
+    weights = _reweight(n_cpu=3, labeled=False)
+    assert np.allclose(weights, _reweight(n_cpu=3))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of the ROOT branch cache."""
+from __future__ import division
+
+import numpy as np
+
+from raredecay.tools import root_cache
+
+n_row = 100
+reads = []
+
+
+def fake_root2array(filenames, treename, branches, selection=None):
+    reads.append(list(branches))
+    dtype = [(branch, np.float64) for branch in branches]
+    records = np.zeros(n_row, dtype=dtype)
+    for i, branch in enumerate(branches):
+        records[branch] = np.arange(n_row) * (i + 1)
+    return records
+
+
+def test_branch_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(root_cache, 'root2array', fake_root2array, raising=False)
+    del reads[:]
+    root_file = tmpdir.join('test.root')
+    root_file.write('dummy')
+    root_dict = dict(filenames=str(root_file), treename='DecayTree',
+                     branches=['one', 'two'])
+    cache = root_cache.BranchCache(max_bytes=3 * n_row * 8)
+
+    arrays = cache.get(root_dict)
+    assert list(arrays.keys()) == ['one', 'two']
+    assert not arrays['one'].flags.writeable
+    assert cache.stats()['misses'] == 2
+
+    arrays = cache.get(dict(root_dict, branches=['two', 'three']))
+    assert reads == [['one', 'two'], ['three']]
+    assert np.all(arrays['two'] == np.arange(n_row) * 2)
+    assert cache.stats()['hits'] == 1
+
+    # 'one' is the least recently used one and has to go
+    cache.get(dict(root_dict, branches='four'))
+    assert cache.stats()['evictions'] == 1
+    cache.get(dict(root_dict, branches='two'))
+    assert cache.stats()['hits'] == 2
+
+    # a different selection is a different entry
+    cache.get(dict(root_dict, branches='two', selection='one > 3'))
+    assert reads[-1] == ['two']
+    assert cache.stats()['n_bytes'] <= cache.max_bytes
+
+    cache.clear()
+    assert cache.stats()['n_entries'] == 0
+
+
+def test_n_entries_fallback(tmpdir, monkeypatch):
+    monkeypatch.setattr(root_cache, 'root2array', fake_root2array, raising=False)
+    del reads[:]
+    root_file = tmpdir.join('test.root')
+    root_file.write('dummy')
+    cache = root_cache.BranchCache()
+    root_dict = dict(filenames=str(root_file), treename='DecayTree', branches=['one', 'two'],
+                     selection='one > 3')
+    # without ROOT, the first branch is read (through the cache)
+    monkeypatch.setattr(cache, '_count_entries', lambda **kwargs: None)
+    assert cache.get_n_entries(root_dict) == n_row
+    assert cache.get_n_entries(root_dict) == n_row
+    assert reads == [['one']]
+
+
+def test_disk_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(root_cache, 'root2array', fake_root2array, raising=False)
+    del reads[:]
+    root_file = tmpdir.join('test.root')
+    root_file.write('dummy')
+    cache_dir = str(tmpdir.join('cache'))
+    root_dict = dict(filenames=str(root_file), treename='DecayTree',
+                     branches=['one', 'two'])
+
+    root_cache.BranchCache(cache_dir=cache_dir).get(root_dict)
+    assert reads == [['one', 'two']]
+
+    # a new process (cache) memory-maps the branches instead of reading the file
+    cache = root_cache.BranchCache(cache_dir=cache_dir)
+    arrays = cache.get(dict(root_dict, branches=['two', 'three']))
+    assert reads == [['one', 'two'], ['three']]
+    assert isinstance(arrays['two'], np.memmap)
+    assert np.all(arrays['two'] == np.arange(n_row) * 2)
+    assert cache.stats()['disk_hits'] == 1
+
+    # a changed file is read again
+    root_file.write('changed dummy')
+    root_cache.BranchCache(cache_dir=cache_dir).get(dict(root_dict, branches='two'))
+    assert reads[-1] == ['two']
+
+
+def test_iter_rows_read_once(tmpdir, monkeypatch):
+    from raredecay.tools.data_storage import HEPDataStorage, HEPDataStorageView
+
+    monkeypatch.setattr(root_cache, 'root2array', fake_root2array, raising=False)
+    monkeypatch.setattr(root_cache.branch_cache, '_count_entries', lambda **kwargs: None)
+    monkeypatch.setattr(root_cache.branch_cache, 'max_bytes', 0)  # nothing is kept
+    root_file = tmpdir.join('test.root')
+    root_file.write('dummy')
+    storage = HEPDataStorage(dict(filenames=str(root_file), treename='DecayTree',
+                                  branches=['one', 'two']), target=1, cache_dir=False)
+    rows = np.arange(0, n_row, 3)  # not contiguous, not read as ranges of entries
+    view = HEPDataStorageView(storage, rows=rows)
+    del reads[:]
+
+    chunks = [data for data, _t, _w in view.iter_chunks(columns='two', chunk_size=7)]
+    assert len(chunks) > 1 and reads == [['two']]  # once, not once per chunk
+    # read alone, the fake branch 'two' is the entry number
+    assert np.all(np.concatenate([chunk['two'].values for chunk in chunks]) == rows)
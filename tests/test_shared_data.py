@@ -0,0 +1,66 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""Tests of the shared data of a data-storage."""
+from __future__ import division
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from raredecay.tools.data_storage import HEPDataStorage
+
+
+def _storage(n_row=50):
+    data = pd.DataFrame(np.random.normal(size=(n_row, 3)), columns=['a', 'b', 'c'],
+                        index=np.arange(n_row) * 2)
+    weights = np.random.uniform(0.5, 1.5, size=n_row)
+    return HEPDataStorage(data, target=1, sample_weights=weights), data, weights
+
+
+def test_publish_attach(tmpdir):
+    storage, data, weights = _storage()
+    with storage.publish(columns=['a', 'c'], directory=str(tmpdir)) as shared:
+        copy = pickle.loads(pickle.dumps(shared))  # like sent to a worker
+        assert len(pickle.dumps(shared)) < 1000  # the handle, not the data
+
+        values, targets, shared_weights = copy.attach()
+        assert isinstance(values, np.memmap) and not values.flags.writeable
+        assert np.allclose(values, data[['a', 'c']].values)
+        assert np.all(targets == 1)
+        assert np.allclose(shared_weights, weights)  # not normalized
+        assert np.allclose(copy.attach(columns='c')[0][:, 0], data['c'].values)
+
+        new_storage = copy.to_storage()
+        assert np.allclose(new_storage.pandasDF().values, data[['a', 'c']].values)
+        assert list(new_storage.index) == list(data.index)
+        assert np.allclose(new_storage.get_weights(), storage.get_weights())
+
+        copy.close()  # copies do not remove the files
+        assert os.path.isdir(shared.path)
+    assert not os.path.exists(shared.path)
+
+
+def test_publish_chunks(tmpdir):
+    storage, data, weights = _storage(n_row=25)
+    shared = storage.publish(directory=str(tmpdir))
+    try:
+        from raredecay.tools import shared_data
+        chunked = shared_data.publish(storage, directory=str(tmpdir), chunk_size=7)
+        assert np.array_equal(chunked.attach()[0], shared.attach()[0])
+        chunked.close()
+    finally:
+        shared.close()
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_publish_without_target(tmpdir):
+    data = pd.DataFrame(np.random.normal(size=(30, 2)), columns=['a', 'b'])
+    storage = HEPDataStorage(data)  # no target, like unlabeled data to reweight
+    from raredecay.tools import shared_data
+    with shared_data.publish(storage, directory=str(tmpdir), chunk_size=7) as shared:
+        values, targets, weights = shared.attach()
+        assert targets is None
+        assert np.allclose(values, data.values) and np.allclose(weights, 1)
+        assert np.allclose(shared.to_storage().pandasDF().values, data.values)